@@ -6,53 +6,38 @@ import serial
 from serial.tools.list_ports import comports
 from PyQt5.QtCore import QObject, pyqtSignal, QMutex
 from struct import pack, unpack
+from collections import deque
+from itertools import islice
 from threading import Lock
 
+from protocol import COMMANDS, LENGTHS, ERROR_RESPONSE, READY_BYTE, PIPELINE_WINDOW, LinkDown, ScaleProtocol
+from telemetry import LinkTelemetry
 
-# --- Константы команд и длин ---
-COMMANDS = {
-    "read_logo2": b'\x97',
-    "write_logo2": b'\x8C',
-    "write_logo_roste": b'\x93',
-    "read_user_settings": b'\x95',
-    "write_user_settings": b'\x8A',
-    "read_factory_settings": b'\x9B',
-    "get_status": b'\x89',
-    "get_plu": b'\x81',
-    "delete_plu": b'\x8D',
-    "create_plu": b'\x82',
-    "get_message": b'\x83',
-    "create_message": b'\x84',
-    "delete_message": b'\x8E',
-    "reset_plu_totals": b'\x92',
-    "get_total_sales": b'\x85',
-    "reset_total_sales": b'\x86',
-    "bind_plu_to_key" : b'\x8B',
-    "get_plu_by_key" : b'\x96'
-
-}
-
-LENGTHS = {
-    "logo2": 512,
-    "logo_roste": 384,
-    "user_settings": 9,
-    "factory_settings": 13,
-    "current_status": 15,
-    "plu": 100,
-    "message": 400,
-    "plu_write": 83,
-    "message_write": 402,
-    "total_sales": 40,
-    "plu_code" : 4,
-}
-
-ERROR_RESPONSE = b'\xEE'
 
 # Конфигурация
 SERIAL_PORT = '/dev/ttyS1'  # Для Orange Pi
 BAUDRATE = 9600
 
-class ScaleAdmin:
+# Время жизни кэша ответов весов, секунд
+CACHE_TTL = {
+    "user_settings": 300,
+    "factory_settings": 3600,  # заводские установки меняются только сервисным инженером
+    "total_sales": 5,          # итоги растут с каждой продажей на весах
+    "logo2": 600,
+}
+
+# Таймауты ответа: время передачи по линии + задержка весов из истории измерений
+BITS_PER_BYTE = 10         # 8N1: старт + 8 бит + стоп
+POLL_TIMEOUT = 0.05        # таймаут одного чтения из порта, общий срок считает _read_response
+FIRST_LATENCY = 1.0        # задержка весов, пока по команде ещё нет измерений
+MIN_LATENCY = 0.3
+MAX_LATENCY = 2.0
+LATENCY_MARGIN = 2         # запас относительно худшей задержки в окне
+LATENCY_WINDOW = 20        # сколько последних измерений хранить по каждой команде
+BREAKER_THRESHOLD = 5      # подряд таймаутов, после которых связь считается потерянной
+BREAKER_COOLDOWN = 5.0     # сколько секунд не слать команды после обрыва (затем одна пробная)
+
+class ScaleAdmin(ScaleProtocol):
     plu_updated = pyqtSignal(dict)  # Сигнал при обновлении данных
     
     def __init__(self, port: str = "COM3", baudrate: str = "9600", ready_callback=None, admin_db = None):
@@ -61,6 +46,18 @@ class ScaleAdmin:
         self.ser = None
         self.ready_callback = self._wrap_ready_callback(ready_callback)
         self._ready_state = False
+        self._lock = Lock()               # одна транзакция на линии в каждый момент времени
+        self._rx = bytearray()            # приёмный буфер, живёт между командами
+        self._rx_chunk = bytearray(1024)  # заранее выделенный буфер для чтения из порта
+        self._resync = False              # после таймаута в порту могут остаться опоздавшие байты
+        self._key_binds = None            # кэш привязок клавиш {key_num: plu_id}, None — не прочитан
+        self._cache = {}                  # {имя: (срок годности, значение)}
+        self._cache_stats = {name: {"hits": 0, "misses": 0} for name in CACHE_TTL}
+        self._latency = {}                # {код команды: deque задержек ответа, с}
+        self._timeouts_in_row = 0
+        self._breaker_open_until = 0.0
+        self._bytes_in = 0                # всего принято из порта (для телеметрии)
+        self.telemetry = LinkTelemetry(port, sink=admin_db.save_link_metrics if admin_db else None)
         if port:
             self._connect(port, baudrate)
 
@@ -73,7 +70,7 @@ class ScaleAdmin:
                 bytesize=8,
                 parity='N',
                 stopbits=1,
-                timeout=2,        # 2 секунды на чтение
+                timeout=POLL_TIMEOUT,  # короткое чтение, срок ответа считается по команде
                 write_timeout=3   # 3 секунды на запись
             )
             self.ser.reset_input_buffer()
@@ -91,6 +88,8 @@ class ScaleAdmin:
         if self.ser and self.ser.is_open:
             self.ser.close()
             logging.info(f"Порт {self.port} закрыт")
+        self._rx.clear()
+        self.telemetry.flush()
 
     def is_ready(self) -> bool:
         return getattr(self, "_ready_state", False)
@@ -103,87 +102,227 @@ class ScaleAdmin:
         return wrapper
 
     def _wait_ready(self, timeout=2.0) -> bool:
-        start = time.time()
-        while time.time() - start < timeout:
-            byte = self.ser.read(1)
-            if not byte:
-                continue
-            if byte == b'\xEE':
-                logging.info("Ошибка выполнения команды (b'\\xEE')")
-                # Дочитываем байт готовности
-                ready = self.ser.read(1)
-                if ready == b'\x80' and self.ready_callback:
-                    self.ready_callback(True)
-                return True
-            if byte == b'\x80':
-                logging.info("Получен байт готовности от весов")
-                if self.ready_callback:
-                    self.ready_callback(True)
-                return True
-            logging.debug(f"Пропущен байт: {byte.hex()}")
-        if self.ready_callback:
-            self.ready_callback(False)
-        logging.info("Таймаут ожидания байта готовности")
-        return False
-
-    def _send_command(self, cmd: bytes, data: bytes = b'', expected_len: int = None) -> bytes:
+        """Ожидание байта готовности (или ошибки b'\\xEE' с последующим байтом готовности)"""
+        started = time.monotonic()
+        response = self._read_response(0, timeout)
+        if response is None:
+            logging.info("Таймаут ожидания байта готовности")
+            return False
+        self.telemetry.record_ready_wait(time.monotonic() - started)
+        logging.info("Получен байт готовности от весов")
+        return True
+
+    #region Приём и разбор ответов
+    def _fill_rx(self, deadline: float) -> bool:
+        """Дочитывает из порта всё доступное в приёмный буфер. False — срок ожидания истёк"""
+        if time.monotonic() >= deadline:
+            return False
+        want = min(max(self.ser.in_waiting, 1), len(self._rx_chunk))
+        chunk = memoryview(self._rx_chunk)
+        received = self.ser.readinto(chunk[:want])
+        if received:
+            self._rx += chunk[:received]
+            self._bytes_in += received
+        return True
+
+    def _count_skipped(self, count: int):
+        self.telemetry.record_skipped(count)
+
+    def _read_response(self, expected_len: int, timeout: float = 2.0):
+        """Читает ответ на команду вместе с байтом готовности. None — таймаут"""
+        deadline = time.monotonic() + timeout
+        while True:
+            response = self._parse_response(expected_len)
+            if response is not None:
+                return response
+            if not self._fill_rx(deadline):
+                self._set_ready(False)
+                return None
+
+    def _response_timeout(self, packet: bytes, expected_len: int) -> float:
+        """Срок ответа: передача пакета и ответа на текущей скорости + задержка весов по этой команде"""
+        wire = (len(packet) + expected_len + 1) * BITS_PER_BYTE / int(self.ser.baudrate)
+        history = self._latency.get(packet[:1])
+        if not history:
+            return wire + FIRST_LATENCY
+        return wire + min(max(max(history) * LATENCY_MARGIN, MIN_LATENCY), MAX_LATENCY)
+
+    def _record_latency(self, packet: bytes, expected_len: int, elapsed: float):
+        wire = (len(packet) + expected_len + 1) * BITS_PER_BYTE / int(self.ser.baudrate)
+        history = self._latency.setdefault(packet[:1], deque(maxlen=LATENCY_WINDOW))
+        history.append(max(elapsed - wire, 0.0))
+
+    @property
+    def link_down(self) -> bool:
+        """Связь считается потерянной: команды отклоняются без обращения к порту"""
+        return time.monotonic() < self._breaker_open_until
+
+    def _resync_line(self):
+        """
+        Под замком, перед первой командой окна, когда ни одна команда не ждёт ответа:
+        выбрасывает опоздавший ответ на команду с истёкшим таймаутом и байты, которые
+        не могут быть ответом на новую команду
+        """
+        if self._resync:
+            stale = self.ser.in_waiting
+            if stale:
+                self.ser.read(stale)
+                self.telemetry.record_skipped(stale)
+            self._resync = False
+        if self._rx:
+            logging.debug(f"Пропущены байты до отправки команды: {self._rx.hex()}")
+            self.telemetry.record_skipped(len(self._rx))
+            self._rx.clear()
+
+    def _settle(self, packet: bytes, expected_len: int, response, elapsed: float, received: int):
+        """Учёт завершённой команды: телеметрия, история задержек и предохранитель линии"""
+        outcome = "timeout" if response is None else "error" if response == ERROR_RESPONSE else "ok"
+        self.telemetry.record_command(packet[:1], len(packet), received, elapsed, outcome)
+        if not expected_len and response is not None:
+            # У команд без данных весь ответ — это байт готовности
+            self.telemetry.record_ready_wait(elapsed)
+        if response is None:
+            self._resync = True
+            self._timeouts_in_row += 1
+            if self._timeouts_in_row >= BREAKER_THRESHOLD:
+                # После паузы пропустим одну пробную команду; её таймаут снова разомкнёт цепь
+                self._breaker_open_until = time.monotonic() + BREAKER_COOLDOWN
+                logging.error(f"Нет ответа на {self._timeouts_in_row} команд подряд, "
+                              f"связь с весами считается потерянной на {BREAKER_COOLDOWN} с")
+        else:
+            self._timeouts_in_row = 0
+            self._record_latency(packet, expected_len, elapsed)
+
+    def _transact(self, packet: bytes, expected_len: int):
+        """Отправка пакета и приём ответа без сброса буферов порта"""
+        return self._transact_many([(packet, expected_len)])[0]
+
+    def _transact_many(self, window):
+        """
+        Конвейер пакетов [(packet, expected_len)] под одним захватом линии. Следующий
+        пакет уходит, как только разобран байт готовности предыдущего, а учёт
+        предыдущей команды идёт уже во время передачи следующей. Байты сверх
+        разобранного ответа остаются в приёмном буфере. None в ответах — таймаут;
+        после таймаута окно обрывается, ответов меньше, чем пакетов
+        """
+        responses = []
+        with self._lock:
+            sent = False
+            for i, (packet, expected_len) in enumerate(window):
+                if not sent:
+                    if self.link_down:
+                        responses.append(None)
+                        continue
+                    self._resync_line()
+                    started, received = time.monotonic(), self._bytes_in
+                    self.ser.write(packet)
+                response = self._read_response(expected_len, self._response_timeout(packet, expected_len))
+                finished, got = time.monotonic(), self._bytes_in
+                sent = response is not None and i + 1 < len(window)
+                if sent:
+                    next_started = time.monotonic()
+                    self.ser.write(window[i + 1][0])
+                self._settle(packet, expected_len, response, finished - started, got - received)
+                responses.append(response)
+                if response is None:
+                    break
+                if sent:
+                    started, received = next_started, got
+        return responses
+
+    def _exchange(self, cmd: bytes, data: bytes = b'', expected_len: int = None) -> bytes:
+        """Одна команда: данные ответа, b'' для подтверждения или ERROR_RESPONSE. Нет ответа — LinkDown"""
+        return self._answer(cmd, self._transact(cmd + data, expected_len or 0))
+
+    def _answer(self, cmd: bytes, response) -> bytes:
+        if response is None:
+            if self.link_down:
+                raise LinkDown(f"Связь с весами {self.port} потеряна, команда {cmd.hex()} не отправлена")
+            raise LinkDown(f"Нет ответа на команду {cmd.hex()}")
+        return response
+    #endregion
+
+    def _send_command(self, cmd: bytes, data: bytes = b'', expected_len: int = None, strict: bool = False) -> bytes:
+        """
+        Одиночная команда. Без ответа — b'' (команды чтения) или ERROR_RESPONSE (записи);
+        strict — вместо этого LinkDown, чтобы массовая операция прервалась
+        """
         if not self.ser.is_open:
             logging.error("Порт не открыт!")
             return b''
         try:
-            self.ser.reset_input_buffer()
             logging.info(f"Отправка команды {cmd}, данные: {data.hex()}")
-            packet = cmd + data
-            self.ser.write(packet)
-            self.ser.flush()
-            if expected_len and expected_len > 0:
-                response = self.ser.read(expected_len)
-                if response and response[0:1] == b'\xEE':
-                    logging.error("Ошибка выполнения команды (b'\\xEE')")
-                    # Дочитываем байт готовности
-                    ready = self.ser.read(1)
-                    if ready == b'\x80' and self.ready_callback:
-                        self.ready_callback(True)
-                    return b'\xEE'
-                ready = self.ser.read(1)
-                if ready == b'\x80' and self.ready_callback:
-                    self.ready_callback(True)
-                elif self.ready_callback:
-                    self.ready_callback(False)
-                return response
-            else:
-                resp = self.ser.read(1)
-                if resp == b'\xEE':
-                    logging.error("Ошибка выполнения команды (b'\\xEE')")
-                    # Дочитываем байт готовности!
-                    ready = self.ser.read(1)
-                    if ready == b'\x80' and self.ready_callback:
-                        self.ready_callback(True)
-                    return b'\xEE'
-                elif resp == b'\x80':
-                    if self.ready_callback:
-                        self.ready_callback(True)
-                    return b''
-                else:
-                    if self.ready_callback:
-                        self.ready_callback(False)
-                    logging.error(f"Неожиданный ответ: {resp.hex()}")
-                    return b'\xEE'
+            return self._exchange(cmd, data, expected_len)
+        except LinkDown as e:
+            if strict:
+                raise
+            logging.error(str(e))
+            # Для команд без данных отсутствие подтверждения — ошибка
+            return b'' if expected_len else ERROR_RESPONSE
         except Exception as e:
             logging.error(f"Ошибка: {str(e)}")
             return b''
 
-    def _check_response(self, response: bytes, expected_len: int, context: str = "") -> bool:
-        if not response or len(response) != expected_len:
-            logging.error(f"Некорректный ответ {context}: {len(response) if response else 0} байт")
-            return False
-        return True
+    #region Кэш ответов
+    def _cached(self, name: str, load, refresh: bool = False):
+        """Значение из кэша, если не истёк CACHE_TTL[name], иначе load() с весов"""
+        entry = self._cache.get(name)
+        if entry and not refresh and entry[0] > time.monotonic():
+            self._cache_stats[name]["hits"] += 1
+            # Копия, чтобы изменения у вызывающего не попадали в кэш
+            return entry[1].copy() if isinstance(entry[1], dict) else entry[1]
+        self._cache_stats[name]["misses"] += 1
+        value = load()
+        if value:  # ошибки чтения не кэшируем
+            self._cache[name] = (time.monotonic() + CACHE_TTL[name], value)
+            return value.copy() if isinstance(value, dict) else value
+        return value
+
+    def invalidate_cache(self, *names):
+        """Сбросить кэш указанных записей (без аргументов — весь кэш)"""
+        for name in names or list(self._cache):
+            self._cache.pop(name, None)
+        if not names:
+            self._key_binds = None
+
+    def get_link_stats(self) -> dict:
+        """Телеметрия линии за скользящее окно"""
+        return self.telemetry.snapshot()
+
+    def get_cache_stats(self) -> dict:
+        """Статистика попаданий в кэш по типам записей"""
+        return {name: dict(stats) for name, stats in self._cache_stats.items()}
+    #endregion
+
+    def send_pipelined(self, commands):
+        """
+        Конвейерная отправка очереди команд (cmd, data, expected_len) окнами по
+        PIPELINE_WINDOW (см. _transact_many). Между окнами линия освобождается для
+        других команд. Ответы возвращаются по порядку команд, как у _exchange;
+        на первой команде без ответа — LinkDown, следующие команды не отправляются
+        """
+        if not self.ser or not self.ser.is_open:
+            logging.error("Порт не открыт!")
+            return
+        commands = iter(commands)
+        while True:
+            window = list(islice(commands, PIPELINE_WINDOW))
+            if not window:
+                return
+            try:
+                responses = self._transact_many([(cmd + data, expected_len or 0) for cmd, data, expected_len in window])
+            except (OSError, serial.SerialException) as e:
+                raise LinkDown(f"Ошибка порта {self.port}: {str(e)}")
+            for (cmd, _, _), response in zip(window, responses):
+                yield self._answer(cmd, response)
+            if len(responses) < len(window):
+                raise LinkDown(f"Связь с весами {self.port} потеряна")
 
     # region PLU Operations
-    def get_plu_by_id(self, id: int) -> dict:
-        """Получение товара по id"""
+    def get_plu_by_id(self, id: int, strict: bool = False) -> dict:
+        """Получение товара по id. strict — LinkDown, если весы не ответили"""
         id_bytes = id.to_bytes(4, 'little')
-        response = self._send_command(cmd=COMMANDS["get_plu"], data=id_bytes, expected_len=LENGTHS['plu'])  # Отправляем команду
+        response = self._send_command(cmd=COMMANDS["get_plu"], data=id_bytes, expected_len=LENGTHS['plu'], strict=strict)
 
         if response == ERROR_RESPONSE:
             return {}
@@ -191,23 +330,20 @@ class ScaleAdmin:
         if not self._check_response(response, LENGTHS["plu"], "PLU"):
             return {}
 
-        plu = {
-            'id': int.from_bytes(response[0:4], 'little'),
-            'code': self._bytes_to_str(response[4:10]),
-            'name1': self._decode_name(response[10:38]),
-            'name2': self._decode_name(response[38:66]),
-            'price': int.from_bytes(response[66:70], 'little'),
-            'expiry': self._parse_expiry(response[70:73]),
-            'tare': int.from_bytes(response[73:75], 'little'),
-            'group_code': self._bytes_to_str(response[75:81]),
-            'message_number': int.from_bytes(response[81:83], 'little'),
-            'last_reset': self.bcd_to_datetime(response[83:89]),
-            'total_sum': int.from_bytes(response[89:93], 'little'),
-            'total_weight': int.from_bytes(response[93:97], 'little'),
-            'sales_count': int.from_bytes(response[97:100], 'little'),
-        }
-
-        return plu
+        return self._decode_plu(response)
+
+    def get_plu_many(self, ids):
+        """
+        Конвейерное чтение товаров. Возвращает пары (id, plu), пустой dict — записи нет.
+        Весы перестали отвечать — LinkDown
+        """
+        ids = list(ids)
+        commands = ((COMMANDS["get_plu"], plu_id.to_bytes(4, 'little'), LENGTHS['plu']) for plu_id in ids)
+        for plu_id, response in zip(ids, self.send_pipelined(commands)):
+            if response == ERROR_RESPONSE or not self._check_response(response, LENGTHS["plu"], "PLU"):
+                yield plu_id, {}
+            else:
+                yield plu_id, self._decode_plu(response)
     
     def delete_plu_by_id(self, id: int) -> bool:
         """Удаление товара по id"""
@@ -215,187 +351,48 @@ class ScaleAdmin:
         response = self._send_command(cmd=COMMANDS["delete_plu"], data=id_bytes, expected_len=0)
         return response != ERROR_RESPONSE
     
-    def create_plu(self, data: dict) -> bool:
-        plu_bytes = self._encode_plu(data)
-        response = self._send_command(cmd=COMMANDS["create_plu"], data=plu_bytes, expected_len=0)
+    def create_plu(self, data: dict, strict: bool = False) -> bool:
+        """Запись товара. strict — LinkDown, если весы не ответили"""
+        plu_bytes = self._plu_record(data)
+        response = self._send_command(cmd=COMMANDS["create_plu"], data=plu_bytes, expected_len=0, strict=strict)
         return response != ERROR_RESPONSE
 
+    def create_plu_many(self, plu_items):
+        """
+        Конвейерная запись товаров. Возвращает пары (plu, ok) по мере подтверждения весами;
+        весы перестали отвечать — LinkDown (ответ по оставшимся товарам неизвестен)
+        """
+        plu_items = iter(plu_items)
+        while True:
+            batch = list(islice(plu_items, PIPELINE_WINDOW))
+            if not batch:
+                return
+            records = []
+            for plu in batch:
+                try:
+                    records.append(self._plu_record(plu))
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    logging.error(f"Ошибка кодирования PLU {plu.get('id')}: {str(e)}")
+                    records.append(None)
+            responses = self.send_pipelined([(COMMANDS["create_plu"], record, 0) for record in records if record])
+            for plu, record in zip(batch, records):
+                yield plu, record is not None and next(responses, ERROR_RESPONSE) != ERROR_RESPONSE
+
     def reset_plu_totals(self, plu_id: int) -> bool:
         """Обнуляет итоговые данные по PLU с заданным id"""
         data = plu_id.to_bytes(4, 'little')
         response = self._send_command(cmd=COMMANDS['reset_plu_totals'], data=data, expected_len=0)
+        self.invalidate_cache("total_sales")
         return response != ERROR_RESPONSE
 
-    def _encode_plu(self, data: dict) -> bytes:
-        """Кодирование данных товара согласно протоколу"""
-        expire_type = data.get('expiry_type')
-        expiry = data.get('expiry_value')
-        if expire_type == 0:
-            day, month, year = map(int, expiry.split('.'))
-            expiry_bytes = bytes([
-                ScaleAdmin._to_bcd(day),
-                ScaleAdmin._to_bcd(month),
-                ScaleAdmin._to_bcd(year)
-            ])
-        elif expire_type == 1:
-            days = int(expiry)
-            expiry_bytes = bytes([
-                0x00,
-                ScaleAdmin._to_bcd(days // 100),
-                ScaleAdmin._to_bcd(days % 100)
-            ])
-        else:
-            raise ValueError(f"expire_type должен быть 0 (дата) или 1 (дни) expiry_type={expire_type}, expiry_value={expiry}")
-
-        parts = [
-            # PLU Number (4 bytes)
-            data['id'].to_bytes(4, 'little'),
-            
-            # Item Code (6 bytes)
-            self._str_to_bytes(data['code']),
-            
-            # Название с логотипом
-            self._encode_name(data['name1'], data['logo_type'], data.get('cert_code', ''), 0),
-            self._encode_name(data['name2'], data['logo_type'], data.get('cert_code', ''), 1),
-            
-            # Цена (4 bytes)
-            int(data['price']).to_bytes(4, 'little'),  # data['price'] в копейках!
-            
-            # Срок годности (3 bytes)
-            expiry_bytes,
-            
-            # Тара (2 bytes)
-            data['tare'].to_bytes(2, 'little'),
-            
-            # Групповой код (6 bytes)
-            self._str_to_bytes(data['group_code']),
-            
-            # Номер сообщения (2 bytes)
-            data['message_number'].to_bytes(2, 'little'),
-        ]
-        
-        # Проверяем типы
-        for i, part in enumerate(parts):
-            if not isinstance(part, bytes):
-                raise TypeError(f"Part {i} is {type(part)}, expected bytes")
-        
-        # Собираем итоговые данные
-        plu_bytes = b''.join(parts)
-
-        if not self._check_response(plu_bytes, LENGTHS["plu_write"], "PLU Write"):
-            raise ValueError("Invalid PLU length")
-        
-        return plu_bytes
-
-    def _encode_name(self, text: str, logo_type: int, cert_code: str, line: int) -> bytes:
-        """Кодирует название с логотипом"""
-        # Обрезаем строку до 24 символов, если есть логотип
-        max_len = 24 if logo_type else 28
-        encoded = text.encode('cp1251', errors='replace')[:max_len]
-        
-        # Дополняем нулями до нужной длины
-        padded = encoded.ljust(max_len, b'\x00')
-        
-        # Добавляем логотип (если требуется)
-        if logo_type:
-            cert_bytes = self._encode_cert_code(cert_code, line, logo_type)
-            return padded + cert_bytes
-        return padded
-
-    def _str_to_bytes(self, s: str) -> bytes:
-        """Преобразует строку из 6 цифр в 6 байт (каждая цифра — отдельный байт)"""
-        s = s.zfill(6)[:6]
-        return bytes(int(ch) for ch in s)
-
-    def _bytes_to_str(self, b: bytes) -> str:
-        return ''.join(str(byte) for byte in b[:6])
-
-    # def _bytes_to_str(self, b: bytes) -> str:
-    #     """Преобразует 6 байт (каждая цифра — отдельный байт) в строку"""
-    #     return b[:6].decode('ascii', errors='ignore')
-    #     #return ''.join(str(byte) for byte in b[:6])
-
-    def _encode_cert_code(self, cert_code: str, line: int, logo_type: int) -> bytes:
-        """Кодирует сертификационный код для логотипа"""
-        code = cert_code.ljust(4, '\x00')
-        return bytes([
-            0,  # Индикатор логотипа
-            logo_type,
-            ord(code[3 - line]) if len(code) > (3 - line) else 0,
-            ord(code[1 + line]) if len(code) > (1 + line) else 0
-        ])
-    
-    def _decode_name(self, name_bytes: bytes) -> str:
-        """Декодирует название товара с учетом логотипа"""
-        # Определяем длину названия
-        if name_bytes[24] == 0:  # Есть логотип
-            raw_name = name_bytes[:24]
-        else:
-            raw_name = name_bytes[:28]
-        
-        # Удаляем нулевые байты и декодируем
-        return raw_name.split(b'\x00')[0].decode('cp1251', errors='ignore')
-
-    def _parse_logo(self, line1: bytes, line2: bytes) -> dict:
-        """Извлекает данные логотипа"""
-        logo = {}
-        if line1[24] == 0 and line2[24] == 0:
-            logo = {
-                'type': line1[25],
-                'cert_code': bytes([line2[26], line1[26], line2[27], line1[27]]).decode('ascii')
-            }
-        return logo
-
-    def _parse_expiry(self, data: bytes):
-        """
-        Разбирает срок годности из 3 байт BCD:
-        - Если data[0] == 0, то это количество дней (data[1]: сотни, data[2]: десятки и единицы)
-        - Иначе это дата: день (data[0]), месяц (data[1]), год (data[2]), все в BCD
-        """
-        if len(data) != 3:
-            return None
-
-        def bcd_to_int(b):
-            return ((b >> 4) * 10) + (b & 0x0F)
-
-        if data[0] == 0:
-            # Количество дней (BCD)
-            hundreds = bcd_to_int(data[1])
-            tens_units = bcd_to_int(data[2])
-            days = hundreds * 100 + tens_units
-            return f"{days}"
-        else:
-            # Дата (BCD)
-            day = bcd_to_int(data[0])
-            month = bcd_to_int(data[1])
-            year = bcd_to_int(data[2])
-            return f"{day:02d}.{month:02d}.{year:02d}"
-
-    @staticmethod
-    def _to_bcd(val):
-        return ((val // 10) << 4) | (val % 10)
-
-    def bcd_to_datetime(self, bcd_data):
-        """Конвертирует 6-байтовый BCD-формат в datetime"""
-        if len(bcd_data) != 6:
-            return None
-            
-        second = (bcd_data[0] >> 4) * 10 + (bcd_data[0] & 0x0F)
-        minute = (bcd_data[1] >> 4) * 10 + (bcd_data[1] & 0x0F)
-        hour = (bcd_data[2] >> 4) * 10 + (bcd_data[2] & 0x0F)
-        day = (bcd_data[3] >> 4) * 10 + (bcd_data[3] & 0x0F)
-        month = (bcd_data[4] >> 4) * 10 + (bcd_data[4] & 0x0F)
-        year = (bcd_data[5] >> 4) * 10 + (bcd_data[5] & 0x0F) + 2000  # Предполагаем 2000+ года
-        
-        try:
-            return datetime(year, month, day, hour, minute, second)
-        except ValueError:
-            return None
     # endregion
 
     #region Общие продажи
-    def get_total_sales(self) -> dict:
+    def get_total_sales(self, refresh: bool = False) -> dict:
         """Получить общие итоги продаж с весов"""
+        return self._cached("total_sales", self._read_total_sales, refresh)
+
+    def _read_total_sales(self) -> dict:
         response = self._send_command(cmd=COMMANDS['get_total_sales'], expected_len=LENGTHS['total_sales'])
         if response == ERROR_RESPONSE:
             return {}
@@ -403,22 +400,12 @@ class ScaleAdmin:
         if not self._check_response(response, LENGTHS['total_sales'], 'Total sales read'):
             return {}
     
-        return {
-            'mileage': int.from_bytes(response[0:4], 'little'),
-            'label_count': int.from_bytes(response[4:8], 'little'),
-            'total_sum': int.from_bytes(response[8:12], 'little'),
-            'sales_count': int.from_bytes(response[12:15], 'little'),
-            'total_weight': int.from_bytes(response[15:19], 'little'),
-            'plu_sum': int.from_bytes(response[19:23], 'little'),
-            'plu_sales_count': int.from_bytes(response[23:26], 'little'),
-            'plu_weight': int.from_bytes(response[26:30], 'little'),
-            'free_plu': int.from_bytes(response[36:38], 'little'),
-            'free_msg': int.from_bytes(response[38:40], 'little'),
-        }
+        return self._decode_total_sales(response)
 
     def reset_total_sales(self) -> bool:
         """Сбросить общие итоги продаж на весах"""
         response = self._send_command(cmd=COMMANDS['reset_total_sales'], expected_len=0)
+        self.invalidate_cache("total_sales")
         return response != ERROR_RESPONSE
     # endregion
 
@@ -433,11 +420,7 @@ class ScaleAdmin:
         if not self._check_response(response, LENGTHS['message'], "Message read"):
             return {}
 
-        msg = {
-            'id': id,
-            'content': response.rstrip(b'\x00').decode('cp1251', errors='ignore')
-        }
-        return msg
+        return self._decode_message(id, response)
      
     def create_message(self, data: dict) -> bool:
         """Создание нового сообщения"""
@@ -445,21 +428,6 @@ class ScaleAdmin:
         response = self._send_command(cmd=COMMANDS['create_message'], data=msg_bytes, expected_len=0)
         return response != ERROR_RESPONSE
     
-    def _encode_message(self, data: dict) -> bytes:
-        """Кодирует сообщение в байтовый формат"""
-        # Преобразуем текст в байты с кодировкой cp1251
-        text_bytes = data['content'].encode('cp1251', errors='replace')
-        # Дополняем нулями до 400 байт
-        padded_text = text_bytes.ljust(400, b'\x00')
-        
-        # Собираем итоговые данные
-        msg_bytes = data['id'].to_bytes(2, 'little') + padded_text
-        
-        if not self._check_response(msg_bytes, LENGTHS["message_write"], "Message Write"):
-            raise ValueError("Invalid message length")
-        
-        return msg_bytes
-    
     def delete_message_by_id(self, id: int) -> bool:
         """Удаление сообщения по id"""
         id_bytes = id.to_bytes(2, 'little')
@@ -467,24 +435,6 @@ class ScaleAdmin:
         return response != ERROR_RESPONSE
     # endregion
 
-    # --- BCD кодирование и декодирование ---
-    @staticmethod
-    def int_to_bcd_bytes(value: int, length: int) -> bytes:
-        """Преобразует целое число в BCD-байты заданной длины"""
-        bcd = []
-        for _ in range(length):
-            bcd.insert(0, ((value % 10) & 0x0F) | (((value // 10 % 10) << 4) & 0xF0))
-            value //= 100
-        return bytes(bcd)
-
-    @staticmethod
-    def bcd_bytes_to_int(bcd: bytes) -> int:
-        """Преобразует BCD-байты в целое число"""
-        value = 0
-        for b in bcd:
-            value = value * 100 + ((b >> 4) & 0x0F) * 10 + (b & 0x0F)
-        return value
-
     #region Настройки пользователя
     def _read_user_settings(self) -> bytes:
         """Чтение настроек пользователя (9 байт, команда 0x95)"""
@@ -502,31 +452,19 @@ class ScaleAdmin:
         response = self._send_command(cmd=COMMANDS['write_user_settings'], data=data, expected_len=0)
         return response != ERROR_RESPONSE
 
-    def get_user_settings(self) -> dict:
+    def get_user_settings(self, refresh: bool = False) -> dict:
         """Чтение настроек пользователя"""
-        data = self._read_user_settings()
-        if data:
-            return {
-                "dept_no": self.bcd_bytes_to_int(data[0:3]),
-                "label_format": data[3],
-                "barcode_format": data[4],
-                "adjst": data[5],
-                "print_features": data[6],
-                "auto_print_weight": int.from_bytes(data[7:9], "little")
-            }
-        
-        return {}
+        def load():
+            data = self._read_user_settings()
+            return self._decode_user_settings(data) if data else {}
+        return self._cached("user_settings", load, refresh)
 
     def set_user_settings(self, settings: dict) -> bool:
         """Запись настроек пользователя из dict"""
-        dept_bcd = self.int_to_bcd_bytes(settings["dept_no"], 3)
-        label = settings["label_format"].to_bytes(1, "little")
-        barcode = settings["barcode_format"].to_bytes(1, "little")
-        adjst = settings["adjst"].to_bytes(1, "little")
-        features = settings["print_features"].to_bytes(1, "little")
-        auto_weight = settings["auto_print_weight"].to_bytes(2, "little")
-        data = dept_bcd + label + barcode + adjst + features + auto_weight
-        return self._write_user_settings(data)
+        data = self._encode_user_settings(settings)
+        ok = self._write_user_settings(data)
+        self.invalidate_cache("user_settings")
+        return ok
     #endregion
 
     #region Заводские установки
@@ -541,24 +479,12 @@ class ScaleAdmin:
 
         return response
 
-    def get_factory_settings(self) -> dict:
+    def get_factory_settings(self, refresh: bool = False) -> dict:
         """Чтение заводских установок, возвращает dict"""
-        data = self._read_factory_settings()  # читает 13 байт
-        if data:
-            return {
-                "max_weight": int.from_bytes(data[0:2], "little"),
-                "dec_point_weight": data[2],
-                "dec_point_price": data[3],
-                "dec_point_sum": data[4],
-                "dual_range": data[5],
-                "weight_step_upper": data[6],
-                "weight_step_lower": data[7],
-                "price_weight": int.from_bytes(data[8:10], "little"),
-                "round_sum": data[10],
-                "tare_limit": int.from_bytes(data[11:13], "little"),
-            }
-        
-        return {}
+        def load():
+            data = self._read_factory_settings()  # читает 13 байт
+            return self._decode_factory_settings(data) if data else {}
+        return self._cached("factory_settings", load, refresh)
     #endregion
 
     #region Текущее состояние весов
@@ -579,33 +505,15 @@ class ScaleAdmin:
         if not data:
             return {}
         
-        status = data[0]
-        abs_weight = int.from_bytes(data[1:3], "little")
-        if status & 0b10000000:
-            weight = -abs_weight
-        else:
-            weight = abs_weight
-
-        return {
-            "status_byte": status,
-            "weight": weight,
-            "price": int.from_bytes(data[3:7], "little"),
-            "sum": int.from_bytes(data[7:11], "little"),
-            "plu_number": int.from_bytes(data[11:15], "little"),
-            "bits": {
-                "overload": bool(status & 0b00000001),
-                "tare_mode": bool(status & 0b00000100),
-                "zero_weight": bool(status & 0b00001000),
-                "dual_range": bool(status & 0b00100000),
-                "stable_weight": bool(status & 0b01000000),
-                "minus_sign": bool(status & 0b10000000),
-            }
-        }
+        return self._decode_current_status(data)
     #endregion
 
     #region Логотипы
-    def read_logo2(self) -> bytes:
+    def read_logo2(self, refresh: bool = False) -> bytes:
         """Чтение логотипа LOGO 2"""
+        return self._cached("logo2", self._read_logo2, refresh)
+
+    def _read_logo2(self) -> bytes:
         response = self._send_command(cmd=COMMANDS["read_logo2"], expected_len=LENGTHS['logo2'])
         if response == ERROR_RESPONSE:
             return b''
@@ -613,6 +521,7 @@ class ScaleAdmin:
         if not self._check_response(response, LENGTHS['logo2'], 'LOGO2 read'):
             return b''
 
+        self._mark_logo("logo2", response, True, verified=True)
         return response
 
     def write_logo2(self, data: bytes) -> bool:
@@ -621,7 +530,8 @@ class ScaleAdmin:
             logging.error(f"Длина данных логотипа LOGO 2 должна быть {LENGTHS['logo2']} байт")
             return False
         response = self._send_command(cmd=COMMANDS["write_logo2"], data=data, expected_len=0)
-        return response != ERROR_RESPONSE
+        self.invalidate_cache("logo2")
+        return self._mark_logo("logo2", data, response != ERROR_RESPONSE)
 
     def write_logo_roste(self, data: bytes) -> bool:
         """Запись логотипа Ростест"""
@@ -629,23 +539,53 @@ class ScaleAdmin:
             logging.error(f"Длина данных логотипа Ростест должна быть {LENGTHS['logo_roste']} байт")
             return False
         response = self._send_command(cmd=COMMANDS["write_logo_roste"], data=data, expected_len=0)
-        return response != ERROR_RESPONSE
+        return self._mark_logo("logo_roste", data, response != ERROR_RESPONSE)
+
+    def _mark_logo(self, kind: str, data: bytes, ok: bool, verified: bool = False) -> bool:
+        """
+        Отметка о логотипе на весах (scale_logos), по которой logo_store пропускает
+        повторную запись. После ошибки записи содержимое весов неизвестно — отметка снимается
+        """
+        if self.db:
+            try:
+                if ok:
+                    self.db.set_scale_logo(self.port, kind, bytes(data), verified=verified)
+                else:
+                    self.db.forget_scale_logo(self.port, kind)
+            except Exception as e:
+                logging.error(f"Ошибка сохранения отметки логотипа {kind}: {str(e)}")
+        return ok
     #endregion
 
     #region Клавиши цен
-    def get_all_key_binds(self):
-        """Вернуть список всех привязок клавиш к PLU"""
-        binds = []
-        for key_num in range(1, 55):  # 1-54
-            plu_id = self.get_plu_by_key(key_num)
-            if plu_id:
-                binds.append({"key_num": key_num, "plu_id": plu_id})
-        return binds
+    def get_all_key_binds(self, refresh: bool = False):
+        """
+        Вернуть список всех привязок клавиш к PLU. Таблица читается с весов
+        одним конвейерным проходом и кэшируется до следующей привязки
+        (или до явного refresh=True)
+        """
+        if self._key_binds is None or refresh:
+            keys = range(1, 55)  # 1-54
+            commands = [(COMMANDS["get_plu_by_key"], key_num.to_bytes(1, 'little'), LENGTHS['plu_code'])
+                        for key_num in keys]
+            key_binds = {}
+            try:
+                for key_num, response in zip(keys, self.send_pipelined(commands)):
+                    if not response or response == ERROR_RESPONSE:
+                        # Неполная таблица не кэшируется
+                        return [{"key_num": k, "plu_id": p} for k, p in key_binds.items() if p]
+                    key_binds[key_num] = int.from_bytes(response, 'little')
+            except LinkDown as e:
+                logging.error(str(e))
+                return [{"key_num": k, "plu_id": p} for k, p in key_binds.items() if p]
+            self._key_binds = key_binds
+        return [{"key_num": k, "plu_id": p} for k, p in self._key_binds.items() if p]
 
     def bind_plu_to_key(self, key_num: int, plu_id: int) -> bool:
         """Привязать PLU к клавише цены"""
         data = plu_id.to_bytes(4, 'little') + key_num.to_bytes(1, 'little')
         response = self._send_command(cmd=COMMANDS['bind_plu_to_key'], data=data, expected_len=0)
+        self._key_binds = None
         return response != ERROR_RESPONSE
 
     def get_plu_by_key(self, key_num: int) -> int:
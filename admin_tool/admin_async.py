@@ -0,0 +1,304 @@
+# admin_async.py
+import asyncio
+import logging
+
+from protocol import COMMANDS, LENGTHS, ERROR_RESPONSE, PLU_MAX, LinkDown, ScaleProtocol
+
+try:
+    import serial_asyncio
+except ImportError:  # без pyserial-asyncio доступно только TCP-подключение
+    serial_asyncio = None
+
+
+class AsyncScaleAdmin(ScaleProtocol):
+    """
+    Асинхронный клиент весов. Те же операции, что и у ScaleAdmin, но поверх
+    asyncio-потоков (COM-порт через pyserial-asyncio или TCP), без потока на
+    каждое подключение. Команды на одной линии выполняются строго по очереди.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 port: str = "", ready_callback=None, timeout: float = 2.0):
+        self.port = port
+        self.timeout = timeout
+        self._reader = reader
+        self._writer = writer
+        self._ready_state = False
+        self._user_ready_callback = ready_callback
+        self._lock = asyncio.Lock()
+        self._rx = bytearray()
+        self._resync = False
+        self._key_binds = None  # кэш привязок клавиш {key_num: plu_id}
+
+    #region Подключение
+    @classmethod
+    async def open_serial(cls, port: str, baudrate: int = 9600, **kwargs) -> "AsyncScaleAdmin":
+        """Подключение к весам через COM-порт"""
+        if serial_asyncio is None:
+            raise RuntimeError("Для работы с COM-портом нужен пакет pyserial-asyncio")
+        logging.info(f"Подключение к {port} на {baudrate}")
+        reader, writer = await serial_asyncio.open_serial_connection(
+            url=port, baudrate=int(baudrate), bytesize=8, parity='N', stopbits=1
+        )
+        admin = cls(reader, writer, port=port, **kwargs)
+        await admin._handshake()
+        return admin
+
+    @classmethod
+    async def open_tcp(cls, host: str, port: int, **kwargs) -> "AsyncScaleAdmin":
+        """Подключение к весам через TCP (преобразователь RS-232/Ethernet)"""
+        logging.info(f"Подключение к {host}:{port}")
+        reader, writer = await asyncio.open_connection(host, port)
+        admin = cls(reader, writer, port=f"{host}:{port}", **kwargs)
+        await admin._handshake()
+        return admin
+
+    async def _handshake(self):
+        """Отправляем b'\\x00', чтобы получить байт готовности"""
+        response = await self._transact(b'\x00', 0, self.timeout)
+        if response is None:
+            logging.info("Таймаут ожидания байта готовности")
+        else:
+            logging.info("Получен байт готовности от весов")
+
+    async def close(self):
+        if not self._writer.is_closing():
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            logging.info(f"Порт {self.port} закрыт")
+        self._rx.clear()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def is_ready(self) -> bool:
+        return self._ready_state
+
+    def ready_callback(self, state: bool):
+        self._ready_state = state
+        if self._user_ready_callback:
+            self._user_ready_callback(state)
+    #endregion
+
+    #region Приём и разбор ответов
+    async def _read_response(self, expected_len: int):
+        """Читает ответ на команду вместе с байтом готовности"""
+        while True:
+            response = self._parse_response(expected_len)
+            if response is not None:
+                return response
+            chunk = await self._reader.read(1024)
+            if not chunk:
+                raise ConnectionError("Соединение с весами закрыто")
+            self._rx += chunk
+
+    async def _drain_stale(self, quiet: float = 0.25):
+        """Выбрасывает опоздавший ответ: читаем, пока линия не замолчит"""
+        while True:
+            try:
+                chunk = await asyncio.wait_for(self._reader.read(1024), quiet)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+        self._resync = False
+
+    async def _transact(self, packet: bytes, expected_len: int, timeout: float):
+        """Отправка пакета и приём ответа. None — таймаут"""
+        async with self._lock:
+            if self._resync:
+                await self._drain_stale()
+            if self._rx:
+                logging.debug(f"Пропущены байты до отправки команды: {self._rx.hex()}")
+                self._rx.clear()
+            try:
+                self._writer.write(packet)
+                await self._writer.drain()
+                return await asyncio.wait_for(self._read_response(expected_len), timeout)
+            except asyncio.TimeoutError:
+                self._resync = True
+                self._set_ready(False)
+                return None
+            except asyncio.CancelledError:
+                # Ответ на отменённую команду ещё может прийти — выбросим его перед следующей
+                self._resync = True
+                raise
+
+    async def _send_command(self, cmd: bytes, data: bytes = b'', expected_len: int = None,
+                            timeout: float = None, strict: bool = False) -> bytes:
+        """Без ответа — b'' или ERROR_RESPONSE, как у ScaleAdmin; strict — LinkDown"""
+        if self._writer.is_closing():
+            if strict:
+                raise LinkDown(f"Порт {self.port} закрыт")
+            logging.error("Порт не открыт!")
+            return b''
+        try:
+            logging.info(f"Отправка команды {cmd}, данные: {data.hex()}")
+            response = await self._transact(cmd + data, expected_len or 0, timeout or self.timeout)
+        except (OSError, ConnectionError) as e:
+            # После ошибки порта поток непригоден: закрываем его, брокер откроет порт заново
+            self._writer.close()
+            if strict:
+                raise LinkDown(f"Ошибка порта {self.port}: {str(e)}")
+            logging.error(f"Ошибка: {str(e)}")
+            return b''
+        if response is None:
+            if strict:
+                raise LinkDown(f"Нет ответа на команду {cmd.hex()}")
+            logging.error(f"Нет ответа на команду {cmd.hex()}")
+            # Для команд без данных отсутствие подтверждения — ошибка
+            return b'' if expected_len else ERROR_RESPONSE
+        return response
+
+    async def _read(self, name: str, length_key: str, data: bytes = b'', context: str = "",
+                    strict: bool = False) -> bytes:
+        """Команда чтения: данные ответа или b'' при ошибке"""
+        response = await self._send_command(COMMANDS[name], data, expected_len=LENGTHS[length_key], strict=strict)
+        if response == ERROR_RESPONSE:
+            return b''
+        if not self._check_response(response, LENGTHS[length_key], context):
+            return b''
+        return response
+
+    async def _write(self, name: str, data: bytes = b'', strict: bool = False) -> bool:
+        """Команда записи: True, если весы подтвердили выполнение"""
+        response = await self._send_command(COMMANDS[name], data, expected_len=0, strict=strict)
+        return response != ERROR_RESPONSE
+    #endregion
+
+    # region PLU Operations
+    async def get_plu_by_id(self, id: int, strict: bool = False) -> dict:
+        """Получение товара по id. strict — LinkDown, если весы не ответили"""
+        response = await self._read("get_plu", "plu", id.to_bytes(4, 'little'), "PLU", strict)
+        return self._decode_plu(response) if response else {}
+
+    async def get_plu_many(self, ids):
+        """Чтение товаров по списку номеров. Отдаёт пары (id, plu), пустой dict — записи нет"""
+        for plu_id in ids:
+            yield plu_id, await self.get_plu_by_id(plu_id, strict=True)
+
+    async def dump_plu(self, start: int = 1, end: int = PLU_MAX, skip_ranges=(), stop=None):
+        """Асинхронный вариант ScaleProtocol.dump_plu"""
+        ids = [plu_id for plu_id in range(start, end + 1)
+               if not any(first <= plu_id <= last for first, last in skip_ranges)]
+        done = 0
+        async for plu_id, plu in self.get_plu_many(ids):
+            done += 1
+            yield {"id": plu_id, "plu": plu or None, "done": done, "total": len(ids)}
+            if stop and stop():
+                return
+
+    async def delete_plu_by_id(self, id: int) -> bool:
+        """Удаление товара по id"""
+        return await self._write("delete_plu", id.to_bytes(4, 'little'))
+
+    async def create_plu(self, data: dict, strict: bool = False) -> bool:
+        """Запись товара. strict — LinkDown, если весы не ответили"""
+        return await self._write("create_plu", self._plu_record(data), strict)
+
+    async def reset_plu_totals(self, plu_id: int) -> bool:
+        """Обнуляет итоговые данные по PLU с заданным id"""
+        return await self._write("reset_plu_totals", plu_id.to_bytes(4, 'little'))
+    # endregion
+
+    #region Общие продажи
+    async def get_total_sales(self) -> dict:
+        """Получить общие итоги продаж с весов"""
+        response = await self._read("get_total_sales", "total_sales", context="Total sales read")
+        return self._decode_total_sales(response) if response else {}
+
+    async def reset_total_sales(self) -> bool:
+        """Сбросить общие итоги продаж на весах"""
+        return await self._write("reset_total_sales")
+    # endregion
+
+    # region Message Operations
+    async def get_message_by_id(self, id: int) -> dict:
+        """Получение сообщения по id"""
+        response = await self._read("get_message", "message", id.to_bytes(2, 'little'), "Message read")
+        return self._decode_message(id, response) if response else {}
+
+    async def create_message(self, data: dict) -> bool:
+        """Создание нового сообщения"""
+        return await self._write("create_message", self._encode_message(data))
+
+    async def delete_message_by_id(self, id: int) -> bool:
+        """Удаление сообщения по id"""
+        return await self._write("delete_message", id.to_bytes(2, 'little'))
+    # endregion
+
+    #region Настройки
+    async def get_user_settings(self) -> dict:
+        """Чтение настроек пользователя"""
+        data = await self._read("read_user_settings", "user_settings", context="User settings read")
+        return self._decode_user_settings(data) if data else {}
+
+    async def set_user_settings(self, settings: dict) -> bool:
+        """Запись настроек пользователя из dict"""
+        return await self._write("write_user_settings", self._encode_user_settings(settings))
+
+    async def get_factory_settings(self) -> dict:
+        """Чтение заводских установок, возвращает dict"""
+        data = await self._read("read_factory_settings", "factory_settings", context="Factory settings read")
+        return self._decode_factory_settings(data) if data else {}
+
+    async def get_current_status(self) -> dict:
+        """Чтение текущего состояния весов, возвращает dict"""
+        data = await self._read("get_status", "current_status", context="Current status read")
+        return self._decode_current_status(data) if data else {}
+    #endregion
+
+    #region Логотипы
+    async def read_logo2(self, refresh: bool = False) -> bytes:
+        """Чтение логотипа LOGO 2 (кэша нет, refresh — для совместимости с ScaleAdmin)"""
+        return await self._read("read_logo2", "logo2", context="LOGO2 read")
+
+    async def write_logo2(self, data: bytes) -> bool:
+        """Запись логотипа LOGO 2"""
+        if len(data) != LENGTHS["logo2"]:
+            logging.error(f"Длина данных логотипа LOGO 2 должна быть {LENGTHS['logo2']} байт")
+            return False
+        return await self._write("write_logo2", data)
+
+    async def write_logo_roste(self, data: bytes) -> bool:
+        """Запись логотипа Ростест"""
+        if len(data) != LENGTHS["logo_roste"]:
+            logging.error(f"Длина данных логотипа Ростест должна быть {LENGTHS['logo_roste']} байт")
+            return False
+        return await self._write("write_logo_roste", data)
+    #endregion
+
+    #region Клавиши цен
+    async def get_all_key_binds(self, refresh: bool = False):
+        """Вернуть список всех привязок клавиш к PLU (кэшируется до следующей привязки)"""
+        if self._key_binds is None or refresh:
+            key_binds = {}
+            for key_num in range(1, 55):  # 1-54
+                plu_id = await self.get_plu_by_key(key_num)
+                if plu_id is None:
+                    # Неполная таблица не кэшируется
+                    return [{"key_num": k, "plu_id": p} for k, p in key_binds.items() if p]
+                key_binds[key_num] = plu_id
+            self._key_binds = key_binds
+        return [{"key_num": k, "plu_id": p} for k, p in self._key_binds.items() if p]
+
+    async def bind_plu_to_key(self, key_num: int, plu_id: int) -> bool:
+        """Привязать PLU к клавише цены"""
+        ok = await self._write("bind_plu_to_key", plu_id.to_bytes(4, 'little') + key_num.to_bytes(1, 'little'))
+        self._key_binds = None
+        return ok
+
+    async def get_plu_by_key(self, key_num: int) -> int:
+        """Получить PLU, назначенный на клавишу цены"""
+        response = await self._send_command(COMMANDS["get_plu_by_key"], key_num.to_bytes(1, 'little'),
+                                            expected_len=LENGTHS['plu_code'])
+        if not response or response == ERROR_RESPONSE:
+            return None
+        return int.from_bytes(response, 'little')
+    #endregion
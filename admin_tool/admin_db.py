@@ -1,10 +1,102 @@
 # database.py
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import sqlite3
 from contextlib import contextmanager
 import logging
 import hashlib
+import json
+import re
+import time
+
+from bcd import datetime_to_bcd
+from protocol import MESSAGE_NUMBER_MAX, PLU_MAX, PLU_NAME_LEN, PLU_NAME_LEN_LOGO, ScaleProtocol
+from telemetry import merge_buckets, new_bucket
+
+# Правила проверки каталога PLU перед синхронизацией: (текст ошибки, SQL-условие ошибки).
+# Каждое условие вычисляется сразу по всей таблице, NULL считается ошибкой. Пределы взяты из
+# тех же констант protocol, что у кодировщика: прошедший проверку товар кодируется без потерь.
+PLU_EMPTY_RULE = "Пустая запись (товар удалён)"
+PLU_VALIDATION_RULES = [
+    (PLU_EMPTY_RULE, "code IS NULL AND name1 IS NULL AND price IS NULL"),
+    (f"Номер PLU вне диапазона 1-{PLU_MAX}", f"id NOT BETWEEN 1 AND {PLU_MAX}"),
+    ("Код товара должен содержать 6 цифр", "code NOT GLOB '[0-9][0-9][0-9][0-9][0-9][0-9]'"),
+    ("Не заполнено название (строка 1)", "name1 IS NULL OR name1 = ''"),
+    ("Не заполнено название (строка 2)", "name2 IS NULL"),
+    (f"Название длиннее {PLU_NAME_LEN} символов", f"length(name1) > {PLU_NAME_LEN} OR length(name2) > {PLU_NAME_LEN}"),
+    (f"Название с логотипом длиннее {PLU_NAME_LEN_LOGO} символов",
+     f"logo_type != 0 AND (length(name1) > {PLU_NAME_LEN_LOGO} OR length(name2) > {PLU_NAME_LEN_LOGO})"),
+    ("Цена вне диапазона 0-999999", "typeof(price) != 'integer' OR price NOT BETWEEN 0 AND 999999"),
+    ("Тип срока годности должен быть 0 или 1", "expiry_type NOT IN (0, 1)"),
+    ("Срок годности должен быть датой дд.мм.гг",
+     "expiry_type = 0 AND (expiry_value NOT GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9]'"
+     " OR CAST(substr(expiry_value, 1, 2) AS INTEGER) NOT BETWEEN 1 AND 31"
+     " OR CAST(substr(expiry_value, 4, 2) AS INTEGER) NOT BETWEEN 1 AND 12)"),
+    ("Срок годности должен быть числом дней 0-999",
+     "expiry_type = 1 AND (expiry_value GLOB '*[^0-9]*' OR length(expiry_value) NOT BETWEEN 1 AND 3)"),
+    ("Тара вне диапазона 0-65535", "typeof(tare) != 'integer' OR tare NOT BETWEEN 0 AND 65535"),
+    ("Групповой код должен содержать 6 цифр", "group_code NOT GLOB '[0-9][0-9][0-9][0-9][0-9][0-9]'"),
+    (f"Номер сообщения вне диапазона 0-{MESSAGE_NUMBER_MAX}",
+     f"typeof(message_number) != 'integer' OR message_number NOT BETWEEN 0 AND {MESSAGE_NUMBER_MAX}"),
+    ("Тип логотипа должен быть 0, 1 или 2", "logo_type NOT IN (0, 1, 2)"),
+    ("Сертификационный код: до 4 символов ASCII",
+     "length(cert_code) > 4 OR cert_code GLOB '*[^ -~]*'"),
+    ("Для РОСТЕСТ требуется 4 символа сертификата", "logo_type = 1 AND length(cert_code) != 4"),
+]
+
+# Очередь повторной отправки PLU, которые весы не приняли при синхронизации:
+# задержка удваивается с каждой попыткой, после RETRY_MAX_ATTEMPTS товар уходит в "мёртвые"
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30     # секунд до первой повторной попытки
+RETRY_MAX_DELAY = 3600
+LINK_METRICS_DAYS = 30       # сколько дней хранить телеметрию линии
+
+PLU_CODE_DIGITS = 6  # код товара и групповой код — 6 цифр с ведущими нулями
+
+# Поля товара, которые задаёт пользователь (без вычисляемых wire_record / wire_hash)
+PLU_FIELDS = ('id', 'code', 'name1', 'name2', 'price', 'expiry_type', 'expiry_value', 'tare', 'group_code',
+              'message_number', 'logo_type', 'cert_code', 'last_reset', 'total_sum', 'total_weight',
+              'sales_count', 'updated_at')
+# Сортировки таблицы товаров с индексом (остальные колонки сортируются перебором)
+PLU_INDEXED_SORTS = ('code', 'name1', 'price', 'group_code', 'updated_at')
+PLU_PAGE_MAX = 500
+# Состояние товара на весах (нужен LEFT JOIN scale_mirror m): в очереди повторов /
+# на весах тот же образ / другой образ или товара там нет — как у дельта-синхронизации
+PLU_SYNC_STATES = ('failed', 'synced', 'changed')
+PLU_SYNC_STATE_SQL = """CASE
+    WHEN EXISTS (SELECT 1 FROM sync_retry_queue q WHERE q.port = :port AND q.plu_id = plu.id) THEN 'failed'
+    WHEN plu.wire_record IS NOT NULL AND m.image IS plu.wire_record THEN 'synced'
+    ELSE 'changed' END"""
+
+# Поля каталога из учётной системы; итоги продаж при импорте не трогаем
+PLU_CATALOG_FIELDS = ('id', 'code', 'name1', 'name2', 'price', 'expiry_type', 'expiry_value', 'tare',
+                      'group_code', 'message_number', 'logo_type', 'cert_code')
+PLU_IMPORT_SQL = (f"INSERT INTO plu ({', '.join(PLU_CATALOG_FIELDS)}, updated_at, wire_record, wire_hash) "
+                  f"VALUES ({', '.join(':' + f for f in PLU_CATALOG_FIELDS)}, :updated_at, :wire_record, :wire_hash) "
+                  f"ON CONFLICT(id) DO UPDATE SET "
+                  f"{', '.join(f'{f} = excluded.{f}' for f in PLU_CATALOG_FIELDS[1:] + ('updated_at', 'wire_record', 'wire_hash'))}")
+PLU_UPSERT_SQL = (f"INSERT OR REPLACE INTO plu ({', '.join(PLU_FIELDS)}, wire_record, wire_hash) "
+                  f"VALUES ({', '.join(':' + f for f in PLU_FIELDS)}, :wire_record, :wire_hash)")
+
+_wire_codec = ScaleProtocol()
+
+def encode_wire_record(plu_data: dict):
+    """83-байтовый образ товара для команды записи и его хэш. (None, None) — товар не кодируется"""
+    try:
+        record = _wire_codec._encode_plu(plu_data)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None, None
+    return record, hashlib.sha256(record).hexdigest()
+
+
+def plu_user_fields(plu: dict) -> dict:
+    """Товар без вычисляемых полей (wire_record — байты): для списков оператора в app_state"""
+    return {field: plu[field] for field in PLU_FIELDS if field in plu}
+
+
+def logo_hash(data: bytes) -> str:
+    """Адрес логотипа в хранилище — SHA-256 растра"""
+    return hashlib.sha256(bytes(data)).hexdigest()
 
 class AdminDatabase:
     def __init__(self):
@@ -18,6 +110,8 @@ class AdminDatabase:
     def _get_connection(self):
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
+        # Нужно, чтобы INSERT OR REPLACE вызывал триггеры удаления (индекс plu_fts)
+        conn.execute('PRAGMA recursive_triggers = ON')
         cursor = conn.cursor()
         try:
             yield cursor
@@ -33,6 +127,8 @@ class AdminDatabase:
     def _init_db(self):
         try:
             with self._get_connection() as c:
+                # WAL: чтение в одних процессах веб-сервера не ждёт записи в других
+                c.execute('PRAGMA journal_mode = WAL')
                 c.execute('''
                     CREATE TABLE IF NOT EXISTS users (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -69,7 +165,9 @@ class AdminDatabase:
                         total_sum INTEGER DEFAULT 0,
                         total_weight INTEGER DEFAULT 0,
                         sales_count INTEGER DEFAULT 0,
-                        updated_at DATETIME
+                        updated_at DATETIME,
+                        wire_record BLOB,                           -- готовый образ для записи на весы
+                        wire_hash TEXT                              -- sha256 образа
                     )
                 ''')
 
@@ -136,9 +234,173 @@ class AdminDatabase:
                     key_num INTEGER PRIMARY KEY CHECK(key_num BETWEEN 1 AND 54),
                     plu_id INTEGER REFERENCES plu(id)
                 )''')
+
+                # Задания синхронизации: план (список PLU), курсор и результат по каждому товару
+                c.execute('''CREATE TABLE IF NOT EXISTS sync_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    direction TEXT,
+                    kind TEXT,                       -- all / changed / selected
+                    port TEXT,
+                    status TEXT DEFAULT 'running',   -- running / done / cancelled / superseded
+                    total INTEGER DEFAULT 0,
+                    cursor INTEGER DEFAULT 0,        -- номер (seq) последнего подтверждённого товара
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )''')
+                c.execute('''CREATE TABLE IF NOT EXISTS sync_job_items (
+                    job_id INTEGER REFERENCES sync_jobs(id) ON DELETE CASCADE,
+                    seq INTEGER,
+                    plu_id INTEGER,
+                    status TEXT DEFAULT 'pending',   -- pending / ok / error
+                    PRIMARY KEY (job_id, seq)
+                )''')
+                c.execute('''CREATE TABLE IF NOT EXISTS sync_retry_queue (
+                    port TEXT,
+                    plu_id INTEGER,
+                    attempts INTEGER DEFAULT 0,      -- неудачных отправок подряд
+                    status TEXT DEFAULT 'retry',     -- retry / dead
+                    next_attempt_at DATETIME,
+                    last_job_id INTEGER,
+                    updated_at DATETIME,
+                    PRIMARY KEY (port, plu_id)
+                )''')
+
+                # Последний известный 83-байтовый образ каждого PLU на каждых весах
+                c.execute('''CREATE TABLE IF NOT EXISTS scale_mirror (
+                    port TEXT,
+                    plu_id INTEGER,
+                    image BLOB,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (port, plu_id)
+                )''')
+
+                # Контрольные точки выгрузки каталога с весов: последний обработанный номер
+                # и найденные пустые диапазоны [[с, по], ...]
+                c.execute('''CREATE TABLE IF NOT EXISTS plu_dump_checkpoints (
+                    port TEXT PRIMARY KEY,
+                    last_id INTEGER DEFAULT 0,
+                    empty_ranges TEXT DEFAULT '[]',
+                    updated_at DATETIME
+                )''')
+
+                # Логотипы по хешу содержимого и последний известный логотип каждых весов
+                c.execute('''CREATE TABLE IF NOT EXISTS logo_store (
+                    hash TEXT PRIMARY KEY,
+                    kind TEXT,                       -- logo2 / logo_roste
+                    data BLOB,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )''')
+                c.execute('''CREATE TABLE IF NOT EXISTS scale_logos (
+                    port TEXT,
+                    kind TEXT,
+                    hash TEXT REFERENCES logo_store(hash),
+                    verified INTEGER DEFAULT 0,      -- 1 — подтверждён чтением с весов (0x97)
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (port, kind)
+                )''')
+
+                # Телеметрия линии: одна строка на весы за минуту, задержки по кодам команд — JSON
+                c.execute('''CREATE TABLE IF NOT EXISTS link_metrics (
+                    port TEXT,
+                    bucket_start INTEGER,            -- начало минуты, unix time
+                    bytes_out INTEGER,
+                    bytes_in INTEGER,
+                    commands INTEGER,
+                    errors INTEGER,
+                    timeouts INTEGER,
+                    skipped INTEGER,
+                    ready_waits INTEGER,
+                    ready_wait REAL,
+                    latency TEXT,                    -- {код: [число, сумма с, максимум с]}
+                    PRIMARY KEY (port, bucket_start)
+                )''')
+
+                # Общее состояние админки для всех процессов веб-сервера: scope "" — приложение,
+                # "user:<id>" — рабочие таблицы оператора; значения — JSON
+                c.execute('''CREATE TABLE IF NOT EXISTS app_state (
+                    scope TEXT,
+                    key TEXT,
+                    value TEXT,
+                    updated_at DATETIME,
+                    PRIMARY KEY (scope, key)
+                )''')
+                # Снимки фоновых заданий: номер задания и номер события общие для всех процессов
+                c.execute('''CREATE TABLE IF NOT EXISTS job_states (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    port TEXT,
+                    state TEXT,
+                    seq INTEGER DEFAULT 0,           -- последнее событие задания
+                    snapshot TEXT,                   -- Job.to_dict() в JSON
+                    cancel_requested INTEGER DEFAULT 0,
+                    updated_at REAL,                 -- unix time последнего события
+                    owner TEXT,                      -- процесс-исполнитель: "pid:метка запуска"
+                    heartbeat REAL                   -- unix time последнего сигнала исполнителя
+                )''')
+                c.execute('CREATE INDEX IF NOT EXISTS idx_job_states_seq ON job_states (seq)')
+                self._init_job_owner(c)
+
+                # Ключ страницы таблицы товаров — (колонка, id); rowid SQLite сам дописывает в каждый индекс
+                for column in PLU_INDEXED_SORTS:
+                    c.execute(f'CREATE INDEX IF NOT EXISTS idx_plu_{column} ON plu ({column})')
+
+                self._init_plu_fts(c)
+                self._init_plu_wire(c)
         except Exception as e:
             logging.critical(f"Ошибка инициализации БД: {str(e)}")
             raise
+
+    def _init_plu_fts(self, c):
+        """Полнотекстовый индекс FTS5 по названиям, коду товара и групповому коду"""
+        fts_exists = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plu_fts'"
+        ).fetchone()
+
+        # unicode61 приводит к нижнему регистру и кириллицу, prefix ускоряет поиск по началу слова
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS plu_fts USING fts5(
+            name1, name2, code, group_code,
+            content='plu', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )''')
+
+        c.execute('''CREATE TRIGGER IF NOT EXISTS plu_fts_ai AFTER INSERT ON plu BEGIN
+            INSERT INTO plu_fts (rowid, name1, name2, code, group_code)
+            VALUES (new.id, new.name1, new.name2, new.code, new.group_code);
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS plu_fts_ad AFTER DELETE ON plu BEGIN
+            INSERT INTO plu_fts (plu_fts, rowid, name1, name2, code, group_code)
+            VALUES ('delete', old.id, old.name1, old.name2, old.code, old.group_code);
+        END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS plu_fts_au AFTER UPDATE OF name1, name2, code, group_code ON plu BEGIN
+            INSERT INTO plu_fts (plu_fts, rowid, name1, name2, code, group_code)
+            VALUES ('delete', old.id, old.name1, old.name2, old.code, old.group_code);
+            INSERT INTO plu_fts (rowid, name1, name2, code, group_code)
+            VALUES (new.id, new.name1, new.name2, new.code, new.group_code);
+        END''')
+
+        # Индекс создан впервые — заполняем его по уже существующим товарам
+        if not fts_exists:
+            c.execute("INSERT INTO plu_fts (plu_fts) VALUES ('rebuild')")
+
+    def _init_plu_wire(self, c):
+        """Добавляет в старую базу колонки готового образа товара и заполняет их"""
+        columns = {row['name'] for row in c.execute('PRAGMA table_info(plu)')}
+        if 'wire_record' not in columns:
+            c.execute('ALTER TABLE plu ADD COLUMN wire_record BLOB')
+            c.execute('ALTER TABLE plu ADD COLUMN wire_hash TEXT')
+        rows = c.execute('SELECT * FROM plu WHERE wire_record IS NULL AND code IS NOT NULL').fetchall()
+        updates = [(*encode_wire_record(dict(row)), row['id']) for row in rows]
+        c.executemany('UPDATE plu SET wire_record = ?, wire_hash = ? WHERE id = ?',
+                      [update for update in updates if update[0] is not None])
+
+    def _init_job_owner(self, c):
+        """Добавляет в старую базу колонки исполнителя задания и его сигнала жизни"""
+        columns = {row['name'] for row in c.execute('PRAGMA table_info(job_states)')}
+        if 'owner' not in columns:
+            c.execute('ALTER TABLE job_states ADD COLUMN owner TEXT')
+            c.execute('ALTER TABLE job_states ADD COLUMN heartbeat REAL')
+
     #region Sync History Operations
     def add_sync_history(self, direction, total, errors):
         with self._get_connection() as c:
@@ -209,21 +471,86 @@ class AdminDatabase:
             c.execute('SELECT * FROM plu')
             return [dict(row) for row in c.fetchall()]
 
+    def get_plu_differing_from_mirror(self, port: str) -> list:
+        """Товары, готовый образ которых не совпадает с зеркалом весов (или не кодируется)"""
+        with self._get_connection() as c:
+            c.execute('''
+                SELECT plu.* FROM plu
+                LEFT JOIN scale_mirror m ON m.port = ? AND m.plu_id = plu.id
+                WHERE plu.wire_record IS NULL OR m.image IS NOT plu.wire_record
+            ''', (port,))
+            return [dict(row) for row in c.fetchall()]
+
 
     def upsert_plu(self, plu_data: dict) -> bool:
         try:
             with self._get_connection() as c:
                 plu_data['updated_at'] = datetime.now().isoformat(sep=' ', timespec='seconds')
-                c.execute('''INSERT OR REPLACE INTO plu 
-                            (id, code, name1, name2, price, expiry_type, expiry_value, tare, group_code, message_number, logo_type, cert_code, last_reset, total_sum, total_weight, sales_count, updated_at)
-                            VALUES 
-                            (:id, :code, :name1, :name2, :price, :expiry_type, :expiry_value, :tare, :group_code, :message_number, :logo_type, :cert_code, :last_reset, :total_sum, :total_weight, :sales_count, :updated_at)''',
-                            plu_data)
+                # Образ для весов кодируется один раз при сохранении, синхронизация берёт его готовым
+                plu_data['wire_record'], plu_data['wire_hash'] = encode_wire_record(plu_data)
+                c.execute(PLU_UPSERT_SQL, plu_data)
                 return c.rowcount > 0
         except sqlite3.IntegrityError as e:
             logging.error(f"PLU integrity error: {str(e)}")
             return False
 
+    def upsert_plu_many(self, plu_items) -> list:
+        """Запись пачки товаров одной транзакцией. Возвращает id товаров, которые не удалось записать"""
+        failed = []
+        updated_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._get_connection() as c:
+            for plu_data in plu_items:
+                plu_data['updated_at'] = updated_at
+                plu_data['wire_record'], plu_data['wire_hash'] = encode_wire_record(plu_data)
+                try:
+                    c.execute(PLU_UPSERT_SQL, plu_data)
+                except sqlite3.IntegrityError as e:
+                    logging.error(f"PLU {plu_data.get('id')} integrity error: {str(e)}")
+                    failed.append(plu_data.get('id'))
+        return failed
+
+    def import_plu_batch(self, rows) -> dict:
+        """
+        Пачка товаров из файла каталога одной транзакцией. rows — [(номер строки файла, товар)]:
+        строки проверяются правилами каталога во временной таблице, корректные записываются
+        одним executemany; итоги продаж уже известных товаров сохраняются.
+        Возвращает {номер строки: [ошибки]} для отклонённых строк
+        """
+        updated_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._get_connection() as c:
+            # Временная таблица живёт в этом соединении, проверка — тем же SQL, что и у всего каталога
+            c.execute(f"CREATE TEMP TABLE plu_import (line INTEGER PRIMARY KEY, {', '.join(PLU_CATALOG_FIELDS)})")
+            c.executemany(f"INSERT INTO plu_import (line, {', '.join(PLU_CATALOG_FIELDS)}) "
+                          f"VALUES (:line, {', '.join(':' + f for f in PLU_CATALOG_FIELDS)})",
+                          [dict(plu, line=line) for line, plu in rows])
+            rejected = self._validate_plu(c, 'plu_import', key='line')
+            valid = []
+            for line, plu in rows:
+                if line not in rejected:
+                    plu = dict(plu, updated_at=updated_at)
+                    plu['wire_record'], plu['wire_hash'] = encode_wire_record(plu)
+                    valid.append((line, plu))
+            try:
+                c.executemany(PLU_IMPORT_SQL, [plu for _, plu in valid])
+            except sqlite3.IntegrityError:
+                # Ограничение, которого нет в правилах: ищем виноватые строки по одной
+                for line, plu in valid:
+                    try:
+                        c.execute(PLU_IMPORT_SQL, plu)
+                    except sqlite3.IntegrityError as e:
+                        rejected[line] = [str(e)]
+        return rejected
+
+    def iter_plu(self, batch: int = PLU_PAGE_MAX):
+        """Весь каталог по порядку номеров, страницами по batch (без готовых образов)"""
+        after = None
+        while True:
+            page = self.get_plu_page(after=after, limit=batch)
+            yield from page["plu_list"]
+            after = page["next"]
+            if after is None:
+                return
+
     def clear_plu(self, plu_id: int) -> bool:
         """Очищает данные PLU, но оставляет строку в таблице."""
         with self._get_connection() as c:
@@ -244,20 +571,152 @@ class AdminDatabase:
                     last_reset = NULL,
                     total_sum = 0,
                     total_weight = 0,
-                    sales_count = 0
+                    sales_count = 0,
+                    wire_record = NULL,
+                    wire_hash = NULL
                 WHERE id = ?
             ''', (plu_id,))
             return c.rowcount > 0
 
-    def search_plu(self, search_term: str) -> list:
-        """Поиск по названию товара"""
+    @staticmethod
+    def _fts_query(search_term: str) -> str:
+        """
+        Строит запрос FTS5: каждое слово ищется по префиксу, все слова обязательны.
+        Число короче кода ищется ещё и как код с ведущими нулями: "123" находит 000123
+        """
+        terms = []
+        for token in re.findall(r'\w+', search_term or ''):
+            term = f'"{token}"*'
+            if token.isdigit() and len(token) < PLU_CODE_DIGITS:
+                term = f'({term} OR {{code group_code}} : "{token.zfill(PLU_CODE_DIGITS)}")'
+            terms.append(term)
+        return ' AND '.join(terms)
+
+    def search_plu(self, search_term: str, limit: int = 50, offset: int = 0) -> list:
+        """Полнотекстовый поиск по названию, коду и групповому коду (по релевантности)"""
+        query = self._fts_query(search_term)
+        if not query:
+            return []
         with self._get_connection() as c:
-            c.execute('''
-                SELECT * FROM plu 
-                WHERE name1 LIKE ? OR name2 LIKE ?
-            ''', (f'%{search_term}%', f'%{search_term}%'))
+            # Веса bm25: название 1, название 2, код товара, групповой код
+            # Готовый образ (BLOB) в результаты поиска не попадает — они уходят в JSON
+            c.execute(f'''
+                SELECT {', '.join('plu.' + field for field in PLU_FIELDS)} FROM plu_fts
+                JOIN plu ON plu.id = plu_fts.rowid
+                WHERE plu_fts MATCH ?
+                ORDER BY bm25(plu_fts, 10.0, 5.0, 2.0, 1.0), plu.id
+                LIMIT ? OFFSET ?
+            ''', (query, limit, offset))
+            return [dict(row) for row in c.fetchall()]
+
+    def count_search_plu(self, search_term: str) -> int:
+        """Количество товаров, найденных полнотекстовым поиском"""
+        query = self._fts_query(search_term)
+        if not query:
+            return 0
+        with self._get_connection() as c:
+            return c.execute('SELECT COUNT(*) FROM plu_fts WHERE plu_fts MATCH ?', (query,)).fetchone()[0]
+
+    def get_plu_many(self, plu_ids) -> list:
+        """Товары по списку номеров одним запросом (отсутствующие пропускаются)"""
+        with self._get_connection() as c:
+            c.execute('SELECT * FROM plu WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id',
+                      (json.dumps([int(plu_id) for plu_id in plu_ids]),))
             return [dict(row) for row in c.fetchall()]
 
+    @staticmethod
+    def _plu_keyset(column: str, desc: bool, value) -> str:
+        """
+        Условие «после строки (:after_value, :after_id)» для ORDER BY column, id. NULL в SQLite
+        меньше любого значения: по возрастанию такие строки идут первыми, по убыванию — последними
+        """
+        column = f'plu.{column}'
+        if desc:
+            if value is None:
+                return f'({column} IS NULL AND plu.id < :after_id)'
+            return (f'({column} < :after_value OR ({column} = :after_value AND plu.id < :after_id) '
+                    f'OR {column} IS NULL)')
+        if value is None:
+            return f'({column} IS NOT NULL OR plu.id > :after_id)'
+        return f'({column} > :after_value OR ({column} = :after_value AND plu.id > :after_id))'
+
+    def get_plu_page(self, sort: str = 'id', desc: bool = False, after=None, limit: int = 50,
+                     group_code: str = None, price_min: int = None, price_max: int = None,
+                     search: str = None, sync_state: str = None, port: str = None) -> dict:
+        """
+        Страница таблицы товаров с пагинацией по ключу: after — (значение колонки sort, id)
+        последней строки предыдущей страницы. Фильтры: групповой код, цена в копейках,
+        полнотекстовый поиск и состояние на весах port (PLU_SYNC_STATES).
+        Возвращает {"plu_list", "next" — ключ следующей страницы или None, "total"}
+        """
+        if sort not in PLU_FIELDS:
+            raise ValueError(f"Сортировка по неизвестной колонке {sort}")
+        if sync_state is not None and (sync_state not in PLU_SYNC_STATES or not port):
+            raise ValueError(f"Некорректный фильтр состояния: {sync_state}")
+        limit = min(max(int(limit), 1), PLU_PAGE_MAX)
+        query = self._fts_query(search)
+        params = {"port": port, "group_code": group_code, "price_min": price_min, "price_max": price_max,
+                  "query": query, "sync_state": sync_state}
+
+        columns = ', '.join('plu.' + field for field in PLU_FIELDS)
+        joins = ''
+        if port:
+            columns += f', {PLU_SYNC_STATE_SQL} AS sync_state'
+            joins = 'LEFT JOIN scale_mirror m ON m.port = :port AND m.plu_id = plu.id'
+        where = []
+        if group_code:
+            where.append('plu.group_code = :group_code')
+        if price_min is not None:
+            where.append('plu.price >= :price_min')
+        if price_max is not None:
+            where.append('plu.price <= :price_max')
+        if query:
+            where.append('plu.id IN (SELECT rowid FROM plu_fts WHERE plu_fts MATCH :query)')
+        if sync_state:
+            where.append(f'{PLU_SYNC_STATE_SQL} = :sync_state')
+        filters = ' AND '.join(where) or '1'
+        page_filters = filters
+        if after is not None:
+            params["after_value"], params["after_id"] = after
+            page_filters += ' AND ' + self._plu_keyset(sort, desc, after[0])
+        direction = 'DESC' if desc else 'ASC'
+
+        with self._get_connection() as c:
+            rows = c.execute(f'''
+                SELECT {columns} FROM plu {joins} WHERE {page_filters}
+                ORDER BY plu.{sort} {direction}, plu.id {direction} LIMIT {limit + 1}
+            ''', params).fetchall()
+            total = c.execute(f'SELECT COUNT(*) FROM plu {joins} WHERE {filters}', params).fetchone()[0]
+        plu_list = [dict(row) for row in rows[:limit]]
+        last = plu_list[-1] if len(rows) > limit else None
+        return {
+            "plu_list": plu_list,
+            "next": (last[sort], last['id']) if last else None,
+            "total": total,
+        }
+
+    def validate_plu_catalog(self, table: str = 'plu') -> dict:
+        """
+        Проверяет весь каталог PLU одним запросом.
+        Возвращает {id: [ошибки]} только для некорректных строк.
+        """
+        with self._get_connection() as c:
+            return self._validate_plu(c, table)
+
+    @staticmethod
+    def _validate_plu(c, table: str, key: str = 'id') -> dict:
+        """Правила PLU_VALIDATION_RULES по таблице table в соединении c: {key: [ошибки]}"""
+        flags = ', '.join(f'IFNULL(({cond}), 1)' for _, cond in PLU_VALIDATION_RULES)
+        any_error = ' OR '.join(f'IFNULL(({cond}), 1)' for _, cond in PLU_VALIDATION_RULES)
+        rows = c.execute(f'SELECT {key}, {flags} FROM {table} WHERE {any_error}').fetchall()
+
+        report = {}
+        for row in rows:
+            errors = [msg for (msg, _), failed in zip(PLU_VALIDATION_RULES, row[1:]) if failed]
+            # Для удалённой записи остальные ошибки не информативны
+            report[row[0]] = [PLU_EMPTY_RULE] if PLU_EMPTY_RULE in errors else errors
+        return report
+
     def get_plu_count(self) -> int:
         """Получить общее количество записей"""
         with self._get_connection() as c:
@@ -276,6 +735,423 @@ class AdminDatabase:
             return c.rowcount > 0
     # endregion
 
+    # region Sync Jobs
+    def create_sync_job(self, direction: str, kind: str, port: str, plu_ids) -> int:
+        """
+        Создаёт задание синхронизации с планом из plu_ids (в порядке отправки).
+        Незавершённые задания того же направления на эти весы новое задание заменяет
+        """
+        plu_ids = list(plu_ids)
+        with self._get_connection() as c:
+            c.execute("UPDATE sync_jobs SET status = 'superseded', updated_at = CURRENT_TIMESTAMP "
+                      "WHERE direction = ? AND port = ? AND status = 'running'", (direction, port))
+            c.execute('INSERT INTO sync_jobs (direction, kind, port, total) VALUES (?, ?, ?, ?)',
+                      (direction, kind, port, len(plu_ids)))
+            job_id = c.lastrowid
+            c.executemany('INSERT INTO sync_job_items (job_id, seq, plu_id) VALUES (?, ?, ?)',
+                          [(job_id, seq, plu_id) for seq, plu_id in enumerate(plu_ids, 1)])
+            return job_id
+
+    def get_sync_job(self, job_id: int) -> dict:
+        """Задание с количеством товаров по статусам"""
+        with self._get_connection() as c:
+            row = c.execute('SELECT * FROM sync_jobs WHERE id = ?', (job_id,)).fetchone()
+            if not row:
+                return None
+            job = dict(row)
+            c.execute('SELECT status, COUNT(*) AS n FROM sync_job_items WHERE job_id = ? GROUP BY status', (job_id,))
+            job['counts'] = {r['status']: r['n'] for r in c.fetchall()}
+            return job
+
+    def get_unfinished_sync_job(self, port: str = None) -> dict:
+        """
+        Последнее незавершённое задание (для продолжения после перезапуска или потери
+        связи). Отменённые пользователем и заменённые новыми задания не продолжаются
+        """
+        with self._get_connection() as c:
+            if port is None:
+                row = c.execute("SELECT id FROM sync_jobs WHERE status = 'running' ORDER BY id DESC LIMIT 1").fetchone()
+            else:
+                row = c.execute("SELECT id FROM sync_jobs WHERE status = 'running' AND port = ? ORDER BY id DESC LIMIT 1",
+                                (port,)).fetchone()
+        return self.get_sync_job(row['id']) if row else None
+
+    def get_sync_job_pending(self, job_id: int) -> list:
+        """Номера PLU, ещё не подтверждённые весами, в порядке плана"""
+        with self._get_connection() as c:
+            c.execute("SELECT plu_id FROM sync_job_items WHERE job_id = ? AND status = 'pending' ORDER BY seq", (job_id,))
+            return [row['plu_id'] for row in c.fetchall()]
+
+    def ack_sync_job_item(self, job_id: int, plu_id: int, ok: bool, image: bytes = None) -> None:
+        """
+        Фиксирует ответ весов по товару и сдвигает курсор задания. Если весы приняли
+        товар и передан его образ, он сохраняется в зеркале весов в той же транзакции
+        """
+        with self._get_connection() as c:
+            if ok and image is not None:
+                c.execute('''INSERT OR REPLACE INTO scale_mirror (port, plu_id, image, updated_at)
+                             SELECT port, ?, ?, CURRENT_TIMESTAMP FROM sync_jobs WHERE id = ?''',
+                          (plu_id, image, job_id))
+            c.execute("UPDATE sync_job_items SET status = ? WHERE job_id = ? AND plu_id = ? AND status = 'pending'",
+                      ('ok' if ok else 'error', job_id, plu_id))
+            c.execute('''UPDATE sync_jobs SET updated_at = CURRENT_TIMESTAMP,
+                            cursor = (SELECT MAX(seq) FROM sync_job_items WHERE job_id = ? AND plu_id = ?)
+                         WHERE id = ?''', (job_id, plu_id, job_id))
+
+    def cancel_sync_job(self, job_id: int) -> bool:
+        """Отмена пользователем: неотправленные товары остаются в плане, но задание не продолжается"""
+        with self._get_connection() as c:
+            c.execute("UPDATE sync_jobs SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP "
+                      "WHERE id = ? AND status = 'running'", (job_id,))
+            return c.rowcount > 0
+
+    def finish_sync_job(self, job_id: int) -> list:
+        """Закрывает задание. Возвращает PLU, которые весы не приняли"""
+        with self._get_connection() as c:
+            c.execute("UPDATE sync_jobs SET status = 'done', updated_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+            c.execute("SELECT plu_id FROM sync_job_items WHERE job_id = ? AND status = 'error' ORDER BY seq", (job_id,))
+            return [row['plu_id'] for row in c.fetchall()]
+    # endregion
+
+    # region Sync Retry Queue
+    @staticmethod
+    def _retry_delay(attempts: int) -> int:
+        return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+    def settle_sync_retries(self, job_id: int) -> dict:
+        """
+        Переносит итог задания в очередь повторов: принятые весами товары из неё
+        удаляются, отклонённые получают следующую попытку с удвоенной задержкой
+        или, исчерпав попытки, попадают в мёртвые. Возвращает {"retry": [...], "dead": [...]}
+        """
+        now = datetime.now()
+        result = {"retry": [], "dead": []}
+        with self._get_connection() as c:
+            port = c.execute('SELECT port FROM sync_jobs WHERE id = ?', (job_id,)).fetchone()['port']
+            c.execute('''DELETE FROM sync_retry_queue WHERE port = ? AND plu_id IN
+                            (SELECT plu_id FROM sync_job_items WHERE job_id = ? AND status = 'ok')''',
+                      (port, job_id))
+            failed = c.execute('''
+                SELECT i.plu_id, IFNULL(q.attempts, 0) AS attempts FROM sync_job_items i
+                LEFT JOIN sync_retry_queue q ON q.port = ? AND q.plu_id = i.plu_id
+                WHERE i.job_id = ? AND i.status = 'error'
+            ''', (port, job_id)).fetchall()
+            rows = []
+            for row in failed:
+                attempts = row['attempts'] + 1
+                status = 'dead' if attempts >= RETRY_MAX_ATTEMPTS else 'retry'
+                next_attempt = now + timedelta(seconds=self._retry_delay(attempts))
+                rows.append((port, row['plu_id'], attempts, status,
+                             next_attempt.isoformat(sep=' ', timespec='seconds') if status == 'retry' else None,
+                             job_id, now.isoformat(sep=' ', timespec='seconds')))
+                result[status].append(row['plu_id'])
+            c.executemany('''INSERT OR REPLACE INTO sync_retry_queue
+                             (port, plu_id, attempts, status, next_attempt_at, last_job_id, updated_at)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+        return result
+
+    def get_due_sync_retries(self, port: str) -> list:
+        """Номера PLU, для которых подошло время повторной отправки"""
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._get_connection() as c:
+            c.execute('''SELECT plu_id FROM sync_retry_queue
+                         WHERE port = ? AND status = 'retry' AND next_attempt_at <= ? ORDER BY plu_id''',
+                      (port, now))
+            return [row['plu_id'] for row in c.fetchall()]
+
+    def get_sync_retry_queue(self, port: str) -> list:
+        """Очередь повторов весов (ожидающие и мёртвые) для отображения"""
+        with self._get_connection() as c:
+            c.execute('SELECT * FROM sync_retry_queue WHERE port = ? ORDER BY status, plu_id', (port,))
+            return [dict(row) for row in c.fetchall()]
+
+    def revive_sync_retries(self, port: str) -> list:
+        """Ручной повтор: все товары очереди, включая мёртвые, готовы к отправке сейчас"""
+        now = datetime.now().isoformat(sep=' ', timespec='seconds')
+        with self._get_connection() as c:
+            c.execute('''UPDATE sync_retry_queue SET status = 'retry', attempts = 0,
+                            next_attempt_at = ?, updated_at = ? WHERE port = ?''', (now, now, port))
+            c.execute('SELECT plu_id FROM sync_retry_queue WHERE port = ? ORDER BY plu_id', (port,))
+            return [row['plu_id'] for row in c.fetchall()]
+
+    def drop_sync_retries(self, port: str, plu_ids) -> None:
+        """Убрать из очереди товары, которые больше нечего отправлять (удалены или некорректны)"""
+        with self._get_connection() as c:
+            c.executemany('DELETE FROM sync_retry_queue WHERE port = ? AND plu_id = ?',
+                          [(port, plu_id) for plu_id in plu_ids])
+    # endregion
+
+    # region Scale Mirror
+    def get_scale_mirror(self, port: str) -> dict:
+        """Зеркало весов: {plu_id: 83-байтовый образ}"""
+        with self._get_connection() as c:
+            c.execute('SELECT plu_id, image FROM scale_mirror WHERE port = ?', (port,))
+            return {row['plu_id']: bytes(row['image']) for row in c.fetchall()}
+
+    def set_scale_mirror_many(self, port: str, images) -> None:
+        """Запоминает образы [(plu_id, image)], прочитанные с весов или записанные на них"""
+        with self._get_connection() as c:
+            c.executemany('''INSERT OR REPLACE INTO scale_mirror (port, plu_id, image, updated_at)
+                             VALUES (?, ?, ?, CURRENT_TIMESTAMP)''',
+                          [(port, plu_id, image) for plu_id, image in images])
+
+    def clear_scale_mirror(self, port: str, plu_ids=None) -> None:
+        """Забыть состояние весов (целиком или по списку PLU)"""
+        with self._get_connection() as c:
+            if plu_ids is None:
+                c.execute('DELETE FROM scale_mirror WHERE port = ?', (port,))
+            else:
+                c.executemany('DELETE FROM scale_mirror WHERE port = ? AND plu_id = ?',
+                              [(port, plu_id) for plu_id in plu_ids])
+    # endregion
+
+    # region Link Metrics
+    def save_link_metrics(self, port: str, bucket: dict) -> None:
+        """Сохраняет минутную корзину телеметрии (с уже записанной за ту же минуту складывается)"""
+        columns = ("bytes_out", "bytes_in", "commands", "errors", "timeouts", "skipped", "ready_waits", "ready_wait")
+        with self._get_connection() as c:
+            row = c.execute('SELECT * FROM link_metrics WHERE port = ? AND bucket_start = ?',
+                            (port, bucket["start"])).fetchone()
+            if row:
+                bucket = merge_buckets([bucket, self._link_bucket(row)])
+            c.execute(f'''INSERT OR REPLACE INTO link_metrics (port, bucket_start, {', '.join(columns)}, latency)
+                          VALUES (?, ?, {', '.join('?' * len(columns))}, ?)''',
+                      (port, row['bucket_start'] if row else bucket["start"],
+                       *(bucket[key] for key in columns), json.dumps(bucket["latency"])))
+            cutoff = int(datetime.now().timestamp()) - LINK_METRICS_DAYS * 86400
+            c.execute('DELETE FROM link_metrics WHERE port = ? AND bucket_start < ?', (port, cutoff))
+
+    @staticmethod
+    def _link_bucket(row) -> dict:
+        bucket = new_bucket(row['bucket_start'])
+        bucket.update({key: row[key] for key in bucket if key not in ("start", "latency")})
+        bucket["latency"] = json.loads(row['latency'] or '{}')
+        return bucket
+
+    def get_link_metrics(self, port: str, since: int) -> list:
+        """Минутные корзины телеметрии весов port начиная с since (unix time), по времени"""
+        with self._get_connection() as c:
+            rows = c.execute('SELECT * FROM link_metrics WHERE port = ? AND bucket_start >= ? ORDER BY bucket_start',
+                             (port, since)).fetchall()
+            return [self._link_bucket(row) for row in rows]
+
+    def get_link_ports(self, since: int) -> list:
+        """Порты, по которым есть телеметрия начиная с since"""
+        with self._get_connection() as c:
+            rows = c.execute('SELECT DISTINCT port FROM link_metrics WHERE bucket_start >= ? ORDER BY port', (since,))
+            return [row['port'] for row in rows]
+    # endregion
+
+    # region Shared State
+    def get_state(self, scope: str, key: str, default=None):
+        """Значение общего состояния (scope "" — всё приложение, "user:<id>" — оператор)"""
+        with self._get_connection() as c:
+            row = c.execute('SELECT value FROM app_state WHERE scope = ? AND key = ?', (scope, key)).fetchone()
+            return json.loads(row['value']) if row else default
+
+    def set_state(self, scope: str, key: str, value) -> None:
+        with self._get_connection() as c:
+            c.execute('''INSERT OR REPLACE INTO app_state (scope, key, value, updated_at)
+                         VALUES (?, ?, ?, CURRENT_TIMESTAMP)''', (scope, key, json.dumps(value)))
+
+    def update_state(self, scope: str, key: str, update, default=None):
+        """
+        Чтение, изменение и запись одной транзакцией: update(значение) -> новое значение.
+        BEGIN IMMEDIATE не даёт другому процессу вклиниться между чтением и записью
+        """
+        with self._get_connection() as c:
+            c.execute('BEGIN IMMEDIATE')
+            row = c.execute('SELECT value FROM app_state WHERE scope = ? AND key = ?', (scope, key)).fetchone()
+            value = update(json.loads(row['value']) if row else default)
+            c.execute('''INSERT OR REPLACE INTO app_state (scope, key, value, updated_at)
+                         VALUES (?, ?, ?, CURRENT_TIMESTAMP)''', (scope, key, json.dumps(value)))
+            return value
+    # endregion
+
+    # region Job States
+    def create_job_state(self, name: str, port: str, owner: str = None) -> int:
+        """Номер нового задания, общий для всех процессов; owner — процесс-исполнитель"""
+        now = time.time()
+        with self._get_connection() as c:
+            c.execute("INSERT INTO job_states (name, port, state, updated_at, owner, heartbeat) "
+                      "VALUES (?, ?, 'queued', ?, ?, ?)", (name, port, now, owner, now))
+            return c.lastrowid
+
+    def save_job_state(self, job_id: int, snapshot: dict, keep: int = 50) -> int:
+        """
+        Снимок задания с новым сквозным номером события (он и возвращается).
+        Номер выдаётся под блокировкой записи SQLite, поэтому растёт по всем процессам
+        """
+        finished = snapshot["state"] in ('done', 'failed', 'cancelled')
+        with self._get_connection() as c:
+            now = time.time()
+            # Опоздавший снимок ожидания не отменяет захват весов (claim_job_port)
+            c.execute('''UPDATE job_states SET state = CASE WHEN state = 'running' AND ? = 'queued' THEN state ELSE ? END,
+                            snapshot = ?, updated_at = ?, heartbeat = ?,
+                            seq = (SELECT IFNULL(MAX(seq), 0) + 1 FROM job_states)
+                         WHERE id = ?''', (snapshot["state"], snapshot["state"], json.dumps(snapshot), now, now, job_id))
+            seq = c.execute('SELECT seq FROM job_states WHERE id = ?', (job_id,)).fetchone()
+            if finished:
+                c.execute('''DELETE FROM job_states WHERE state IN ('done', 'failed', 'cancelled') AND id NOT IN (
+                                 SELECT id FROM job_states WHERE state IN ('done', 'failed', 'cancelled')
+                                 ORDER BY id DESC LIMIT ?)''', (keep,))
+            return seq['seq'] if seq else 0
+
+    def get_job_states(self, names=None, port: str = None, active: bool = None,
+                       after: int = None, job_id: int = None) -> list:
+        """
+        Снимки заданий всех процессов: по порядку постановки, а с after — по порядку
+        событий после номера after
+        """
+        where, params = [], []
+        if job_id is not None:
+            where.append('id = ?')
+            params.append(job_id)
+        if names is not None:
+            where.append(f"name IN ({', '.join('?' * len(names))})")
+            params.extend(names)
+        if port is not None:
+            where.append('port = ?')
+            params.append(port)
+        if active is not None:
+            where.append(f"state {'NOT IN' if active else 'IN'} ('done', 'failed', 'cancelled')")
+        if after is not None:
+            where.append('seq > ?')
+            params.append(after)
+        with self._get_connection() as c:
+            rows = c.execute(f'''SELECT * FROM job_states WHERE {' AND '.join(where) or '1'}
+                                 ORDER BY {'seq' if after is not None else 'id'}''', params).fetchall()
+        states = []
+        for row in rows:
+            snapshot = json.loads(row['snapshot']) if row['snapshot'] else {"id": row['id'], "name": row['name'],
+                                                                            "port": row['port'], "data": {}}
+            states.append(dict(snapshot, state=row['state'], seq=row['seq'],
+                               owner=row['owner'], heartbeat=row['heartbeat']))
+        return states
+
+    def last_job_event(self) -> int:
+        with self._get_connection() as c:
+            return c.execute('SELECT IFNULL(MAX(seq), 0) FROM job_states').fetchone()[0]
+
+    def request_job_cancel(self, job_id: int) -> bool:
+        """Отметка отмены для процесса, который выполняет задание. False — задание уже завершено"""
+        with self._get_connection() as c:
+            c.execute('''UPDATE job_states SET cancel_requested = 1
+                         WHERE id = ? AND state NOT IN ('done', 'failed', 'cancelled')''', (job_id,))
+            return c.rowcount > 0
+
+    def job_cancel_requested(self, job_id: int) -> bool:
+        with self._get_connection() as c:
+            row = c.execute('SELECT cancel_requested FROM job_states WHERE id = ?', (job_id,)).fetchone()
+            return bool(row and row['cancel_requested'])
+
+    def claim_job_port(self, job_id: int, port: str, limit: int, alive_after: float) -> bool:
+        """
+        Переводит задание в выполнение, если на весах port выполняется меньше limit заданий
+        всех процессов (с сигналом жизни новее alive_after). Проверка и захват — одна
+        транзакция BEGIN IMMEDIATE, поэтому два процесса не займут одни весы одновременно
+        """
+        with self._get_connection() as c:
+            c.execute('BEGIN IMMEDIATE')
+            running = c.execute('''SELECT COUNT(*) FROM job_states WHERE port = ? AND state = 'running'
+                                      AND id != ? AND heartbeat >= ?''', (port, job_id, alive_after)).fetchone()[0]
+            if running >= limit:
+                return False
+            c.execute("UPDATE job_states SET state = 'running', heartbeat = ? WHERE id = ?", (time.time(), job_id))
+            return True
+
+    def beat_job_states(self, owner: str) -> int:
+        """Сигнал жизни исполнителя owner по всем его незавершённым заданиям"""
+        with self._get_connection() as c:
+            c.execute('''UPDATE job_states SET heartbeat = ?
+                         WHERE owner = ? AND state NOT IN ('done', 'failed', 'cancelled')''', (time.time(), owner))
+            return c.rowcount
+
+    def fail_job_states(self, job_ids) -> int:
+        """Незавершённые задания job_ids, процесс которых уже не работает, помечаются ошибкой"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return 0
+        with self._get_connection() as c:
+            c.execute(f'''UPDATE job_states SET state = 'failed', seq = (SELECT IFNULL(MAX(seq), 0) + 1 FROM job_states)
+                          WHERE id IN ({', '.join('?' * len(job_ids))})
+                            AND state NOT IN ('done', 'failed', 'cancelled')''', job_ids)
+            return c.rowcount
+    # endregion
+
+    # region PLU Dump Checkpoints
+    def get_dump_checkpoint(self, port: str) -> dict:
+        """Контрольная точка выгрузки с весов: {"last_id", "empty_ranges"}"""
+        with self._get_connection() as c:
+            row = c.execute('SELECT * FROM plu_dump_checkpoints WHERE port = ?', (port,)).fetchone()
+            if not row:
+                return {"last_id": 0, "empty_ranges": []}
+            return {"last_id": row['last_id'], "empty_ranges": json.loads(row['empty_ranges'])}
+
+    def save_dump_checkpoint(self, port: str, last_id: int, empty_ids) -> None:
+        """Сохраняет контрольную точку; пустые номера хранятся сжатыми в диапазоны"""
+        ranges = []
+        for plu_id in sorted(empty_ids):
+            if ranges and ranges[-1][1] == plu_id - 1:
+                ranges[-1][1] = plu_id
+            else:
+                ranges.append([plu_id, plu_id])
+        with self._get_connection() as c:
+            c.execute('''INSERT OR REPLACE INTO plu_dump_checkpoints (port, last_id, empty_ranges, updated_at)
+                         VALUES (?, ?, ?, ?)''',
+                      (port, last_id, json.dumps(ranges), datetime.now().isoformat(sep=' ', timespec='seconds')))
+    # endregion
+
+    # region Logo Store
+    def store_logo(self, kind: str, data: bytes) -> str:
+        """Кладёт логотип в хранилище (повторно не дублируется), возвращает его хеш"""
+        data = bytes(data)
+        digest = logo_hash(data)
+        with self._get_connection() as c:
+            c.execute('INSERT OR IGNORE INTO logo_store (hash, kind, data) VALUES (?, ?, ?)',
+                      (digest, kind, data))
+        return digest
+
+    def get_stored_logo(self, digest: str):
+        """Растр логотипа по хешу, None — нет в хранилище"""
+        with self._get_connection() as c:
+            row = c.execute('SELECT data FROM logo_store WHERE hash = ?', (digest,)).fetchone()
+            return bytes(row['data']) if row else None
+
+    def get_stored_logos(self, kind: str = None) -> list:
+        """Логотипы хранилища без растров: [{"hash", "kind", "created_at"}], новые первыми"""
+        query = 'SELECT hash, kind, created_at FROM logo_store'
+        params = ()
+        if kind:
+            query += ' WHERE kind = ?'
+            params = (kind,)
+        with self._get_connection() as c:
+            return [dict(row) for row in c.execute(query + ' ORDER BY created_at DESC', params)]
+
+    def get_scale_logo(self, port: str, kind: str) -> dict:
+        """Последний записанный или прочитанный логотип весов: {"hash", "verified", "updated_at"} или None"""
+        with self._get_connection() as c:
+            row = c.execute('SELECT hash, verified, updated_at FROM scale_logos WHERE port = ? AND kind = ?',
+                            (port, kind)).fetchone()
+            return dict(row, verified=bool(row['verified'])) if row else None
+
+    def set_scale_logo(self, port: str, kind: str, data: bytes, verified: bool = False) -> str:
+        """Запоминает логотип, который сейчас на весах port; verified — прочитан с весов"""
+        digest = self.store_logo(kind, data)
+        with self._get_connection() as c:
+            c.execute('''INSERT OR REPLACE INTO scale_logos (port, kind, hash, verified, updated_at)
+                         VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)''', (port, kind, digest, int(verified)))
+        return digest
+
+    def forget_scale_logo(self, port: str, kind: str = None) -> None:
+        """Логотип на весах неизвестен (ошибка записи, замена весов)"""
+        with self._get_connection() as c:
+            if kind is None:
+                c.execute('DELETE FROM scale_logos WHERE port = ?', (port,))
+            else:
+                c.execute('DELETE FROM scale_logos WHERE port = ? AND kind = ?', (port, kind))
+    # endregion
+
     # region Message Operations
     def get_message(self, msg_id: int) : #-> Optional[str]
         with self._get_connection() as c:
@@ -406,17 +1282,8 @@ class AdminDatabase:
             return False
 
     def reset_total_sales(self):
-        from datetime import datetime
-        now = datetime.now()
         # BCD-пакет: сек, мин, час, день, мес, год
-        bcd = bytes([
-            ((now.second // 10) << 4) | (now.second % 10),
-            ((now.minute // 10) << 4) | (now.minute % 10),
-            ((now.hour // 10) << 4) | (now.hour % 10),
-            ((now.day // 10) << 4) | (now.day % 10),
-            ((now.month // 10) << 4) | (now.month % 10),
-            ((now.year % 100 // 10) << 4) | (now.year % 10)
-        ])
+        bcd = datetime_to_bcd(datetime.now())
         values = {
             'mileage': 0,
             'label_count': 0,
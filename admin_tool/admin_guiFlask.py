@@ -1,14 +1,31 @@
 # app.py
 from datetime import datetime
 import sys
-from flask import Flask, jsonify, render_template, request, redirect, url_for, flash
-from flask_login import LoginManager, login_user, login_required, logout_user, UserMixin
+from flask import Flask, Response, jsonify, render_template, request, redirect, send_file, url_for, flash
+from flask_login import LoginManager, login_user, login_required, logout_user, UserMixin, current_user
 from functools import wraps
 import serial
+import base64
+import json
 import logging
 import os
-from admin_db import AdminDatabase
+import queue
+import tempfile
+from threading import Event, Thread
+import time
+from admin_db import AdminDatabase, PLU_EMPTY_RULE, plu_user_fields
 from admin import ScaleAdmin
+from broker import BrokerClient
+from catalog_io import catalog_format, export_csv, export_xlsx, import_catalog
+from fanout import FanoutSync
+from jobs import JobExecutor
+from logo_image import LOGO_SIZES, image_to_logo, logo_preview
+from logo_store import LOGO_FAILED, LOGO_QUEUED, LOGO_SKIPPED, push_logo_many, read_scale_logo
+from scheduler import CommandScheduler, INTERACTIVE, POLLING, BULK
+from status_hub import StatusHub
+from sync_push import PUSH_INTERRUPTED, encode_plu_record, push_sync_job
+from telemetry import TELEMETRY_BUCKET, merge_buckets, summarize
+from protocol import LENGTHS, LinkDown
 
 logging.basicConfig(
     level=logging.INFO,
@@ -64,44 +81,109 @@ def _check_user_in_db(username, password):
 def logout():
     # Разрываем соединение с весами
     if connection["admin"]:
+        retry_stop.set()
+        jobs.cancel_all(local=True, suspend=True)
+        connection["status_hub"].stop()
+        connection["scheduler"].stop()
         try:
             connection["admin"].disconnect()
         except Exception:
             pass
         connection["admin"] = None
+        connection["scheduler"] = None
+        connection["status_hub"] = None
         connection["connected"] = False
-        connection["current_port"] = None
-        connection["current_baudrate"] = None
         connection["status_message"] = "Отключено"
+        set_current_port(None, None)
+        set_scales_ready(False)
     logout_user()
     return redirect(url_for('login'))
 
-scales_ready = False
-plu_list = []      
-messages = []     
-FACTORY_SETTINGS = {}
-
-# Глобальное состояние подключения
+# Глобальное состояние подключения. Порт и планировщик — живые объекты этого процесса;
+# при нескольких процессах веб-сервера порт держит брокер (SCALE_BROKER_SOCKET)
 connection = {
     "admin": None,
+    "scheduler": None,
+    "status_hub": None,  # общий опрос состояния весов для всех вкладок
     "connected": False,
-    "current_port": None,
-    "current_baudrate": None,
     "status_message": ""
 }
 
 def require_scales_ready(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not scales_ready:
+        if not is_scales_ready():
             flash("Весы не готовы к работе!", "danger")
             return redirect(url_for('index'))
         return f(*args, **kwargs)
     return decorated_function
 
+#region shared state
+# Всё, что должны видеть все процессы веб-сервера, хранится в базе (app_state):
+# порт и готовность весов — на всё приложение, списки страницы товаров — у каждого оператора свои
+
+def current_port():
+    """Порт подключённых весов — общий для всех процессов, в том числе не открывавших его сами"""
+    return db.get_state("", "current_port")
+
+def current_baudrate():
+    return db.get_state("", "current_baudrate")
+
+def set_current_port(port, baudrate):
+    db.set_state("", "current_port", port)
+    db.set_state("", "current_baudrate", baudrate)
+
+# Готовность приходит из ready_callback после каждого ответа весов, под замком линии.
+# Процесс, держащий порт, знает её сразу (scales_ready), а в app_state она пишется
+# только при изменении и отдельным потоком, чтобы обмен с весами не ждал SQLite
+scales_ready = {"state": None}  # None — порт держит не этот процесс, читаем из базы
+scales_ready_changed = Event()
+
+def is_scales_ready():
+    if scales_ready["state"] is not None:
+        return scales_ready["state"]
+    return db.get_state("", "scales_ready", False)
+
 def set_scales_ready(state):
-    global scales_ready
-    scales_ready = state
+    state = bool(state)
+    if scales_ready["state"] != state:
+        scales_ready["state"] = state
+        scales_ready_changed.set()
+
+def scales_ready_writer():
+    """Сохраняет в app_state последнее значение готовности; частые переключения схлопываются"""
+    written = None
+    while True:
+        scales_ready_changed.wait()
+        scales_ready_changed.clear()
+        state = scales_ready["state"]
+        if state != written:
+            try:
+                db.set_state("", "scales_ready", state)
+                written = state
+            except Exception as e:
+                logging.error(f"Ошибка сохранения готовности весов: {str(e)}")
+
+Thread(target=scales_ready_writer, name="scales-ready", daemon=True).start()
+
+def user_scope(user=None):
+    return f"user:{(user or current_user).id}"
+
+def get_user_list(key, scope=None):
+    """Список оператора: plu_list, messages, imported_plu_list"""
+    return db.get_state(scope or user_scope(), key, [])
+
+def set_user_list(key, items, scope=None):
+    db.set_state(scope or user_scope(), key, items)
+
+def add_user_item(key, item):
+    """Добавить запись в список оператора, если записи с таким id там ещё нет; весь список"""
+    return db.update_state(user_scope(), key, lambda items: items if any(i['id'] == item['id'] for i in items)
+                           else items + [item], [])
+
+def remove_user_item(key, item_id):
+    db.update_state(user_scope(), key, lambda items: [i for i in items if i['id'] != item_id], [])
+#endregion
 
 
 @app.route("/", methods=["GET"])
@@ -110,42 +192,66 @@ def index():
     admin = get_admin_connection()
     return render_template(
         "index.html",
-        current_port=connection["current_port"],
-        current_baudrate=connection["current_baudrate"],
+        current_port=current_port(),
+        current_baudrate=current_baudrate(),
         connected=connection["connected"],
         connection_status={"connected": connection["connected"], "message": connection["status_message"]},
-        scales_ready=scales_ready
+        scales_ready=is_scales_ready()
     )
 
-def get_admin_connection():
+def connect_admin(priority=INTERACTIVE):
+    """
+    Доступ к весам через планировщик команд с приоритетом priority. Не подключились —
+    LinkDown; без flash/redirect, поэтому годится и для фоновых заданий
+    """
     if not connection["connected"]:
         try:
-            admin = ScaleAdmin(ready_callback=set_scales_ready, admin_db=db)
+            # При запущенном брокере порт принадлежит ему, а не процессу Flask
+            broker_socket = os.environ.get("SCALE_BROKER_SOCKET")
+            if broker_socket:
+                admin = BrokerClient(broker_socket, ready_callback=set_scales_ready)
+            else:
+                admin = ScaleAdmin(ready_callback=set_scales_ready, admin_db=db)
             if admin.ser.is_open:
                 connection["admin"] = admin
+                connection["scheduler"] = CommandScheduler(admin)
+                connection["status_hub"] = StatusHub(connection["scheduler"].proxy(POLLING).get_current_status)
                 connection["connected"] = True
-                connection["current_port"] = admin.ser.port
-                connection["current_baudrate"] = admin.ser.baudrate
+                set_current_port(admin.ser.port, admin.ser.baudrate)
                 connection["status_message"] = f"Успешно подключено к {admin.ser.port} ({admin.ser.baudrate})"
+                resume_unfinished_sync_job()
+                retry_stop.clear()
+                Thread(target=retry_worker, args=(connection["scheduler"],), daemon=True).start()
             else:
                 connection["status_message"] = "Не удалось подключиться к весам"
-                flash(connection["status_message"], "danger")
-                return redirect(url_for("index"))
         except Exception as e:
             connection["status_message"] = f"Ошибка подключения: {str(e)}"
-            flash(connection["status_message"], "danger")
-            return redirect(url_for("index"))
-    return connection["admin"]
+        if not connection["connected"]:
+            raise LinkDown(connection["status_message"])
+    return connection["scheduler"].proxy(priority)
+
+def get_admin_connection(priority=INTERACTIVE):
+    """Доступ к весам для обработчика запроса: не подключились — сообщение и переход на главную"""
+    try:
+        return connect_admin(priority)
+    except LinkDown:
+        flash(connection["status_message"], "danger")
+        return redirect(url_for("index"))
 
 import signal
 
 def handle_exit(signum, frame):
     if connection["admin"]:
+        retry_stop.set()
+        jobs.cancel_all(local=True, suspend=True)
+        connection["status_hub"].stop()
+        connection["scheduler"].stop()
         try:
             connection["admin"].disconnect()
             logging.info("Порт закрыт по сигналу завершения")
         except Exception:
             pass
+        set_current_port(None, None)
     sys.exit(0)
 
 signal.signal(signal.SIGINT, handle_exit)
@@ -154,29 +260,119 @@ signal.signal(signal.SIGTERM, handle_exit)
 @app.route("/plu", methods=["GET"])
 @login_required
 def plu():
-    plu_list = db.get_all_plu()
-    return render_template("plu.html", plu_list=plu_list, messages=messages, scales_ready=scales_ready, active_tab="plu")
+    # Строки таблицы страница за страницей загружает /api/plu
+    return render_template("plu.html", plu_list=None, messages=get_user_list("messages"), scales_ready=is_scales_ready(), active_tab="plu")
+
+PLU_PAGE_SIZE = 100  # строк за один запрос таблицы товаров
+
+def encode_plu_cursor(key):
+    """Ключ следующей страницы (значение колонки сортировки, id) -> непрозрачная строка"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_plu_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+@app.route("/api/plu", methods=["GET"])
+@login_required
+def api_plu():
+    """
+    Страница каталога: sort (колонка), desc=1, after (ключ из next прошлой страницы), limit,
+    фильтры group_code, price_min и price_max (копейки), q (поиск), sync_state (для текущих весов)
+    """
+    args = request.args
+    try:
+        page = db.get_plu_page(
+            sort=args.get("sort", "id"),
+            desc=args.get("desc") == "1",
+            after=decode_plu_cursor(args["after"]) if args.get("after") else None,
+            limit=args.get("limit", PLU_PAGE_SIZE, type=int),
+            group_code=args.get("group_code") or None,
+            price_min=args.get("price_min", type=int),
+            price_max=args.get("price_max", type=int),
+            search=args.get("q"),
+            sync_state=args.get("sync_state") or None,
+            port=current_port(),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    page["next"] = encode_plu_cursor(page["next"]) if page["next"] else None
+    return jsonify(page)
 
 #region PLU management
 #region sync management
-from threading import Thread
-
-imported_plu_list = []
+DUMP_BATCH = 100     # товаров на одну транзакцию и контрольную точку
+retry_stop = Event() # остановка фоновой повторной отправки
+RETRY_POLL = 10      # секунд между проверками очереди повторов
+IMPORT_WAIT = 30     # секунд ждать импорт с весов в запросе, дальше — по номеру задания
+
+# Все длительные операции — задания общей очереди (не больше одного на весы)
+jobs = JobExecutor(store=db)
+SYNC_JOBS = ("sync_to_scales", "dump_from_scales")  # задания, которые показывает /sync_status
+
+def new_sync_status(direction):
+    """Подробности задания синхронизации (job.data)"""
+    return {
+        "errors": [],
+        "invalid": {},    # {id: [ошибки проверки]} — товары, пропущенные при синхронизации
+        "direction": direction,  # "to_scales" или "from_scales"
+        "job_id": None,   # задание синхронизации в базе (sync_jobs)
+        "retry": {"retry": [], "dead": []},  # итог задания в очереди повторов
+    }
 
-sync_status = {
-    "in_progress": False,
-    "total": 0,
-    "current": 0,
-    "errors": [],
-    "direction": "",  # "to_scales" или "from_scales"
-    "done": False
-}
+def sync_status_for_web(job):
+    """Состояние последнего задания синхронизации в формате /sync_status"""
+    if job is None:
+        return dict(new_sync_status(""), in_progress=False, done=False, total=0, current=0, state=None)
+    return dict(new_sync_status(""), **job.data, in_progress=job.active, done=not job.active,
+                total=job.total, current=job.current, state=job.state, job=job.id, error=job.error)
+
+def sync_event_for_web(job):
+    """
+    Событие потока /sync_stream: прогресс, скорость, оставшееся время и число ошибок.
+    Номера ошибочных товаров — только в итоговом событии, пока идёт передача их не гоняем
+    """
+    status = dict(sync_status_for_web(job), **job.rates(), bytes=job.bytes, error_count=len(job.data.get("errors", [])))
+    if job.active:
+        status["errors"] = []
+    return status
+
+def sync_active(port):
+    return bool(jobs.list(SYNC_JOBS, port, active=True))
 
 @app.route("/sync_status")
 @login_required
 @require_scales_ready
 def get_sync_status():
-    return jsonify(sync_status)
+    return jsonify(sync_status_for_web(jobs.latest(SYNC_JOBS, current_port())))
+
+@app.route("/sync_stream")
+@login_required
+def sync_stream():
+    """
+    Поток прогресса синхронизации текущих весов (Server-Sent Events). Номер события —
+    сквозной номер очереди заданий: после переподключения браузер присылает Last-Event-ID
+    и получает задания, изменившиеся за время разрыва, без повтора уже полученного
+    """
+    port = current_port()
+    last_id = request.headers.get("Last-Event-ID", type=int)
+    if last_id is None or last_id > jobs.last_event:
+        # Новый подписчик (или номер от прошлого запуска сервера) — начинаем с последнего задания
+        latest = jobs.latest(SYNC_JOBS, port)
+        last_id = latest.seq - 1 if latest else jobs.last_event
+
+    def stream():
+        after = last_id
+        while True:
+            changed = jobs.changes(after, SYNC_JOBS, port, timeout=STATUS_KEEPALIVE)
+            if not changed:
+                yield ": keepalive\n\n"
+                continue
+            for job in changed:
+                after = job.seq
+                yield f"id: {job.seq}\ndata: {json.dumps(sync_event_for_web(job))}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route("/sync_history")
 @login_required
@@ -184,95 +380,298 @@ def get_sync_status():
 def sync_history():
     history = db.get_sync_history()
     plu_list = db.get_all_plu()
-    return render_template("sync_history.html", history=history, plu_list=plu_list, scales_ready=scales_ready)
+    return render_template("sync_history.html", history=history, plu_list=plu_list, scales_ready=is_scales_ready())
+
+def start_sync(kind, ids=None):
+    """Синхронизация в очередь; пока прежняя на этих весах не закончилась, возвращается она"""
+    return jobs.submit("sync_to_scales", sync_plu_to_scales_job, kind, ids,
+                       port=current_port(), unique=True)
 
 @app.route("/start_sync_plu_to_scales", methods=["POST"])
 @login_required
 @require_scales_ready
 def start_sync_plu_to_scales():
-    if not sync_status["in_progress"]:
-        Thread(target=sync_plu_to_scales_async).start()
-    return '', 204
+    return jsonify({"job_id": start_sync("all").id})
 
 @app.route("/start_sync_selected_plu_to_scales", methods=["POST"])
 @login_required
 @require_scales_ready
 def start_sync_selected_plu_to_scales():
     ids = request.json.get("ids", [])
-    if not sync_status["in_progress"]:
-        Thread(target=sync_selected_plu_to_scales_async, args=(ids,)).start()
-    return '', 204
+    return jsonify({"job_id": start_sync("selected", ids).id})
 
 @app.route("/start_sync_changed_plu_to_scales", methods=["POST"])
 @login_required
 @require_scales_ready
 def start_sync_changed_plu_to_scales():
-    if not sync_status["in_progress"]:
-        Thread(target=sync_changed_plu_to_scales_async).start()
+    return jsonify({"job_id": start_sync("changed").id})
+
+@app.route("/validate_plu")
+@login_required
+def validate_plu():
+    return jsonify(db.validate_plu_catalog())
+
+def exclude_invalid_plu(job, plu_items):
+    """Проверяет каталог до начала передачи и отсеивает некорректные товары"""
+    report = db.validate_plu_catalog()
+    invalid = {plu['id']: report[plu['id']] for plu in plu_items if plu['id'] in report}
+    job.data["invalid"] = invalid
+    # Удалённые (пустые) записи просто пропускаем, остальные считаем ошибками
+    job.data["errors"].extend(plu_id for plu_id, errors in invalid.items() if errors != [PLU_EMPTY_RULE])
+    if invalid:
+        logging.warning(f"Пропущено некорректных PLU: {len(invalid)}")
+    return [plu for plu in plu_items if plu['id'] not in invalid]
+
+def sync_plu_to_scales_job(job, kind, ids=None):
+    """
+    Загрузка на весы: all — весь каталог, changed — отличающиеся от зеркала весов,
+    selected и retry — товары ids (retry — из очереди повторов)
+    """
+    job.data = new_sync_status("to_scales")
+    if kind == "changed":
+        # Сравнение готовых образов с зеркалом выполняется в SQL, без кодирования каталога
+        items = db.get_plu_differing_from_mirror(job.port)
+    elif kind in ("selected", "retry"):
+        wanted = {int(plu_id) for plu_id in ids}
+        items = db.get_plu_many(wanted)
+    else:
+        items = db.get_all_plu()
+    plu_items = exclude_invalid_plu(job, items)
+    if kind == "retry":
+        # Удалённые и ставшие некорректными товары повторять бессмысленно
+        db.drop_sync_retries(job.port, wanted - {plu['id'] for plu in plu_items})
+    job_id = db.create_sync_job("to_scales", kind, job.port, [plu['id'] for plu in plu_items])
+    run_sync_job(job, job_id)
+
+def resume_sync_job_run(job, job_id):
+    job.data = new_sync_status("to_scales")
+    run_sync_job(job, job_id)
+
+def run_sync_job(job, job_id):
+    """Отправка ещё не подтверждённых товаров задания на текущие весы (см. push_sync_job)"""
+    if push_sync_job(db, connect_admin(BULK), job, job_id) == PUSH_INTERRUPTED:
+        # Задание в базе остаётся незавершённым и продолжится после восстановления связи
+        raise LinkDown(job.data["error"])
+
+def resume_unfinished_sync_job():
+    """Продолжение задания, прерванного перезапуском или потерей связи"""
+    port = current_port()
+    job = db.get_unfinished_sync_job(port)
+    if job and not sync_active(port):
+        logging.info(f"Продолжение задания синхронизации {job['id']}: курсор {job['cursor']} из {job['total']}")
+        jobs.submit("sync_to_scales", resume_sync_job_run, job['id'], port=port, unique=True)
+        return job
+    return None
+
+def retry_worker(scheduler):
+    """
+    Пока подключение живо, продолжает прерванное задание синхронизации и
+    отправляет товары, для которых подошло время повтора
+    """
+    while not retry_stop.wait(RETRY_POLL) and connection["scheduler"] is scheduler:
+        port = current_port()
+        if sync_active(port) or not is_scales_ready():
+            continue
+        try:
+            # Сначала задание, прерванное потерей связи, затем очередь повторов
+            if resume_unfinished_sync_job():
+                continue
+            due = db.get_due_sync_retries(port)
+            if due:
+                logging.info(f"Повторная отправка PLU из очереди: {len(due)}")
+                start_sync("retry", due)
+        except Exception as e:
+            logging.error(f"Ошибка повторной отправки: {str(e)}")
+
+@app.route("/retry_failed_plu", methods=["POST"])
+@login_required
+@require_scales_ready
+def retry_failed_plu():
+    """Повторить только не принятые весами товары, включая исчерпавшие попытки"""
+    port = current_port()
+    if sync_active(port):
+        return jsonify({"started": False, "count": 0})
+    ids = db.revive_sync_retries(port)
+    if ids:
+        start_sync("retry", ids)
+    return jsonify({"started": bool(ids), "count": len(ids)})
+
+@app.route("/sync_retry_queue")
+@login_required
+def sync_retry_queue():
+    return jsonify(db.get_sync_retry_queue(current_port()))
+
+def open_fanout_admin(port):
+    """Подключение для загрузки на весы port: текущие весы — через планировщик, остальные — отдельно"""
+    if connection["connected"] and port == current_port():
+        return connect_admin(BULK), lambda: None
+    broker_socket = os.environ.get("SCALE_BROKER_SOCKET")
+    if broker_socket:
+        admin = BrokerClient(broker_socket, port=port)
+    else:
+        admin = ScaleAdmin(port=port, baudrate=current_baudrate() or 9600, admin_db=db)
+        if not admin.ser or not admin.ser.is_open:
+            raise ConnectionError(f"Не удалось открыть порт {port}")
+    return admin, admin.disconnect
+
+fanout = FanoutSync(db, open_fanout_admin, jobs)
+
+def configured_ports():
+    """Весы магазина: SCALE_PORTS=COM3,COM4,... или только подключённые"""
+    ports = [port.strip() for port in os.environ.get("SCALE_PORTS", "").split(",") if port.strip()]
+    return ports or [port for port in [current_port()] if port]
+
+@app.route("/start_fanout_sync", methods=["POST"])
+@login_required
+def start_fanout_sync():
+    options = request.get_json(silent=True) or {}
+    try:
+        fanout.start(options.get("ports") or configured_ports(), options.get("mode", "all"), options.get("ids"))
+    except (ValueError, RuntimeError) as e:
+        return jsonify({"started": False, "message": str(e)}), 400
+    return jsonify({"started": True})
+
+@app.route("/stop_fanout_sync", methods=["POST"])
+@login_required
+def stop_fanout_sync():
+    fanout.stop()
     return '', 204
 
-def sync_selected_plu_to_scales_async(ids):
-    sync_status.update({"in_progress": True, "direction": "to_scales", "done": False, "errors": []})
-    selected_plu = [plu for plu in db.get_all_plu() if str(plu['id']) in ids]
-    sync_status["total"] = len(selected_plu)
-    sync_status["current"] = 0
-    admin = get_admin_connection()
-    for plu in selected_plu:
-        ok = admin.create_plu(plu)
-        if not ok:
-            sync_status["errors"].append(plu['id'])
-        sync_status["current"] += 1
-    sync_status["in_progress"] = False
-    sync_status["done"] = True
-    db.add_sync_history("to_scales", sync_status["total"], sync_status["errors"])
-
-def sync_changed_plu_to_scales_async():
-    # Получаем время последней синхронизации из истории
-    last_sync = db.get_last_sync_time("to_scales")
-    changed_plu = db.get_changed_plu(last_sync) if last_sync else db.get_all_plu()
-    sync_status.update({"in_progress": True, "direction": "to_scales", "done": False, "errors": []})
-    sync_status["total"] = len(changed_plu)
-    sync_status["current"] = 0
-    admin = get_admin_connection()
-    for plu in changed_plu:
-        ok = admin.create_plu(plu)
-        if not ok:
-            sync_status["errors"].append(plu['id'])
-        sync_status["current"] += 1
-    sync_status["in_progress"] = False
-    sync_status["done"] = True
-    db.add_sync_history("to_scales", sync_status["total"], sync_status["errors"])
-
-def sync_plu_to_scales_async():
-    sync_status.update({"in_progress": True, "direction": "to_scales", "done": False, "errors": []})
-    all_plu = db.get_all_plu()
-    sync_status["total"] = len(all_plu)
-    sync_status["current"] = 0
-    admin = get_admin_connection()
-    for plu in all_plu:
-        ok = admin.create_plu(plu)
-        if not ok:
-            sync_status["errors"].append(plu['id'])
-        sync_status["current"] += 1
-    sync_status["in_progress"] = False
-    sync_status["done"] = True
-    db.add_sync_history("to_scales", sync_status["total"], sync_status["errors"])
+@app.route("/fanout_status")
+@login_required
+def fanout_status():
+    return jsonify(dict(fanout.status(), configured_ports=configured_ports()))
 
-@app.route("/import_selected_plu_from_scales", methods=["POST"])
+@app.route("/resume_sync_job", methods=["POST"])
 @login_required
 @require_scales_ready
-def import_selected_plu_from_scales():
-    ids = request.json.get("ids", [])
-    admin = get_admin_connection()
+def resume_sync_job():
+    job = resume_unfinished_sync_job()
+    return jsonify({"resumed": job is not None, "job": job})
+
+@app.route("/sync_job/<int:job_id>")
+@login_required
+def sync_job(job_id):
+    return jsonify(db.get_sync_job(job_id) or {})
+
+@app.route("/jobs")
+@login_required
+def list_jobs():
+    """Задания очереди; фильтры name, port и active=1 (только незавершённые)"""
+    active = request.args.get("active")
+    found = jobs.list(request.args.get("name"), request.args.get("port"),
+                      active=None if active is None else active == "1")
+    return jsonify([job.to_dict() for job in found])
+
+@app.route("/jobs/<int:job_id>")
+@login_required
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"message": "Задание не найдено"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<int:job_id>/cancel", methods=["POST"])
+@login_required
+def cancel_job(job_id):
+    return jsonify({"cancelled": jobs.cancel(job_id)})
+
+@app.route("/start_dump_plu_from_scales", methods=["POST"])
+@login_required
+@require_scales_ready
+def start_dump_plu_from_scales():
+    options = request.get_json(silent=True) or {}
+    job = jobs.submit("dump_from_scales", dump_plu_from_scales_job,
+                      options.get("resume", True), options.get("skip_empty", False),
+                      port=current_port(), unique=True)
+    return jsonify({"job_id": job.id})
+
+@app.route("/stop_dump_plu_from_scales", methods=["POST"])
+@login_required
+def stop_dump_plu_from_scales():
+    jobs.cancel_all("dump_from_scales", current_port())
+    return '', 204
+
+def dump_plu_from_scales_job(job, resume=True, skip_empty=False):
+    """
+    Выгрузка всего каталога с весов в базу пачками по DUMP_BATCH. После каждой пачки
+    сохраняется контрольная точка, прерванная выгрузка продолжается с неё
+    """
+    job.data = new_sync_status("from_scales")
+    admin = connect_admin(BULK)
+    port = job.port
+    checkpoint = db.get_dump_checkpoint(port)
+    known_empty = {plu_id for first, last in checkpoint["empty_ranges"] for plu_id in range(first, last + 1)}
+    start = checkpoint["last_id"] + 1 if resume else 1
+    # Пустые номера до точки возобновления и пропускаемые диапазоны остаются в контрольной точке
+    empty_ids = {plu_id for plu_id in known_empty if plu_id < start or skip_empty}
+    skip_ranges = checkpoint["empty_ranges"] if skip_empty else ()
+
+    batch = []
+    batch_empty = []
+    saved = 0
+    last_id = start - 1
+    def flush():
+        nonlocal saved
+        failed = db.upsert_plu_many(batch)
+        job.data["errors"].extend(failed)
+        saved += len(batch) - len(failed)
+        # Прочитанное с весов — их известное состояние для дельта-синхронизации
+        db.set_scale_mirror_many(port, [(plu['id'], image) for plu in batch
+                                        if (image := encode_plu_record(plu)) is not None])
+        db.clear_scale_mirror(port, batch_empty)
+        batch.clear()
+        batch_empty.clear()
+        db.save_dump_checkpoint(port, last_id, empty_ids)
+
+    try:
+        for item in admin.dump_plu(start=start, skip_ranges=skip_ranges, stop=job.cancelled):
+            job.progress(item["done"], item["total"], job.bytes + (LENGTHS["plu"] if item["plu"] else 0))
+            last_id = item["id"]
+            if item["plu"]:
+                empty_ids.discard(item["id"])
+                batch.append(normalize_plu_for_web(item["plu"]))
+            else:
+                empty_ids.add(item["id"])
+                batch_empty.append(item["id"])
+            if item["done"] % DUMP_BATCH == 0:
+                flush()
+    except LinkDown:
+        # Прочитанное до обрыва сохраняем, выгрузка продолжится с контрольной точки
+        flush()
+        raise
+    if not job.cancelled():
+        last_id = 0  # выгрузка завершена, следующая начнётся с начала
+    flush()
+
+    db.add_sync_history("from_scales", saved, job.data["errors"])
+
+def import_plu_job(job, ids, scope):
+    """Чтение выбранных товаров с весов для просмотра перед сохранением (scope — оператор)"""
+    admin = connect_admin()
     found = []
+    job.progress(0, len(ids))
     for plu_id in ids:
+        if job.cancelled():
+            break
         plu = admin.get_plu_by_id(int(plu_id))
         if plu and plu.get('id'):
             found.append(normalize_plu_for_web(plu))
-    # глобальная переменная для тестирования (потом изменить)
-    global imported_plu_list
-    imported_plu_list = found
-    return jsonify({"plu_list": found})
+        job.progress(job.current + 1)
+    set_user_list("imported_plu_list", found, scope)
+    return found
+
+@app.route("/import_selected_plu_from_scales", methods=["POST"])
+@login_required
+@require_scales_ready
+def import_selected_plu_from_scales():
+    ids = request.json.get("ids", [])
+    job = jobs.submit("import_from_scales", import_plu_job, ids, user_scope(), port=current_port())
+    found = job.wait(IMPORT_WAIT)
+    if job.active:
+        # Весы заняты другим заданием — результат заберём по номеру задания
+        return jsonify({"plu_list": None, "job_id": job.id}), 202
+    return jsonify({"plu_list": found or [], "job_id": job.id})
 
 @app.route("/save_imported_plu", methods=["POST"])
 @login_required
@@ -280,7 +679,7 @@ def save_imported_plu():
     ids = request.json.get("ids", [])
     saved = []
     errors = []
-    for plu in imported_plu_list:
+    for plu in get_user_list("imported_plu_list"):
         if str(plu['id']) in ids:
             ok = db.upsert_plu(plu)
             if ok:
@@ -344,13 +743,70 @@ def add_plu():
 def find_plu():
     plu_id = int(request.args.get("id"))
     plu = db.get_plu(plu_id)
+    messages = get_user_list("messages")
     if plu:
-        if not any(p['id'] == plu['id'] for p in plu_list):
-            plu_list.append(plu)
-        return render_template("plu.html", plu_list=plu_list, messages=messages, scales_ready=scales_ready)
+        plu_list = add_user_item("plu_list", plu_user_fields(plu))
+        return render_template("plu.html", plu_list=plu_list, messages=messages, scales_ready=is_scales_ready())
     else:
         flash(f"Товар с ID {plu_id} не найден в серверной базе", "warning")
-        return render_template("plu.html", plu_list=plu_list, messages=messages, active_tab='plu', scales_ready=scales_ready)
+        plu_list = get_user_list("plu_list")
+        return render_template("plu.html", plu_list=plu_list, messages=messages, active_tab='plu', scales_ready=is_scales_ready())
+
+def import_catalog_job(job, path, fmt):
+    """Импорт файла каталога; прогресс — число прочитанных строк"""
+    try:
+        with open(path, "rb") as f:
+            return import_catalog(db, f, fmt, progress=job.progress, stop=job.cancelled)
+    finally:
+        os.remove(path)
+
+@app.route("/import_plu_catalog", methods=["POST"])
+@login_required
+def import_plu_catalog():
+    """Загрузка каталога CSV/XLSX из учётной системы заданием очереди; итог — по /jobs/<id>"""
+    upload = request.files.get("file")
+    try:
+        fmt = catalog_format(upload.filename if upload else "")
+    except (ValueError, RuntimeError) as e:
+        return jsonify({"error": str(e)}), 400
+    # Файл сохраняется на диск потоком и разбирается пачками, в память целиком не читается
+    fd, path = tempfile.mkstemp(suffix="." + fmt)
+    os.close(fd)
+    upload.save(path)
+    job = jobs.submit("import_catalog", import_catalog_job, path, fmt)
+    return jsonify({"job_id": job.id})
+
+@app.route("/export_plu_catalog", methods=["GET"])
+@login_required
+def export_plu_catalog():
+    """Выгрузка каталога с итогами продаж: CSV отдаётся потоком, XLSX — через временный файл"""
+    if request.args.get("format") == "xlsx":
+        fd, path = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            export_xlsx(db, path)
+        except RuntimeError as e:
+            os.remove(path)
+            return jsonify({"error": str(e)}), 400
+        response = send_file(path, as_attachment=True, download_name="plu_catalog.xlsx")
+        response.call_on_close(lambda: os.remove(path))
+        return response
+    return Response((chunk.encode("utf-8") for chunk in export_csv(db)), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=plu_catalog.csv"})
+
+@app.route("/search_plu", methods=["GET"])
+@login_required
+def search_plu():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 50, type=int), 1), 200)
+    found = db.search_plu(query, limit=per_page, offset=(page - 1) * per_page)
+    return jsonify({
+        "plu_list": found,
+        "total": db.count_search_plu(query),
+        "page": page,
+        "per_page": per_page
+    })
 
 @app.route("/delete_plu", methods=["POST"])
 @login_required
@@ -398,14 +854,15 @@ def find_message():
     admin = get_admin_connection()
     msg_id = int(request.args.get("id"))
     msg = admin.get_message_by_id(msg_id)
+    plu_list = get_user_list("plu_list")
     
     if msg:
-        if not any(m['id'] == msg['id'] for m in messages):
-             messages.append({'id': msg_id, 'content': msg['content']})
-        return render_template("plu.html", plu_list=plu_list, messages=messages, active_tab='messages', scales_ready=scales_ready)
+        messages = add_user_item("messages", {'id': msg_id, 'content': msg['content']})
+        return render_template("plu.html", plu_list=plu_list, messages=messages, active_tab='messages', scales_ready=is_scales_ready())
     else:
         flash(f"Сообщение с ID {msg_id} не найдено", "warning")
-        return render_template("plu.html", plu_list=plu_list, messages=messages, active_tab='messages', scales_ready=scales_ready)
+        messages = get_user_list("messages")
+        return render_template("plu.html", plu_list=plu_list, messages=messages, active_tab='messages', scales_ready=is_scales_ready())
 
 
 @app.route("/delete_message", methods=["POST"])
@@ -428,8 +885,8 @@ def delete_message():
 def get_total_sales_table():
     admin = get_admin_connection()
     totals = admin.get_total_sales() if hasattr(admin, "get_total_sales") else {}
-    return render_template("partials/total_sales_table.html", plu_list=plu_list,
-                            messages=messages, totals=totals, active_tab='sales', scales_ready=scales_ready)
+    return render_template("partials/total_sales_table.html", plu_list=get_user_list("plu_list"),
+                            messages=get_user_list("messages"), totals=totals, active_tab='sales', scales_ready=is_scales_ready())
 
 @app.route("/reset_total_sales", methods=["POST"])
 @login_required
@@ -457,6 +914,14 @@ def bind_plu_to_key():
     else:
         return jsonify({"success": False, "message": "Ошибка назначения PLU на клавишу"}), 400
     
+@app.route("/key_binds", methods=["GET"])
+@login_required
+def key_binds():
+    """Таблица привязок клавиш из кэша; refresh=1 — перечитать с весов"""
+    admin = get_admin_connection()
+    binds = admin.get_all_key_binds(refresh=request.args.get("refresh") == "1")
+    return render_template("partials/key_binds_table.html", binds=binds)
+
 @app.route("/get_plu_by_key", methods=["GET"])
 @login_required
 def get_plu_by_key():
@@ -526,47 +991,132 @@ def user_settings():
         settings=settings,
         features=features,
         print_features_flags=flags,
-        scales_ready=scales_ready
+        scales_ready=is_scales_ready()
     )
 
 @app.route('/factory_settings')
 @login_required
 def factory_settings():
     admin = get_admin_connection()
-    
-    global FACTORY_SETTINGS
-    if not FACTORY_SETTINGS:
-        FACTORY_SETTINGS = admin.get_factory_settings() if admin else {}
+    settings = admin.get_factory_settings() if admin else {}
+    return render_template('factory_settings.html', settings=settings, scales_ready=is_scales_ready())
 
-    return render_template('factory_settings.html', settings=FACTORY_SETTINGS, scales_ready=scales_ready)
+@app.route('/cache_stats')
+@login_required
+def cache_stats():
+    """Статистика кэша ответов весов"""
+    admin = get_admin_connection()
+    stats = admin.get_cache_stats() if hasattr(admin, "get_cache_stats") else {}
+    return jsonify(stats)
 
 #endregion
 
-#region Status management
-@app.route('/get_current_status')
+#region Link telemetry
+LINK_WARN_TIMEOUT_RATE = 0.02   # доля таймаутов, с которой весы считаются деградировавшими
+LINK_WARN_ERROR_RATE = 0.05     # то же для ответов 0xEE
+LINK_WARN_SKIPPED = 50          # мусорных байтов за период
+
+def link_health(stats):
+    """Показатели линии плюс признак деградации"""
+    stats["degraded"] = (stats["timeout_rate"] >= LINK_WARN_TIMEOUT_RATE
+                         or stats["error_rate"] >= LINK_WARN_ERROR_RATE
+                         or stats["skipped_bytes"] >= LINK_WARN_SKIPPED)
+    return stats
+
+@app.route('/link_stats')
 @login_required
-def get_current_status():
-    admin = get_admin_connection()
-    status = admin.get_current_status()
-    
-    result = {
+def link_stats():
+    """Телеметрия линии: скользящее окно подключённых весов и сводка по всем весам за hours часов"""
+    hours = float(request.args.get("hours", 1))
+    since = int(time.time() - hours * 3600)
+    ports = {}
+    for port in db.get_link_ports(since):
+        buckets = db.get_link_metrics(port, since)
+        ports[port] = link_health(dict(summarize(merge_buckets(buckets), len(buckets) * TELEMETRY_BUCKET), port=port))
+    telemetry = getattr(connection["admin"], "telemetry", None) if connection["connected"] else None
+    live = link_health(telemetry.snapshot()) if telemetry else None
+    return jsonify({"live": live, "ports": sorted(ports.values(), key=lambda stats: stats["port"]), "hours": hours})
+
+@app.route('/link_history')
+@login_required
+def link_history():
+    """Поминутный ряд телеметрии весов port за hours часов"""
+    port = request.args.get("port") or current_port()
+    hours = float(request.args.get("hours", 1))
+    buckets = db.get_link_metrics(port, int(time.time() - hours * 3600))
+    return jsonify([dict(summarize(bucket, TELEMETRY_BUCKET), start=bucket["start"]) for bucket in buckets])
+
+@app.route('/link_dashboard')
+@login_required
+def link_dashboard():
+    return render_template('link_dashboard.html', scales_ready=is_scales_ready())
+#endregion
+
+#region Status management
+STATUS_KEEPALIVE = 15  # секунд между комментариями SSE, чтобы прокси не закрывали поток
+
+def status_for_web(status):
+    return {
         "status_byte_hex": hex(status.get("status_byte", 0)),
         "weight": status.get("weight", ""),
         "price": status.get("price", ""),
         "sum": status.get("sum", ""),
         "plu_number": status.get("plu_number", ""),
         "bits_str": "\n".join(f"{k}: {v}" for k, v in status.get("bits", {}).items()),
-        "ready": scales_ready
+        "ready": is_scales_ready()
     }
 
-    return jsonify(result)
+@app.route('/get_current_status')
+@login_required
+def get_current_status():
+    get_admin_connection()
+    # Свежий образец общего опроса; весы читаются, только если он устарел
+    hub = connection["status_hub"]
+    status = (hub.sample() if hub else None) or {}
+    return jsonify(status_for_web(status))
+
+@app.route('/status_stream')
+@login_required
+def status_stream():
+    """Поток состояния весов (Server-Sent Events); все вкладки получают один и тот же опрос"""
+    get_admin_connection()
+    hub = connection["status_hub"]
+    if hub is None:
+        return '', 204
+
+    def stream():
+        samples = queue.Queue(maxsize=1)
+        def deliver(sample):
+            # Медленному клиенту нужен только последний образец
+            try:
+                samples.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                samples.put_nowait(sample)
+            except queue.Full:
+                pass
+        hub.subscribe(deliver)
+        try:
+            while True:
+                try:
+                    sample = samples.get(timeout=STATUS_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {sample['seq']}\ndata: {json.dumps(status_for_web(sample))}\n\n"
+        finally:
+            hub.unsubscribe(deliver)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/current_status')
 @login_required
 def current_status():
     admin = get_admin_connection()
     
-    return render_template('current_status.html', status={}, scales_ready=scales_ready)
+    return render_template('current_status.html', status={}, scales_ready=is_scales_ready())
 #endregion
 
 #region Logo management
@@ -575,38 +1125,104 @@ def current_status():
 def logo():
     admin = get_admin_connection()
     
-    return render_template('logo.html', scales_ready=scales_ready)
+    return render_template('logo.html', scales_ready=is_scales_ready())
+
+def logo_for_web(data: bytes) -> dict:
+    """Растр логотипа и его PNG-превью для страницы (base64)"""
+    return {
+        "success": True,
+        "data": base64.b64encode(data).decode("ascii"),
+        "preview": "data:image/png;base64," + base64.b64encode(logo_preview(data)).decode("ascii"),
+    }
+
+@app.route('/convert_logo', methods=['POST'])
+@login_required
+def convert_logo():
+    """Картинка (или готовый .bin) из формы в растр логотипа kind"""
+    kind = request.form.get("kind", "logo2")
+    method = request.form.get("method", "floyd_steinberg")
+    file = request.files.get("file")
+    if kind not in LOGO_SIZES or not file:
+        return jsonify({"success": False, "message": "Не указан файл или тип логотипа"}), 400
+    width, height = LOGO_SIZES[kind]
+    try:
+        if file.filename.lower().endswith(".bin"):
+            data = file.read()
+            if len(data) * 8 != width * height:
+                return jsonify({"success": False, "message": f"Размер файла не соответствует логотипу {width}x{height}"}), 400
+        else:
+            data = image_to_logo(file.stream, kind, method)
+    except Exception as e:
+        logging.error(f"Ошибка преобразования логотипа: {str(e)}")
+        return jsonify({"success": False, "message": f"Не удалось преобразовать картинку: {str(e)}"}), 400
+    return jsonify(logo_for_web(data))
+
+@app.route('/read_logo')
+@login_required
+def read_logo():
+    """Чтение LOGO 2 с весов (логотип Ростест по протоколу только записывается)"""
+    admin = get_admin_connection()
+    data = read_scale_logo(admin, db, current_port(), refresh=request.args.get("refresh") == "1")
+    if not data:
+        return jsonify({"success": False, "message": "Не удалось прочитать логотип"}), 400
+    return jsonify(logo_for_web(bytes(data)))
+
+LOGO_WAIT = 30  # секунд ждать запись логотипа в запросе; задания занятых весов остаются в очереди
+
+@app.route('/write_logo', methods=['POST'])
+@login_required
+def write_logo():
+    """
+    Запись логотипа на текущие весы или (all_ports=1) на все весы магазина.
+    Весы, где уже стоит этот логотип, пропускаются; force=1 — писать всё равно
+    """
+    admin = get_admin_connection()
+    kind = request.form.get("kind", "logo2")
+    try:
+        data = base64.b64decode(request.form.get("data", ""), validate=True)
+    except ValueError:
+        data = b""
+    width, height = LOGO_SIZES.get(kind, (0, 0))
+    if not data or len(data) * 8 != width * height:
+        return jsonify({"success": False, "message": "Некорректные данные логотипа"}), 400
+    force = request.form.get("force") == "1"
+    verify = request.form.get("verify") != "0"
+    ports = configured_ports() if request.form.get("all_ports") == "1" else [current_port()]
+    results = push_logo_many(db, open_fanout_admin, ports, kind, data, jobs, force, verify, timeout=LOGO_WAIT)
+    failed = [port for port, result in results.items() if result == LOGO_FAILED]
+    skipped = [port for port, result in results.items() if result == LOGO_SKIPPED]
+    queued = [port for port, result in results.items() if result == LOGO_QUEUED]
+    message = f"Записано: {len(results) - len(failed) - len(skipped) - len(queued)}, уже актуален: {len(skipped)}"
+    if queued:
+        message += f", в очереди (весы заняты): {', '.join(queued)}"
+    if failed:
+        message += f", ошибка: {', '.join(failed)}"
+    return jsonify({"success": not failed, "message": message, "results": results}), 400 if failed else 200
 #endregion
 
 #region UX plu and messages management
 @app.route("/remove_plu_from_table", methods=["POST"])
 @login_required
 def remove_plu_from_table():
-    global plu_list
-    plu_id = int(request.form.get("id"))
-    plu_list = [plu for plu in plu_list if plu['id'] != plu_id]
+    remove_user_item("plu_list", int(request.form.get("id")))
     return '', 204
 
 @app.route("/remove_message_from_table", methods=["POST"])
 @login_required
 def remove_message_from_table():
-    global messages
-    msg_id = int(request.form.get("id"))
-    messages = [msg for msg in messages if msg['id'] != msg_id]
+    remove_user_item("messages", int(request.form.get("id")))
     return '', 204
 
 @app.route("/clear_plu_table", methods=["POST"])
 @login_required
 def clear_plu_table():
-    global plu_list
-    plu_list = []
+    set_user_list("plu_list", [])
     return '', 204
 
 @app.route("/clear_messages_table", methods=["POST"])
 @login_required
 def clear_messages_table():
-    global messages
-    messages = []
+    set_user_list("messages", [])
     return '', 204
 #endregion
 
@@ -9,14 +9,17 @@ from PyQt5.QtWidgets import (
     QDialogButtonBox, QStyle, QTableWidgetItem, QMenu, QTabWidget, QCheckBox
 )
 from PyQt5.QtGui import QIcon, QColor
-from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal, QMutex
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
 import serial
 import serial.tools.list_ports
 from admin import ScaleAdmin
+from admin_db import AdminDatabase
+from status_hub import StatusHub
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel, QFileDialog, QHBoxLayout, QComboBox
 from PyQt5.QtGui import QPixmap, QImage
 import functools
-#import numpy as np
+import numpy as np
+from logo_image import DITHER_METHODS, LOGO_SIZES, convert_folder, image_to_logo, preview_png
 
 
 logging.basicConfig(
@@ -34,38 +37,22 @@ def require_admin(func):
         return func(self, *args, **kwargs)
     return wrapper
 
-class StatusPoller(QThread):
+class StatusPoller(QObject):
+    """Подписка окна на общий опрос состояния весов; образцы приходят в поток GUI сигналами"""
     status_signal = pyqtSignal(int, int)  # (status_byte, weight)
-    
+    sample_signal = pyqtSignal(dict)      # полное состояние для вкладки "Текущее состояние"
+
     def __init__(self, admin):
         super().__init__()
-        self.admin = admin
-        self.mutex = QMutex()
-        self._is_running = True
-
-    def run(self):
-        while self._is_running:
-            if not self.admin.ser.is_open:
-                break
-            
-            self.mutex.lock()
-            try:
-                response = self.admin.get_status()
-                if response and len(response) >= 3:
-                    status_byte = response[0]
-                    weight = int.from_bytes(response[1:3], 'little', signed=True)
-                    self.status_signal.emit(status_byte, weight)
-                else:
-                    logging.warning("Invalid status response")
-            except Exception as e:
-                logging.error(f"Ошибка опроса: {str(e)}")
-            finally:
-                self.mutex.unlock()
-                self.msleep(1000)            
+        self.hub = StatusHub(admin.get_current_status)
+        self.hub.subscribe(self._deliver)
+
+    def _deliver(self, sample: dict):
+        self.status_signal.emit(sample["status_byte"], sample["weight"])
+        self.sample_signal.emit(sample)
 
     def stop(self):
-        self._is_running = False
-        self.wait()
+        self.hub.stop()
 
 class AdminApp(QMainWindow):
     def __init__(self):
@@ -187,7 +174,9 @@ class AdminApp(QMainWindow):
             baudrate = int(self.baud_combo.currentText())
             if not port:
                 raise ValueError("Выберите COM-порт")
-            self.admin = ScaleAdmin(port=port, baudrate=baudrate, ready_callback=self.set_ready_state)
+            # База нужна для отметок логотипов: веб-интерфейс не пропустит запись по устаревшей отметке
+            self.admin = ScaleAdmin(port=port, baudrate=baudrate, ready_callback=self.set_ready_state,
+                                    admin_db=AdminDatabase())
             if self.admin.ser.is_open:
                 self.status_label.setText("Статус: Подключено")
                 self.status_label.setStyleSheet("color: green;")
@@ -204,6 +193,11 @@ class AdminApp(QMainWindow):
                 self.current_status_tab.admin = self.admin
                 self.logo_tab.admin = self.admin
 
+                # Состояние весов обновляется само, с частотой по стабильности веса
+                self.status_poller = StatusPoller(self.admin)
+                self.status_poller.status_signal.connect(self._update_ui)
+                self.status_poller.sample_signal.connect(self.current_status_tab.show_status)
+
 
         except Exception as e:
             self.show_error(f"Ошибка подключения: {str(e)}")
@@ -988,7 +982,9 @@ class CurrentStatusTab(QWidget):
 
     @require_admin
     def update_status(self, *args, **kwargs):
-        status = self.admin.get_current_status()
+        self.show_status(self.admin.get_current_status())
+
+    def show_status(self, status: dict):
         if not status:
             self.status_byte.setText("Ошибка чтения")
             return
@@ -1019,6 +1015,11 @@ class LogoTab(QWidget):
         self.logo_type = QComboBox()
         self.logo_type.addItems(["LOGO 2 (64x64)", "Ростест (64x48)"])
         layout.addWidget(self.logo_type)
+        self.dither_method = QComboBox()
+        for method, title in DITHER_METHODS.items():
+            self.dither_method.addItem(title, method)
+        self.dither_method.setCurrentIndex(self.dither_method.findData("floyd_steinberg"))
+        layout.addWidget(self.dither_method)
 
         self.img_label = QLabel("Нет изображения")
         self.img_label.setFixedSize(256, 256)
@@ -1029,10 +1030,12 @@ class LogoTab(QWidget):
         self.btn_load = QPushButton("Загрузить из файла")
         self.btn_save = QPushButton("Сохранить в файл")
         self.btn_write = QPushButton("Записать в весы")
+        self.btn_folder = QPushButton("Перевести папку")
         btns.addWidget(self.btn_read)
         btns.addWidget(self.btn_load)
         btns.addWidget(self.btn_save)
         btns.addWidget(self.btn_write)
+        btns.addWidget(self.btn_folder)
         layout.addLayout(btns)
 
         self.setLayout(layout)
@@ -1041,9 +1044,14 @@ class LogoTab(QWidget):
         self.btn_load.clicked.connect(self.load_logo)
         self.btn_save.clicked.connect(self.save_logo)
         self.btn_write.clicked.connect(self.write_logo)
+        self.btn_folder.clicked.connect(self.convert_folder)
 
         self.logo_bytes = None
 
+    @property
+    def logo_kind(self):
+        return "logo2" if self.logo_type.currentIndex() == 0 else "logo_roste"
+
     @require_admin
     def read_logo(self, *args, **kwargs):
         if self.logo_type.currentIndex() == 0:
@@ -1071,27 +1079,37 @@ class LogoTab(QWidget):
             QMessageBox.critical(self, "Ошибка", "Ошибка записи логотипа.")
 
     def load_logo(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Открыть картинку", "", "Images (*.png *.bmp)")
+        path, _ = QFileDialog.getOpenFileName(self, "Открыть картинку", "", "Images (*.png *.bmp *.jpg *.jpeg *.gif)")
         if not path:
             return
         img = QImage(path)
-        w, h = (64, 64) if self.logo_type.currentIndex() == 0 else (64, 48)
-        img = img.convertToFormat(QImage.Format_Mono)
-        img = img.scaled(w, h)
-        # Преобразуем QImage в массив байтов
-        bits = []
-        for y in range(h):
-            for x in range(0, w, 8):
-                byte = 0
-                for b in range(8):
-                    if x + b < w:
-                        color = img.pixelColor(x + b, y)
-                        if color.black() > 0:  # чёрный пиксель
-                            byte |= (1 << (7 - b))
-                bits.append(byte)
-        self.logo_bytes = bytes(bits)
+        if img.isNull():
+            QMessageBox.critical(self, "Ошибка", "Не удалось открыть картинку.")
+            return
+        w, h = LOGO_SIZES[self.logo_kind]
+        self.logo_bytes = image_to_logo(self.image_pixels(img), self.logo_kind, self.dither_method.currentData())
         self.show_logo(self.logo_bytes, w, h)
 
+    @staticmethod
+    def image_pixels(img):
+        """QImage в массив HxWx4 (RGBA) без попиксельного обхода"""
+        img = img.convertToFormat(QImage.Format_RGBA8888)
+        ptr = img.constBits()
+        ptr.setsize(img.byteCount())
+        rows = np.frombuffer(ptr, dtype=np.uint8).reshape(img.height(), img.bytesPerLine())
+        return rows[:, :img.width() * 4].reshape(img.height(), img.width(), 4).copy()
+
+    def convert_folder(self):
+        src = QFileDialog.getExistingDirectory(self, "Папка с картинками")
+        if not src:
+            return
+        result = convert_folder(src, kind=self.logo_kind, method=self.dither_method.currentData())
+        failed = [name for name, error in result.items() if error]
+        message = f"Переведено картинок: {len(result) - len(failed)}. Рядом сохранены .bin и превью .preview.png"
+        if failed:
+            message += f"\nНе удалось открыть: {', '.join(failed)}"
+        QMessageBox.information(self, "Перевод папки", message)
+
     def save_logo(self):
         if not self.logo_bytes:
             return
@@ -1101,18 +1119,9 @@ class LogoTab(QWidget):
                 f.write(self.logo_bytes)
 
     def show_logo(self, data, w, h):
-        # Преобразуем байты обратно в QImage для отображения
-        img = QImage(w, h, QImage.Format_Mono)
-        for y in range(h):
-            for x in range(w):
-                byte_index = (y * w + x) // 8
-                bit_index = 7 - (x % 8)
-                if data[byte_index] & (1 << bit_index):
-                    img.setPixel(x, y, 1)
-                else:
-                    img.setPixel(x, y, 0)
-        pix = QPixmap.fromImage(img).scaled(256, 256)
-        self.img_label.setPixmap(pix)
+        pix = QPixmap()
+        pix.loadFromData(preview_png(bytes(data), w, h))
+        self.img_label.setPixmap(pix.scaled(256, 256))
 
 class BindKeyDialog(QDialog):
     def __init__(self, parent=None):
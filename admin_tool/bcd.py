@@ -0,0 +1,171 @@
+# bcd.py
+"""
+Кодеки упакованного BCD (две десятичные цифры в байте) и цифровых полей
+протокола (одна цифра в байте). Общие для админки и эмулятора весов.
+
+Преобразования идут через таблицы на 256 значений и bytes.translate —
+весь буфер обрабатывается за один вызов на C, без цикла по байтам.
+Для тысяч записей (выгрузка каталога, пересчёт итогов) есть пакетные
+варианты *_many: записи склеиваются, переводятся одним вызовом и режутся обратно.
+"""
+from datetime import datetime
+from itertools import chain
+
+# Значение 0-99 -> байт BCD. Остальные значения непредставимы (0xFF — только заглушка таблицы)
+BCD_ENCODE = bytes(((v // 10) << 4) | (v % 10) if v < 100 else 0xFF for v in range(256))
+# Байт BCD -> значение. Некорректные тетрады разбираются так же, как раньше: старшая * 10 + младшая
+BCD_DECODE = bytes((b >> 4) * 10 + (b & 0x0F) for b in range(256))
+
+# Цифровые поля (код товара, групповой код): символ '0'-'9' <-> байт 0-9
+DIGIT_ENCODE = bytes.maketrans(b'0123456789', bytes(range(10)))
+DIGIT_DECODE = bytes.maketrans(bytes(range(10)), b'0123456789')
+
+
+#region Пары цифр
+def to_bcd(value: int) -> int:
+    """Число 0-99 в байт BCD"""
+    if not 0 <= value <= 99:
+        raise ValueError(f"Значение {value} не помещается в байт BCD")
+    return BCD_ENCODE[value]
+
+
+def from_bcd(byte: int) -> int:
+    """Байт BCD в число 0-99"""
+    return BCD_DECODE[byte]
+
+
+def encode_pairs(values) -> bytes:
+    """Последовательность чисел 0-99 в байты BCD"""
+    raw = bytes(values)
+    if raw and max(raw) > 99:
+        raise ValueError(f"Значения {list(raw)} не помещаются в байты BCD")
+    return raw.translate(BCD_ENCODE)
+
+
+def decode_pairs(data: bytes) -> bytes:
+    """Байты BCD в числа 0-99 (элементы результата — int)"""
+    return bytes(data).translate(BCD_DECODE)
+#endregion
+
+
+#region Многозначные числа (старшие цифры первыми)
+def int_to_bcd(value: int, length: int) -> bytes:
+    """Целое число в length байт BCD; старшие цифры, не поместившиеся в поле, отбрасываются"""
+    return bytes.fromhex('%0*d' % (2 * length, value % 10 ** (2 * length)))
+
+
+def bcd_to_int(data: bytes) -> int:
+    """Байты BCD в целое число"""
+    try:
+        # У корректного BCD шестнадцатеричная запись совпадает с десятичной
+        return int(data.hex() or 0)
+    except ValueError:
+        return _bcd_to_int_slow(data)
+
+
+def _bcd_to_int_slow(data: bytes) -> int:
+    """Некорректные тетрады: побайтовый разбор, как в прежней реализации"""
+    value = 0
+    for pair in decode_pairs(data):
+        value = value * 100 + pair
+    return value
+#endregion
+
+
+#region Дата и время (сек, мин, час, день, мес, год)
+def datetime_to_bcd(dt: datetime) -> bytes:
+    """datetime в 6 байт BCD"""
+    return bytes((dt.second, dt.minute, dt.hour, dt.day, dt.month, dt.year % 100)).translate(BCD_ENCODE)
+
+
+def bcd_to_datetime(data: bytes, century: int = 2000):
+    """6 байт BCD в datetime, None — пустое или некорректное значение"""
+    return _pairs_to_datetime(decode_pairs(data), century)
+
+
+def _pairs_to_datetime(values: bytes, century: int):
+    if len(values) != 6:
+        return None
+    second, minute, hour, day, month, year = values
+    try:
+        return datetime(century + year, month, day, hour, minute, second)
+    except ValueError:
+        return None
+#endregion
+
+
+#region Цифровые поля
+def digits_to_bytes(text: str, length: int = 6) -> bytes:
+    """Строка цифр в length байт по цифре в байте (дополняется нулями слева)"""
+    raw = text.zfill(length)[:length].encode('ascii')
+    if not raw.isdigit():
+        raise ValueError(f"Поле должно содержать только цифры: {text!r}")
+    return raw.translate(DIGIT_ENCODE)
+
+
+def bytes_to_digits(data: bytes, length: int = 6) -> str:
+    """length байт по цифре в байте в строку"""
+    data = bytes(data[:length])
+    if data and max(data) > 9:
+        return ''.join(str(byte) for byte in data)
+    return data.translate(DIGIT_DECODE).decode('ascii')
+#endregion
+
+
+#region Пакетные преобразования
+def _split(buffer, lengths) -> list:
+    result = []
+    pos = 0
+    for length in lengths:
+        result.append(buffer[pos:pos + length])
+        pos += length
+    return result
+
+
+def encode_pairs_many(rows) -> list:
+    """Список последовательностей чисел 0-99 в список байтов BCD одним вызовом translate"""
+    rows = [bytes(row) for row in rows]
+    raw = b''.join(rows)
+    if raw and max(raw) > 99:
+        raise ValueError("Значения не помещаются в байты BCD")
+    return _split(raw.translate(BCD_ENCODE), map(len, rows))
+
+
+def decode_pairs_many(blobs) -> list:
+    """Список буферов BCD в список буферов чисел 0-99"""
+    blobs = [bytes(blob) for blob in blobs]
+    return _split(b''.join(blobs).translate(BCD_DECODE), map(len, blobs))
+
+
+def bcd_to_int_many(blobs) -> list:
+    """Список буферов BCD в список целых чисел"""
+    blobs = list(blobs)
+    digits = b''.join(blobs).hex()
+    if not digits.isdigit():
+        return [bcd_to_int(blob) for blob in blobs]
+    if len(set(map(len, blobs))) == 1 and blobs[0]:
+        # Поля одной длины (типичный случай) — режем строку с постоянным шагом
+        width = 2 * len(blobs[0])
+        return [int(digits[pos:pos + width]) for pos in range(0, len(digits), width)]
+    return [int(part or 0) for part in _split(digits, (2 * len(blob) for blob in blobs))]
+
+
+def int_to_bcd_many(values, length: int) -> list:
+    """Список целых чисел в список полей BCD по length байт"""
+    mod = 10 ** (2 * length)
+    encoded = bytes.fromhex(''.join(['%0*d' % (2 * length, value % mod) for value in values]))
+    return [encoded[pos:pos + length] for pos in range(0, len(encoded), length)]
+
+
+def datetime_to_bcd_many(dts) -> list:
+    """Список datetime в список 6-байтовых BCD"""
+    raw = bytes(chain.from_iterable((dt.second, dt.minute, dt.hour, dt.day, dt.month, dt.year % 100)
+                                    for dt in dts))
+    encoded = raw.translate(BCD_ENCODE)
+    return [encoded[pos:pos + 6] for pos in range(0, len(encoded), 6)]
+
+
+def bcd_to_datetime_many(blobs, century: int = 2000) -> list:
+    """Список 6-байтовых BCD в список datetime (None — некорректное значение)"""
+    return [_pairs_to_datetime(values, century) for values in decode_pairs_many(blobs)]
+#endregion
@@ -0,0 +1,146 @@
+# bench_bcd.py
+"""
+Микробенчмарк кодеков BCD: прежние побайтовые реализации против таблиц bcd.py.
+Перед замером проверяет, что результаты совпадают.
+
+    python bench_bcd.py [число записей]
+"""
+from datetime import datetime, timedelta
+import random
+import sys
+import timeit
+
+import bcd
+
+
+#region Прежние реализации (побайтовые циклы)
+def legacy_to_bcd(val):
+    return ((val // 10) << 4) | (val % 10)
+
+
+def legacy_from_bcd(b):
+    return ((b >> 4) * 10) + (b & 0x0F)
+
+
+def legacy_int_to_bcd_bytes(value, length):
+    out = []
+    for _ in range(length):
+        out.insert(0, ((value % 10) & 0x0F) | (((value // 10 % 10) << 4) & 0xF0))
+        value //= 100
+    return bytes(out)
+
+
+def legacy_bcd_bytes_to_int(data):
+    value = 0
+    for b in data:
+        value = value * 100 + ((b >> 4) & 0x0F) * 10 + (b & 0x0F)
+    return value
+
+
+def legacy_datetime_to_bcd(dt):
+    return bytes([
+        ((dt.second // 10) << 4) | (dt.second % 10),
+        ((dt.minute // 10) << 4) | (dt.minute % 10),
+        ((dt.hour // 10) << 4) | (dt.hour % 10),
+        ((dt.day // 10) << 4) | (dt.day % 10),
+        ((dt.month // 10) << 4) | (dt.month % 10),
+        ((dt.year % 100 // 10) << 4) | (dt.year % 10)
+    ])
+
+
+def legacy_bcd_to_datetime(data):
+    if len(data) != 6:
+        return None
+    values = [(b >> 4) * 10 + (b & 0x0F) for b in data]
+    try:
+        return datetime(values[5] + 2000, values[4], values[3], values[2], values[1], values[0])
+    except ValueError:
+        return None
+
+
+def legacy_str_to_bytes(s):
+    s = s.zfill(6)[:6]
+    return bytes(int(ch) for ch in s)
+
+
+def legacy_bytes_to_str(b):
+    return ''.join(str(byte) for byte in b[:6])
+#endregion
+
+
+def make_data(count: int) -> dict:
+    rnd = random.Random(1)
+    start = datetime(2020, 1, 1)
+    dates = [start + timedelta(seconds=rnd.randrange(10 ** 8)) for _ in range(count)]
+    numbers = [rnd.randrange(10 ** 6) for _ in range(count)]
+    codes = [f"{rnd.randrange(10 ** 6):06d}" for _ in range(count)]
+    return {
+        "dates": dates,
+        "date_blobs": [legacy_datetime_to_bcd(dt) for dt in dates],
+        "numbers": numbers,
+        "number_blobs": [legacy_int_to_bcd_bytes(n, 3) for n in numbers],
+        "codes": codes,
+        "code_blobs": [legacy_str_to_bytes(code) for code in codes],
+    }
+
+
+def cases(data: dict) -> list:
+    """(название, прежний вариант, новый вариант, новый пакетный вариант или None)"""
+    return [
+        ("datetime -> BCD",
+         lambda: [legacy_datetime_to_bcd(dt) for dt in data["dates"]],
+         lambda: [bcd.datetime_to_bcd(dt) for dt in data["dates"]],
+         lambda: bcd.datetime_to_bcd_many(data["dates"])),
+        ("BCD -> datetime",
+         lambda: [legacy_bcd_to_datetime(blob) for blob in data["date_blobs"]],
+         lambda: [bcd.bcd_to_datetime(blob) for blob in data["date_blobs"]],
+         lambda: bcd.bcd_to_datetime_many(data["date_blobs"])),
+        ("int -> BCD (3 байта)",
+         lambda: [legacy_int_to_bcd_bytes(n, 3) for n in data["numbers"]],
+         lambda: [bcd.int_to_bcd(n, 3) for n in data["numbers"]],
+         lambda: bcd.int_to_bcd_many(data["numbers"], 3)),
+        ("BCD -> int (3 байта)",
+         lambda: [legacy_bcd_bytes_to_int(blob) for blob in data["number_blobs"]],
+         lambda: [bcd.bcd_to_int(blob) for blob in data["number_blobs"]],
+         lambda: bcd.bcd_to_int_many(data["number_blobs"])),
+        ("код -> 6 цифр",
+         lambda: [legacy_str_to_bytes(code) for code in data["codes"]],
+         lambda: [bcd.digits_to_bytes(code) for code in data["codes"]],
+         None),
+        ("6 цифр -> код",
+         lambda: [legacy_bytes_to_str(blob) for blob in data["code_blobs"]],
+         lambda: [bcd.bytes_to_digits(blob) for blob in data["code_blobs"]],
+         None),
+    ]
+
+
+def check_equivalence():
+    """Новые кодеки дают те же байты, что и прежние, на всех входах"""
+    assert all(bcd.to_bcd(v) == legacy_to_bcd(v) for v in range(100))
+    assert all(bcd.from_bcd(b) == legacy_from_bcd(b) for b in range(256))
+    assert all(bcd.bcd_to_int(bytes([a, b])) == legacy_bcd_bytes_to_int(bytes([a, b]))
+               for a in range(256) for b in range(0, 256, 7))
+    for value in (0, 1, 99, 100, 999, 123456, 999999, 1000000, 987654321):
+        assert bcd.int_to_bcd(value, 3) == legacy_int_to_bcd_bytes(value, 3), value
+    assert bcd.bytes_to_digits(bytes([1, 12, 3])) == legacy_bytes_to_str(bytes([1, 12, 3]))
+
+
+def run(count: int, repeat: int = 5):
+    check_equivalence()
+    data = make_data(count)
+    print(f"Записей: {count}, лучшее из {repeat} прогонов, мс")
+    print(f"{'операция':<22}{'было':>10}{'стало':>10}{'пакетно':>10}{'ускорение':>11}")
+    for name, legacy, new, batch in cases(data):
+        expected = legacy()
+        assert new() == expected, name
+        if batch:
+            assert batch() == expected, name
+        times = [min(timeit.repeat(fn, number=1, repeat=repeat)) * 1000 if fn else None
+                 for fn in (legacy, new, batch)]
+        best = min(t for t in times[1:] if t is not None)
+        batch_time = f"{times[2]:>10.2f}" if times[2] is not None else f"{'—':>10}"
+        print(f"{name:<22}{times[0]:>10.2f}{times[1]:>10.2f}{batch_time}{times[0] / best:>10.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
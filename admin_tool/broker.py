@@ -0,0 +1,283 @@
+# broker.py
+"""
+Брокер весов: единственный процесс, который держит COM-порты открытыми.
+Клиенты (Flask-воркеры, фоновые синхронизации, опрос статуса) подключаются
+к нему через Unix-сокет и шлют запросы построчно в JSON:
+
+    {"id": 1, "port": "COM3", "method": "get_plu_by_id", "args": [5], "kwargs": {}}
+
+Ответ: {"id": 1, "result": ..., "ready": true} или {"id": 1, "error": "..."};
+"link_down": true в ответе с ошибкой — весы не ответили (LinkDown у клиента).
+Команды к одному порту выполняются строго по очереди (замок AsyncScaleAdmin).
+Порт, поток которого закрылся (весы отключили от USB, оборвалось TCP-соединение),
+открывается заново при следующем запросе к нему.
+"""
+import asyncio
+import base64
+from datetime import datetime
+import json
+import logging
+import os
+import socket
+import sys
+from threading import Lock, local
+from types import SimpleNamespace
+
+from admin_async import AsyncScaleAdmin
+from protocol import LinkDown, ScaleProtocol
+
+DEFAULT_SOCKET = "/tmp/scale_broker.sock"
+
+# Методы весов, которые можно вызвать через брокер
+BROKER_METHODS = {
+    "get_plu_by_id", "delete_plu_by_id", "create_plu", "reset_plu_totals",
+    "get_total_sales", "reset_total_sales",
+    "get_message_by_id", "create_message", "delete_message_by_id",
+    "get_user_settings", "set_user_settings", "get_factory_settings", "get_current_status",
+    "read_logo2", "write_logo2", "write_logo_roste",
+    "get_all_key_binds", "bind_plu_to_key", "get_plu_by_key",
+}
+
+
+#region Кодирование сообщений
+def _encode_value(value):
+    """bytes и datetime не представимы в JSON — передаём их с тегом"""
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, dict):
+        return {k: _encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode_value(v) for v in value]
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        if "__datetime__" in value:
+            return datetime.fromisoformat(value["__datetime__"])
+        return {k: _decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode_value(v) for v in value]
+    return value
+
+
+def dump_message(message: dict) -> bytes:
+    return json.dumps(_encode_value(message), ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def load_message(line: bytes) -> dict:
+    return _decode_value(json.loads(line))
+#endregion
+
+
+class ScaleBroker:
+    """Процесс-владелец портов весов"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, ports=("COM3",), baudrate: int = 9600):
+        self.socket_path = socket_path
+        self.ports = list(ports)
+        self.baudrate = baudrate
+        self._admins = {}
+        self._open_locks = {}  # порт -> asyncio.Lock: открытие одного порта не задерживает другие
+        self._ready = {}
+
+    async def _get_admin(self, port: str) -> AsyncScaleAdmin:
+        """Открывает порт при первом обращении, дальше переиспользует соединение, пока оно живо"""
+        async with self._open_locks.setdefault(port, asyncio.Lock()):
+            admin = self._admins.get(port)
+            if admin is not None and admin._writer.is_closing():
+                logging.warning(f"Соединение с {port} закрыто, открываем заново")
+                await self._drop_admin(port, admin)
+                admin = None
+            if admin is None:
+                admin = await AsyncScaleAdmin.open_serial(
+                    port, self.baudrate,
+                    ready_callback=lambda state: self._ready.__setitem__(port, state)
+                )
+                self._admins[port] = admin
+            return admin
+
+    async def _drop_admin(self, port: str, admin: AsyncScaleAdmin):
+        """Забывает соединение с портом (если оно ещё текущее) и закрывает его"""
+        if self._admins.get(port) is admin:
+            del self._admins[port]
+            self._ready[port] = False
+        await admin.close()
+
+    async def _dispatch(self, request: dict) -> dict:
+        method = request.get("method")
+        port = request.get("port") or self.ports[0]
+        if port not in self.ports:
+            raise ValueError(f"Порт {port} не обслуживается брокером")
+        if method == "info":
+            admin = await self._get_admin(port)
+            return {"port": port, "baudrate": self.baudrate, "is_open": not admin._writer.is_closing()}
+        if method not in BROKER_METHODS:
+            raise ValueError(f"Неизвестный метод: {method}")
+        admin = await self._get_admin(port)
+        try:
+            return await getattr(admin, method)(*request.get("args", []), **request.get("kwargs", {}))
+        except ConnectionError:
+            # Таймаут при живом потоке — весы молчат, порт переоткрывать незачем
+            if admin._writer.is_closing():
+                await self._drop_admin(port, admin)
+            raise
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = {}
+                try:
+                    request = load_message(line)
+                    result = await self._dispatch(request)
+                    port = request.get("port") or self.ports[0]
+                    response = {"id": request.get("id"), "result": result, "ready": self._ready.get(port, False)}
+                except Exception as e:
+                    logging.error(f"Ошибка обработки запроса {request.get('method')}: {str(e)}")
+                    response = {"id": request.get("id"), "error": str(e)}
+                    if isinstance(e, LinkDown):
+                        response["link_down"] = True
+                writer.write(dump_message(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        logging.info(f"Брокер весов слушает {self.socket_path}, порты: {', '.join(self.ports)}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for admin in list(self._admins.values()):
+                await admin.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logging.info("Брокер весов остановлен")
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerClient:
+    """
+    Синхронный прокси к брокеру с интерфейсом ScaleAdmin. Безопасен для
+    использования из нескольких потоков: у каждого потока своё соединение.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, port: str = None, ready_callback=None, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.port = port
+        self.ready_callback = ready_callback
+        self.timeout = timeout
+        self._ready_state = False
+        self._local = local()
+        self._ids_lock = Lock()
+        self._next_id = 0
+        info = self._call("info")
+        self.port = info["port"]
+        self.ser = SimpleNamespace(**info)  # совместимость с проверками admin.ser.is_open
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn:
+            sock, reader = conn
+            reader.close()
+            sock.close()
+            self._local.conn = None
+
+    def _call(self, method: str, *args, **kwargs):
+        with self._ids_lock:
+            self._next_id += 1
+            request_id = self._next_id
+        request = {"id": request_id, "port": self.port, "method": method, "args": list(args), "kwargs": kwargs}
+        try:
+            sock, reader = self._connection()
+            sock.sendall(dump_message(request))
+            line = reader.readline()
+        except OSError as e:
+            self._drop_connection()
+            raise LinkDown(f"Нет связи с брокером {self.socket_path}: {str(e)}")
+        if not line:
+            self._drop_connection()
+            raise LinkDown("Брокер закрыл соединение")
+        response = load_message(line)
+        if "error" in response:
+            raise (LinkDown if response.get("link_down") else BrokerError)(response["error"])
+        if "ready" in response:
+            self._ready_state = response["ready"]
+            if self.ready_callback:
+                self.ready_callback(self._ready_state)
+        return response["result"]
+
+    def __getattr__(self, name):
+        if name not in BROKER_METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+
+    def create_plu_many(self, plu_items):
+        """Запись товаров по одному запросу на PLU. Возвращает пары (plu, ok); нет связи — LinkDown"""
+        for plu in plu_items:
+            try:
+                yield plu, self._call("create_plu", plu, strict=True)
+            except BrokerError as e:
+                logging.error(f"Ошибка записи PLU {plu.get('id')}: {str(e)}")
+                yield plu, False
+
+    def get_plu_many(self, ids):
+        """Чтение товаров по одному запросу на PLU. Возвращает пары (id, plu); нет связи — LinkDown"""
+        for plu_id in ids:
+            try:
+                yield plu_id, self._call("get_plu_by_id", plu_id, strict=True)
+            except BrokerError as e:
+                logging.error(f"Ошибка чтения PLU {plu_id}: {str(e)}")
+                yield plu_id, {}
+
+    dump_plu = ScaleProtocol.dump_plu
+
+    def is_ready(self) -> bool:
+        return self._ready_state
+
+    def disconnect(self):
+        """Закрывает соединение с брокером; порт остаётся открытым у брокера"""
+        self._drop_connection()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    # python broker.py COM3 [COM4 ...]; путь к сокету — SCALE_BROKER_SOCKET
+    ScaleBroker(
+        socket_path=os.environ.get("SCALE_BROKER_SOCKET", DEFAULT_SOCKET),
+        ports=sys.argv[1:] or ["COM3"],
+        baudrate=int(os.environ.get("SCALE_BROKER_BAUDRATE", 9600)),
+    ).run()
@@ -0,0 +1,224 @@
+# catalog_io.py
+"""
+Импорт и экспорт каталога товаров файлами CSV и XLSX (выгрузка из учётной
+системы магазина). Файл читается потоково, пачками по IMPORT_BATCH строк:
+каждая пачка проверяется правилами каталога и записывается одной транзакцией
+(AdminDatabase.import_plu_batch), ошибки возвращаются по номерам строк файла.
+Экспорт пишет каталог вместе с итогами продаж, не собирая файл в памяти.
+
+Цена в файле — в рублях (как в форме добавления товара), в базе — в копейках.
+Для XLSX нужен пакет openpyxl, CSV работает без него.
+Из командной строки: python catalog_io.py import|export файл.csv|файл.xlsx
+"""
+import csv
+import io
+import logging
+import os
+import sys
+from decimal import Decimal, InvalidOperation
+
+from admin_db import PLU_CATALOG_FIELDS
+
+try:
+    from openpyxl import Workbook, load_workbook
+except ImportError:  # без openpyxl доступен только CSV
+    Workbook = load_workbook = None
+
+IMPORT_BATCH = 1000     # строк файла на одну транзакцию
+
+CATALOG_FORMATS = ("csv", "xlsx")
+TOTALS_FIELDS = ('last_reset', 'total_sum', 'total_weight', 'sales_count')
+EXPORT_FIELDS = PLU_CATALOG_FIELDS + TOTALS_FIELDS
+INT_FIELDS = ('id', 'expiry_type', 'tare', 'message_number', 'logo_type')
+CODE_FIELDS = ('code', 'group_code')  # 6 цифр; Excel теряет ведущие нули
+
+
+def catalog_format(filename: str) -> str:
+    """csv или xlsx по расширению файла"""
+    fmt = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    if fmt not in CATALOG_FORMATS:
+        raise ValueError(f"Неизвестный формат каталога: {filename}")
+    if fmt == "xlsx" and load_workbook is None:
+        raise RuntimeError("Для файлов XLSX нужен пакет openpyxl")
+    return fmt
+
+
+#region Импорт
+def read_csv_rows(stream, encoding: str = "utf-8-sig"):
+    """Строки CSV (файл открыт в двоичном режиме): (номер строки, {колонка: значение})"""
+    text = io.TextIOWrapper(stream, encoding=encoding, newline="")
+    header = text.readline()
+    try:
+        # Выгрузки учётных систем обычно с точкой с запятой, таблицы — с запятой
+        dialect = csv.Sniffer().sniff(header, delimiters=";,\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(_lines(header, text), dialect=dialect)
+    for row in reader:
+        yield reader.line_num, {name.strip(): value for name, value in row.items() if name}
+
+
+def _lines(header: str, text):
+    """Уже прочитанный заголовок, затем остаток файла — поток назад не перематывается"""
+    yield header
+    yield from text
+
+
+def read_xlsx_rows(stream):
+    """Строки первого листа XLSX (первая строка — заголовки), в режиме только чтения"""
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else "" for name in next(rows, ())]
+        for line, values in enumerate(rows, start=2):
+            if any(value not in (None, "") for value in values):
+                yield line, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def parse_plu_row(raw: dict) -> dict:
+    """
+    Строка файла в товар. Значения, которые не удалось привести к нужному типу,
+    остаются как есть — их отклонит проверка правилами каталога
+    """
+    plu = {}
+    for field in PLU_CATALOG_FIELDS:
+        value = raw.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if field in INT_FIELDS:
+            plu[field] = _to_int(value)
+        elif field in CODE_FIELDS:
+            plu[field] = _to_code(value)
+        elif field == "price":
+            plu[field] = _to_kopecks(value)
+        else:
+            plu[field] = "" if value is None else str(value)
+    if plu["expiry_type"] is None:
+        # Как при импорте с весов: дата дд.мм.гг или число дней
+        plu["expiry_type"] = 0 if "." in plu["expiry_value"] else 1
+    for field, default in (("message_number", 0), ("logo_type", 0), ("tare", 0)):
+        if plu[field] is None:
+            plu[field] = default
+    return plu
+
+
+def _to_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(Decimal(str(value).replace(",", ".")))
+    except (InvalidOperation, ValueError, OverflowError):
+        return value
+
+
+def _to_code(value):
+    if isinstance(value, (int, float)) and value == int(value):
+        return str(int(value)).zfill(6)
+    value = "" if value is None else str(value)
+    return value.zfill(6) if value.isdigit() else value
+
+
+def _to_kopecks(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(Decimal(str(value).replace(",", ".").replace(" ", "")) * 100)
+    except (InvalidOperation, ValueError, OverflowError):
+        return value
+
+
+def import_catalog(db, stream, fmt: str, batch: int = IMPORT_BATCH, progress=None, stop=None) -> dict:
+    """
+    Импорт каталога из потока (файл в двоичном режиме). progress(строк прочитано) —
+    после каждой пачки, stop() -> True прерывает импорт между пачками.
+    Возвращает {"total", "imported", "errors": {номер строки: [ошибки]}}
+    """
+    rows = read_xlsx_rows(stream) if fmt == "xlsx" else read_csv_rows(stream)
+    report = {"total": 0, "imported": 0, "errors": {}}
+    pending = []
+
+    def flush():
+        rejected = db.import_plu_batch(pending)
+        report["errors"].update(rejected)
+        report["imported"] += len(pending) - len(rejected)
+        pending.clear()
+        if progress:
+            progress(report["total"])
+
+    for line, raw in rows:
+        report["total"] += 1
+        if raw.get("id") in (None, ""):
+            report["errors"][line] = ["Не указан номер PLU (колонка id)"]
+        else:
+            pending.append((line, parse_plu_row(raw)))
+        if len(pending) >= batch:
+            flush()
+            if stop and stop():
+                break
+    if pending:
+        flush()
+    logging.info(f"Импорт каталога: строк {report['total']}, записано {report['imported']}, "
+                 f"с ошибками {len(report['errors'])}")
+    return report
+#endregion
+
+
+#region Экспорт
+def export_row(plu: dict) -> list:
+    row = [plu.get(field) for field in EXPORT_FIELDS]
+    price = EXPORT_FIELDS.index("price")
+    if row[price] is not None:
+        row[price] = f"{row[price] / 100:.2f}"
+    return ["" if value is None else value for value in row]
+
+
+def export_csv(db, batch: int = IMPORT_BATCH):
+    """Каталог в CSV кусками текста (для потокового ответа): заголовок, затем по batch товаров"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    # BOM — чтобы Excel открыл кириллицу без выбора кодировки
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_FIELDS)
+    for count, plu in enumerate(db.iter_plu(), start=1):
+        writer.writerow(export_row(plu))
+        if count % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_xlsx(db, path: str):
+    """Каталог в XLSX: книга в режиме только записи держит в памяти одну строку"""
+    if Workbook is None:
+        raise RuntimeError("Для файлов XLSX нужен пакет openpyxl")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("PLU")
+    sheet.append(list(EXPORT_FIELDS))
+    for plu in db.iter_plu():
+        sheet.append(export_row(plu))
+    workbook.save(path)
+#endregion
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) != 3 or sys.argv[1] not in ("import", "export"):
+        print(__doc__)
+        sys.exit(1)
+    from admin_db import AdminDatabase
+    command, path = sys.argv[1:]
+    fmt = catalog_format(path)
+    database = AdminDatabase()
+    if command == "import":
+        with open(path, "rb") as f:
+            result = import_catalog(database, f, fmt)
+        for line, errors in sorted(result["errors"].items()):
+            print(f"Строка {line}: {'; '.join(errors)}")
+    elif fmt == "xlsx":
+        export_xlsx(database, path)
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.writelines(export_csv(database))
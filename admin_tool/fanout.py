@@ -0,0 +1,117 @@
+# fanout.py
+"""
+Загрузка каталога PLU сразу на несколько весов. На каждый порт — своё задание
+общей очереди (JobExecutor) и своё задание синхронизации (sync_jobs). Загрузки
+на разные весы идут параллельно, пока хватает потоков очереди, поэтому на все
+весы уходит столько же времени, сколько на одни.
+
+Каждое задание передаётся тем же путём, что и обычная синхронизация
+(push_sync_job): ответы весов подтверждаются в базе, принятые образы попадают
+в зеркало весов, отклонённые товары — в очередь повторов.
+
+Состояние загрузки на каждые весы хранится в данных её задания, а номера
+заданий текущей загрузки — в общем состоянии базы, поэтому ход загрузки
+видит и может остановить любой процесс веб-сервера.
+"""
+import logging
+from threading import Lock
+
+from admin_db import PLU_EMPTY_RULE
+from sync_push import push_sync_job
+
+
+class FanoutSync:
+    def __init__(self, db, open_admin, jobs):
+        """
+        open_admin(port) -> (admin, close): подключение к весам и функция его освобождения.
+        jobs — общая очередь заданий
+        """
+        self.db = db
+        self.open_admin = open_admin
+        self.jobs = jobs
+        self._lock = Lock()
+
+    @property
+    def in_progress(self) -> bool:
+        return any(job and job.active for job in self._jobs().values())
+
+    def _jobs(self) -> dict:
+        """Задания последней загрузки: порт -> задание (None — уже не хранится)"""
+        return {port: self.jobs.get(job_id) for port, job_id in self.db.get_state("", "fanout_jobs", {}).items()}
+
+    def start(self, ports, kind: str = "all", ids=None):
+        """Запуск загрузки на ports. kind: all / changed / selected (ids — номера PLU)"""
+        ports = list(dict.fromkeys(ports))
+        if not ports:
+            raise ValueError("Не указаны порты весов")
+        with self._lock:
+            if self.in_progress:
+                raise RuntimeError("Загрузка на несколько весов уже идёт")
+            report = self.db.validate_plu_catalog()
+            # Полный и выборочный каталог одинаковы для всех весов — читаем один раз
+            catalog = None
+            if kind != "changed":
+                catalog = self.db.get_plu_many(ids or ()) if kind == "selected" else self.db.get_all_plu()
+            submitted = {port: self.jobs.submit("fanout", self._push, kind, catalog, report, port=port).id
+                         for port in ports}
+            self.db.set_state("", "fanout_jobs", submitted)
+        logging.info(f"Загрузка каталога ({kind}) на весы: {', '.join(ports)}")
+
+    def stop(self):
+        """Остановить загрузку; незавершённые задания можно продолжить позже"""
+        for job in self._jobs().values():
+            if job:
+                self.jobs.cancel(job.id)
+
+    def status(self) -> dict:
+        """Состояние по каждым весам и в сумме"""
+        jobs = self._jobs()
+        ports = {}
+        for port, job in jobs.items():
+            state = dict(_queued_state(), **(job.data if job else {}))
+            if job:
+                state.update(total=job.total, current=job.current)
+            state["errors"] = list(state["errors"])
+            # Снятое из очереди задание не успело обновить своё состояние
+            if (not job or not job.active) and state["state"] == "queued":
+                state["state"] = "stopped"
+            ports[port] = state
+        return {
+            "in_progress": any(job and job.active for job in jobs.values()),
+            "ports": ports,
+            "total": sum(state["total"] for state in ports.values()),
+            "current": sum(state["current"] for state in ports.values()),
+            "finished": sum(state["state"] in ("done", "failed", "stopped", "interrupted") for state in ports.values()),
+        }
+
+    def _plan(self, port: str, kind: str, catalog, report: dict):
+        """Товары к отправке на весы port и номера некорректных (без удалённых записей)"""
+        items = self.db.get_plu_differing_from_mirror(port) if catalog is None else catalog
+        invalid = [plu['id'] for plu in items if plu['id'] in report and report[plu['id']] != [PLU_EMPTY_RULE]]
+        return [plu for plu in items if plu['id'] not in report], invalid
+
+    def _push(self, job, kind: str, catalog, report: dict):
+        port = job.port
+        job.data = state = _queued_state()
+        try:
+            plan, invalid = self._plan(port, kind, catalog, report)
+            admin, close = self.open_admin(port)
+        except Exception as e:
+            logging.error(f"Загрузка на {port} не начата: {str(e)}")
+            state.update(state="failed", error=str(e))
+            return
+        state.update(state="running", invalid=len(invalid))
+        try:
+            job_id = self.db.create_sync_job("to_scales", kind, port, [plu['id'] for plu in plan])
+            catalog = {plu['id']: plu for plu in plan}
+            state["state"] = push_sync_job(self.db, admin, job, job_id, catalog, skipped=invalid)
+        except Exception as e:
+            logging.error(f"Ошибка загрузки на {port}: {str(e)}")
+            state.update(state="failed", error=str(e))
+        finally:
+            close()
+
+
+def _queued_state() -> dict:
+    return {"state": "queued", "job_id": None, "total": 0, "current": 0,
+            "errors": [], "invalid": 0, "error": None}
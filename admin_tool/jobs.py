@@ -0,0 +1,486 @@
+# jobs.py
+"""
+Очередь фоновых заданий админки: синхронизация, выгрузка каталога, импорт,
+запись логотипов. У каждого задания есть номер, состояние, прогресс и флаг
+отмены; всех их выполняет один ограниченный пул потоков.
+
+На одни весы одновременно выполняется не больше per_port заданий, остальные
+ждут своей очереди — два задания не делят линию и не затирают прогресс друг
+друга. С хранилищем ограничение общее для всех процессов: задание занимает
+весы в базе (claim_job_port). Задания без порта ограничены только размером пула.
+
+Каждое изменение задания (постановка, запуск, прогресс, завершение) получает
+сквозной номер события. Подписчик ждёт changes(after) и получает задания,
+изменившиеся после его последнего события, — так поток прогресса после
+переподключения продолжается с того места, где оборвался.
+
+С хранилищем store (AdminDatabase) номера заданий и событий выдаёт база, а
+каждое событие сохраняет снимок задания. Тогда get, list, latest и changes
+видят задания всех процессов веб-сервера (JobView), а отмена из другого
+процесса доходит до исполнителя через отметку в базе. Каждое задание в базе
+помечено исполнителем (pid и метка запуска), который раз в JOB_HEARTBEAT
+секунд подаёт по своим заданиям сигнал жизни. Незавершённые задания умершего
+процесса помечаются ошибкой и не считаются активными, поэтому не мешают
+новым заданиям на тех же весах.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+import logging
+import os
+import time
+from threading import Condition, Event, Lock, Thread
+from uuid import uuid4
+
+JOB_WORKERS = 8         # заданий одновременно на все весы
+JOB_PORT_LIMIT = 1      # заданий одновременно на одни весы
+JOB_QUEUE_MAX = 100     # ожидающих заданий, больше — отказ
+JOB_KEEP = 50           # завершённых заданий в памяти для просмотра
+JOB_RATE_WINDOW = 10    # секунд прогресса для оценки скорости и оставшегося времени
+JOB_EVENT_INTERVAL = 0.25  # не чаще одного события прогресса на задание, с
+JOB_STORE_POLL = 0.5    # секунд между проверками хранилища на события других процессов
+JOB_CANCEL_POLL = 1.0   # секунд между проверками отметки отмены в хранилище
+JOB_HEARTBEAT = 5       # секунд между сигналами жизни исполнителя по его заданиям в хранилище
+JOB_HEARTBEAT_STALE = 30  # секунд без сигнала, после которых исполнитель задания считается умершим
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_FINISHED = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Есть ли процесс pid на этой машине (на Windows os.kill не проверка, а сигнал — считаем живым)"""
+    if os.name == "nt" or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Job:
+    def __init__(self, job_id: int, name: str, port: str, fn, args, kwargs, store=None):
+        self.id = job_id
+        self.name = name
+        self.port = port
+        self.state = JOB_QUEUED
+        self.total = 0
+        self.current = 0
+        self.bytes = 0          # передано байт данных (если задание их считает)
+        self.seq = 0            # номер последнего события задания
+        self.data = {}          # подробности задания (ошибки, направление, номер sync_jobs ...)
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._store = store
+        self._cancel = Event()
+        self._cancel_checked = 0.0
+        self.suspended = False  # остановлено закрытием порта, а не пользователем: продолжится позже
+        self._finished = Event()
+        self._samples = deque()  # (время, current, bytes) за последние JOB_RATE_WINDOW секунд
+        self._notified = 0.0
+        self._notify = None      # JobExecutor._touch
+
+    @property
+    def active(self) -> bool:
+        return self.state not in JOB_FINISHED
+
+    def cancelled(self) -> bool:
+        """Запрошена отмена: задание должно завершиться при первой возможности"""
+        if not self._cancel.is_set() and self._store is not None:
+            now = time.monotonic()
+            if now - self._cancel_checked >= JOB_CANCEL_POLL:
+                self._cancel_checked = now
+                if self._store.job_cancel_requested(self.id):
+                    self._cancel.set()
+        return self._cancel.is_set()
+
+    def progress(self, current: int, total: int = None, bytes: int = None):
+        """Выполнено current из total; bytes — всего передано байт данных"""
+        self.current = current
+        if total is not None:
+            self.total = total
+        if bytes is not None:
+            self.bytes = bytes
+        now = time.monotonic()
+        self._samples.append((now, self.current, self.bytes))
+        while len(self._samples) > 2 and self._samples[1][0] <= now - JOB_RATE_WINDOW:
+            self._samples.popleft()
+        if self._notify and (now - self._notified >= JOB_EVENT_INTERVAL
+                             or self.total and self.current >= self.total):
+            self._notified = now
+            self._notify(self)
+
+    def rates(self) -> dict:
+        """Скорость по последним JOB_RATE_WINDOW секундам и оставшееся время (None — не оценить)"""
+        samples = list(self._samples)
+        if len(samples) < 2 or not self.active:
+            return {"items_per_s": 0.0, "bytes_per_s": 0.0, "eta": None}
+        started, current, sent = samples[0]
+        # До текущего момента, а не до последнего образца: при зависании линии скорость падает
+        elapsed = max(time.monotonic() - started, 1e-9)
+        items_per_s = (self.current - current) / elapsed
+        remaining = self.total - self.current
+        return {
+            "items_per_s": round(items_per_s, 1),
+            "bytes_per_s": round((self.bytes - sent) / elapsed, 1),
+            "eta": round(remaining / items_per_s) if items_per_s > 0 and remaining >= 0 else None,
+        }
+
+    def wait(self, timeout: float = None):
+        """Дождаться завершения; результат задания (None — не успело или не вернуло)"""
+        self._finished.wait(timeout)
+        return self.result
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "port": self.port,
+            "state": self.state,
+            "total": self.total,
+            "current": self.current,
+            "bytes": self.bytes,
+            "seq": self.seq,
+            **self.rates(),
+            "data": self.data,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobView:
+    """Снимок задания из хранилища (возможно, другого процесса) с теми же полями, что у Job"""
+
+    def __init__(self, snapshot: dict):
+        self._snapshot = snapshot
+        self.id = snapshot["id"]
+        self.name = snapshot.get("name")
+        self.port = snapshot.get("port")
+        self.state = snapshot.get("state", JOB_QUEUED)
+        self.total = snapshot.get("total", 0)
+        self.current = snapshot.get("current", 0)
+        self.bytes = snapshot.get("bytes", 0)
+        self.seq = snapshot.get("seq", 0)
+        self.data = snapshot.get("data") or {}
+        self.result = snapshot.get("result")
+        self.error = snapshot.get("error")
+
+    @property
+    def active(self) -> bool:
+        return self.state not in JOB_FINISHED
+
+    def rates(self) -> dict:
+        """Скорость на момент снимка"""
+        if not self.active:
+            return {"items_per_s": 0.0, "bytes_per_s": 0.0, "eta": None}
+        return {key: self._snapshot.get(key) for key in ("items_per_s", "bytes_per_s", "eta")}
+
+    def to_dict(self) -> dict:
+        return dict(self._snapshot, **self.rates())
+
+
+class JobExecutor:
+    def __init__(self, workers: int = JOB_WORKERS, per_port: int = JOB_PORT_LIMIT,
+                 queue_max: int = JOB_QUEUE_MAX, keep: int = JOB_KEEP, store=None):
+        """store — общее хранилище снимков для нескольких процессов (None — только этот процесс)"""
+        self.per_port = per_port
+        self.queue_max = queue_max
+        self.keep = keep
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = Lock()
+        self._changed = Condition(self._lock)
+        self._publish_lock = Lock()
+        self._ids = count(1)
+        self._events = count(1)
+        self._last_event = 0      # номер последнего события по всем заданиям
+        self._jobs = {}           # номер -> Job (активные и последние завершённые)
+        self._pending = deque()   # ожидающие по порядку постановки
+        self._running = {}        # порт -> число выполняемых заданий
+        self._dirty = {}          # номер -> Job, снимок которого ещё не сохранён в хранилище
+        self.owner = f"{os.getpid()}:{uuid4().hex[:8]}"  # исполнитель заданий в хранилище
+        self._stop = Event()
+        if store is not None:
+            self._reap(store.get_job_states(active=True))
+            Thread(target=self._heartbeat, daemon=True).start()
+
+    @property
+    def last_event(self) -> int:
+        """Номер последнего события по всем заданиям (с хранилищем — всех процессов)"""
+        return self.store.last_job_event() if self.store is not None else self._last_event
+
+    def submit(self, name: str, fn, *args, port: str = None, unique: bool = False, **kwargs) -> Job:
+        """
+        Поставить fn(job, *args, **kwargs) в очередь. unique — если на этом порту уже
+        есть активное задание name, вернуть его вместо нового
+        """
+        with self._lock:
+            if unique:
+                existing = self._find_active(name, port)
+                if existing:
+                    return existing
+            if len(self._pending) >= self.queue_max:
+                raise RuntimeError("Очередь заданий переполнена")
+            # Номер из хранилища общий для всех процессов
+            job_id = self.store.create_job_state(name, port, self.owner) if self.store is not None else next(self._ids)
+            job = Job(job_id, name, port, fn, args, kwargs, self.store)
+            job._notify = self._touch
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._event(job)
+            self._dispatch()
+        self._publish()
+        logging.info(f"Задание {job.id} ({name}{', ' + port if port else ''}) поставлено в очередь")
+        return job
+
+    def cancel(self, job_id: int, suspend: bool = False) -> bool:
+        """
+        Отмена: ожидающее задание снимается сразу, выполняемое — по флагу cancelled().
+        suspend — остановка не по просьбе пользователя (закрытие порта, выход): задание
+        видит job.suspended и сохраняет свою работу для продолжения
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            cancelled = bool(job and job.active)
+            if cancelled:
+                job.suspended = job.suspended or suspend
+                job._cancel.set()
+                if job.state == JOB_QUEUED:
+                    self._pending.remove(job)
+                    self._finish(job, JOB_CANCELLED)
+        if job is None and self.store is not None:
+            # Задание другого процесса: его исполнитель увидит отметку в cancelled()
+            return self.store.request_job_cancel(job_id)
+        self._publish()
+        return cancelled
+
+    def cancel_all(self, name: str = None, port: str = None, local: bool = False, suspend: bool = False) -> int:
+        """
+        Отменить все активные задания (с фильтром по имени и порту).
+        local — только задания этого процесса, например при закрытии его порта;
+        suspend — см. cancel
+        """
+        if local:
+            names = (name,) if isinstance(name, str) else name
+            with self._lock:
+                jobs = [job for job in self._jobs.values() if self._matches(job, names, port, True)]
+        else:
+            jobs = self.list(name, port, active=True)
+        return sum(self.cancel(job.id, suspend) for job in jobs)
+
+    def get(self, job_id: int):
+        if self.store is not None:
+            states = self.store.get_job_states(job_id=job_id)
+            return JobView(states[0]) if states else None
+        return self._jobs.get(job_id)
+
+    def list(self, name: str = None, port: str = None, active: bool = None) -> list:
+        """Задания по порядку постановки; фильтры по имени (строка или кортеж), порту и активности"""
+        names = (name,) if isinstance(name, str) else name
+        if self.store is not None:
+            states = self._reap(self.store.get_job_states(names, port, active))
+            return [JobView(state) for state in states
+                    if active is None or (state["state"] not in JOB_FINISHED) == active]
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if self._matches(job, names, port, active)]
+
+    def changes(self, after: int, name=None, port: str = None, timeout: float = None) -> list:
+        """
+        Задания (фильтры как у list), изменившиеся после события after, по порядку событий.
+        Если таких нет, ждёт до timeout секунд; пустой список — изменений не было
+        """
+        names = (name,) if isinstance(name, str) else name
+        if self.store is not None:
+            return self._store_changes(after, names, port, timeout)
+        def changed():
+            return sorted((job for job in self._jobs.values()
+                           if job.seq > after and self._matches(job, names, port, None)),
+                          key=lambda job: job.seq)
+        with self._changed:
+            return self._changed.wait_for(changed, timeout)
+
+    def _store_changes(self, after: int, names, port: str, timeout: float) -> list:
+        """События из хранилища: свои задания будят сразу, чужие видны с опросом JOB_STORE_POLL"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            states = self.store.get_job_states(names, port, after=after)
+            if states:
+                return [JobView(state) for state in states]
+            wait = JOB_STORE_POLL if deadline is None else min(deadline - time.monotonic(), JOB_STORE_POLL)
+            if wait <= 0:
+                return []
+            with self._changed:
+                self._changed.wait(wait)
+
+    def latest(self, name=None, port: str = None):
+        """Последнее задание name на порту port (None — не было)"""
+        jobs = self.list(name, port)
+        return jobs[-1] if jobs else None
+
+    def shutdown(self):
+        self._stop.set()
+        self.cancel_all(local=True)
+        self._pool.shutdown(wait=False)
+
+    def _claim(self, job: Job) -> bool:
+        """Под замком: место на весах задания среди заданий всех процессов (без хранилища — всегда есть)"""
+        if self.store is None:
+            return True
+        try:
+            return self.store.claim_job_port(job.id, job.port, self.per_port, time.time() - JOB_HEARTBEAT_STALE)
+        except Exception as e:
+            logging.error(f"Не удалось занять весы {job.port} для задания {job.id}: {str(e)}")
+            return False
+
+    def _heartbeat(self):
+        """
+        Пока исполнитель работает: сигнал жизни по заданиям этого процесса и запуск
+        ожидающих заданий, чьи весы освободил другой процесс
+        """
+        beat = time.monotonic()
+        while not self._stop.wait(JOB_STORE_POLL):
+            if self._pending:
+                with self._lock:
+                    self._dispatch()
+                self._publish()
+            if time.monotonic() - beat < JOB_HEARTBEAT:
+                continue
+            beat = time.monotonic()
+            try:
+                self.store.beat_job_states(self.owner)
+            except Exception as e:
+                logging.error(f"Сигнал жизни заданий не сохранён: {str(e)}")
+
+    def _alive(self, state: dict) -> bool:
+        """Работает ли исполнитель незавершённого задания из хранилища"""
+        owner = state.get("owner")
+        if owner == self.owner:
+            return True
+        # Задания старой базы без исполнителя и задания без свежего сигнала брошены
+        if not owner or (state.get("heartbeat") or 0) < time.time() - JOB_HEARTBEAT_STALE:
+            return False
+        return _pid_alive(int(owner.split(":")[0]))
+
+    def _reap(self, states: list) -> list:
+        """Помечает ошибкой незавершённые задания умерших процессов; возвращает states с их новым состоянием"""
+        dead = [state for state in states if state["state"] not in JOB_FINISHED and not self._alive(state)]
+        if dead:
+            try:
+                failed = self.store.fail_job_states(state["id"] for state in dead)
+            except Exception as e:
+                logging.error(f"Брошенные задания не отмечены: {str(e)}")
+            else:
+                if failed:
+                    logging.warning(f"Заданий умерших процессов помечено брошенными: {failed}")
+            for state in dead:
+                state["state"] = JOB_FAILED
+        return states
+
+    @staticmethod
+    def _matches(job: Job, names, port: str, active: bool) -> bool:
+        return ((names is None or job.name in names)
+                and (port is None or job.port == port)
+                and (active is None or job.active == active))
+
+    def _event(self, job: Job):
+        """Новый номер события задания и пробуждение подписчиков. Вызывать под замком"""
+        if self.store is not None:
+            self._dirty[job.id] = job  # номер события выдаст хранилище в _publish
+            return
+        job.seq = self._last_event = next(self._events)
+        self._changed.notify_all()
+
+    def _touch(self, job: Job):
+        with self._lock:
+            self._event(job)
+        self._publish()
+
+    def _publish(self):
+        """Сохраняет снимки изменившихся заданий вне замка очереди: запись в базу может ждать"""
+        if self.store is None:
+            return
+        with self._publish_lock:
+            with self._lock:
+                dirty, self._dirty = list(self._dirty.values()), {}
+            for job in dirty:
+                try:
+                    seq = self.store.save_job_state(job.id, job.to_dict(), self.keep)
+                except Exception as e:
+                    logging.error(f"Состояние задания {job.id} не сохранено: {str(e)}")
+                    continue
+                with self._lock:
+                    job.seq = seq
+                    self._last_event = max(self._last_event, seq)
+                    self._changed.notify_all()
+
+    def _find_active(self, name: str, port: str):
+        """Под замком; с хранилищем ищет и среди заданий других процессов"""
+        for job in self._jobs.values():
+            if job.name == name and job.port == port and job.active:
+                return job
+        if self.store is not None:
+            # Задание умершего процесса уже не выполнится — вместо него ставится новое
+            states = [state for state in self._reap(self.store.get_job_states((name,), port, active=True))
+                      if state["state"] not in JOB_FINISHED]
+            return JobView(states[0]) if states else None
+        return None
+
+    def _dispatch(self):
+        """Запускает ожидающие задания, для которых есть место на их весах. Вызывать под замком"""
+        for job in list(self._pending):
+            if job.port is not None and self._running.get(job.port, 0) >= self.per_port:
+                continue
+            if job.port is not None and not self._claim(job):
+                continue  # весы заняты заданием другого процесса — повторим в _heartbeat
+            self._pending.remove(job)
+            job.state = JOB_RUNNING
+            job.started_at = time.time()
+            self._event(job)
+            if job.port is not None:
+                self._running[job.port] = self._running.get(job.port, 0) + 1
+            self._pool.submit(self._run, job)
+
+    def _run(self, job: Job):
+        self._publish()  # запуск задания
+        state = JOB_DONE
+        try:
+            job.result = job._fn(job, *job._args, **job._kwargs)
+        except Exception as e:
+            state = JOB_FAILED
+            job.error = str(e)
+            logging.error(f"Задание {job.id} ({job.name}) завершилось ошибкой: {str(e)}")
+        if state == JOB_DONE and job.cancelled():
+            state = JOB_CANCELLED
+        with self._lock:
+            if job.port is not None:
+                self._running[job.port] -= 1
+            self._finish(job, state)
+            self._dispatch()
+        self._publish()
+
+    def _finish(self, job: Job, state: str):
+        """Под замком: итоговое состояние и удаление старых завершённых заданий"""
+        job.state = state
+        job.finished_at = time.time()
+        job._fn = job._args = job._kwargs = None
+        job._finished.set()
+        self._event(job)
+        finished = [job_id for job_id, item in self._jobs.items() if not item.active]
+        for job_id in finished[:max(len(finished) - self.keep, 0)]:
+            del self._jobs[job_id]
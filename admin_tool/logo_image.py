@@ -0,0 +1,258 @@
+# logo_image.py
+"""
+Преобразование картинок в логотипы весов и обратно, общее для PyQt и Flask.
+
+Логотип — монохромный растр по строкам, 8 точек в байте, старший бит слева,
+1 — чёрная точка: LOGO 2 — 64x64 (512 байт), Ростест — 64x48 (384 байта).
+Упаковка и распаковка — numpy.packbits / unpackbits, полутона передаются
+сглаживанием (Флойд — Стейнберг или упорядоченное по матрице Байера).
+Папку картинок можно перевести одним вызовом: python logo_image.py папка [куда]
+"""
+from functools import lru_cache
+import logging
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow картинку нужно передавать готовым массивом (например, из QImage)
+    Image = None
+
+LOGO_SIZES = {
+    "logo2": (64, 64),
+    "logo_roste": (64, 48),
+}
+DITHER_METHODS = {
+    "threshold": "Порог",
+    "floyd_steinberg": "Флойд — Стейнберг",
+    "ordered": "Упорядоченное (Байер)",
+}
+IMAGE_EXTENSIONS = (".png", ".bmp", ".jpg", ".jpeg", ".gif")
+PREVIEW_SUFFIX = ".preview.png"  # превью, сохранённые convert_folder, — не исходные картинки
+FS_BATCH_MIN = 8  # с какого размера пачки сглаживание Флойда — Стейнберга векторизуется по картинкам
+
+_BAYER_8 = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.float32)
+_BAYER_THRESHOLD = (_BAYER_8 + 0.5) * (256 / 64)
+
+
+#region Загрузка и подготовка
+def load_gray(source, width: int, height: int) -> np.ndarray:
+    """Картинка (путь, PIL.Image или массив) в оттенки серого width x height, float32 0-255"""
+    if isinstance(source, np.ndarray):
+        return resize_gray(to_gray(source), width, height)
+    if Image is None:
+        raise RuntimeError("Для чтения файлов изображений нужен пакет Pillow")
+    image = Image.open(source) if isinstance(source, (str, bytes, os.PathLike)) or hasattr(source, "read") else source
+    if image.mode in ("RGBA", "LA", "P"):
+        # Прозрачный фон считаем белым
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert("RGBA"))
+    image = image.convert("L").resize((width, height), Image.LANCZOS)
+    return np.asarray(image, dtype=np.float32)
+
+
+def to_gray(pixels: np.ndarray) -> np.ndarray:
+    """Массив HxW, HxWx3 или HxWx4 в оттенки серого (прозрачное — белое)"""
+    pixels = np.asarray(pixels, dtype=np.float32)
+    if pixels.ndim == 2:
+        return pixels
+    gray = pixels[..., :3] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    if pixels.shape[-1] == 4:
+        alpha = pixels[..., 3] / 255
+        gray = gray * alpha + 255 * (1 - alpha)
+    return gray
+
+
+def resize_gray(gray: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Масштабирование усреднением по областям (уменьшение) или ближайшей точкой (увеличение)"""
+    h, w = gray.shape
+    if (w, h) == (width, height):
+        return gray
+    # Начала областей исходника для каждой точки результата. При увеличении начала
+    # повторяются, и reduceat берёт одну точку — получается ближайший сосед
+    ys = np.arange(height) * h // height
+    xs = np.arange(width) * w // width
+    sums = np.add.reduceat(np.add.reduceat(gray.astype(np.float64), ys, axis=0), xs, axis=1)
+    counts = np.outer(np.maximum(np.diff(ys, append=h), 1), np.maximum(np.diff(xs, append=w), 1))
+    return (sums / counts).astype(np.float32)
+#endregion
+
+
+#region Сглаживание
+def dither(gray: np.ndarray, method: str = "floyd_steinberg") -> np.ndarray:
+    """
+    Оттенки серого (HxW или NxHxW для пачки картинок) в маску чёрных точек.
+    Пачка обрабатывается одним проходом — векторно по всем картинкам сразу
+    """
+    if method == "threshold":
+        return gray < 128
+    if method == "ordered":
+        h, w = gray.shape[-2:]
+        threshold = np.tile(_BAYER_THRESHOLD, (h // 8 + 1, w // 8 + 1))[:h, :w]
+        return gray < threshold
+    if method == "floyd_steinberg":
+        return _floyd_steinberg(gray)
+    raise ValueError(f"Неизвестный способ сглаживания: {method}")
+
+
+def _floyd_steinberg(gray: np.ndarray) -> np.ndarray:
+    """Рассеивание ошибки построчно; внутри строки — по точкам, векторно по пачке картинок"""
+    single = gray.ndim == 2
+    work = np.array(gray[None] if single else gray, dtype=np.float32)
+    n, h, w = work.shape
+    if n < FS_BATCH_MIN:
+        # На одной картинке скалярные операции numpy дороже самой арифметики
+        black = np.stack([_floyd_steinberg_one(image.tolist()) for image in work])
+        return black[0] if single else black
+    black = np.zeros(work.shape, dtype=bool)
+    for y in range(h):
+        row = work[:, y]
+        below = work[:, y + 1] if y + 1 < h else None
+        for x in range(w):
+            old = row[:, x]
+            dark = old < 128
+            black[:, y, x] = dark
+            error = old - np.where(dark, 0, 255)
+            if x + 1 < w:
+                row[:, x + 1] += error * (7 / 16)
+            if below is not None:
+                if x > 0:
+                    below[:, x - 1] += error * (3 / 16)
+                below[:, x] += error * (5 / 16)
+                if x + 1 < w:
+                    below[:, x + 1] += error * (1 / 16)
+    return black[0] if single else black
+
+
+def _floyd_steinberg_one(rows: list) -> np.ndarray:
+    """Флойд — Стейнберг для одной картинки на списках float"""
+    h, w = len(rows), len(rows[0])
+    black = []
+    for y in range(h):
+        row = rows[y]
+        below = rows[y + 1] if y + 1 < h else [0.0] * (w + 1)
+        line = [False] * w
+        for x in range(w):
+            old = row[x]
+            if old < 128:
+                line[x] = True
+                error = old
+            else:
+                error = old - 255
+            if x + 1 < w:
+                row[x + 1] += error * 0.4375
+                below[x + 1] += error * 0.0625
+            if x:
+                below[x - 1] += error * 0.1875
+            below[x] += error * 0.3125
+        black.append(line)
+    return np.array(black, dtype=bool)
+#endregion
+
+
+#region Упаковка
+def pack(black: np.ndarray) -> bytes:
+    """Маска чёрных точек HxW (или пачка NxHxW) в байты логотипа"""
+    return np.packbits(black, axis=-1).tobytes()
+
+
+def unpack(data: bytes, width: int, height: int) -> np.ndarray:
+    """Байты логотипа в маску чёрных точек HxW"""
+    bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+    return bits[:width * height].reshape(height, width).astype(bool)
+
+
+def image_to_logo(source, kind: str = "logo2", method: str = "floyd_steinberg") -> bytes:
+    """Картинка в растр логотипа kind (LOGO 2 или Ростест)"""
+    width, height = LOGO_SIZES[kind]
+    return pack(dither(load_gray(source, width, height), method))
+#endregion
+
+
+#region Превью
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+@lru_cache(maxsize=256)
+def preview_png(data: bytes, width: int, height: int, scale: int = 4) -> bytes:
+    """PNG-превью логотипа, увеличенное в scale раз (кэшируется по содержимому)"""
+    black = unpack(data, width, height)
+    if scale > 1:
+        black = black.repeat(scale, axis=0).repeat(scale, axis=1)
+    # В PNG с 1 битом на точку 1 — белый, поэтому маску инвертируем
+    rows = np.packbits(~black, axis=1)
+    raw = np.hstack([np.zeros((rows.shape[0], 1), dtype=np.uint8), rows]).tobytes()  # фильтр 0 у каждой строки
+    header = struct.pack(">IIBBBBB", black.shape[1], black.shape[0], 1, 0, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header)
+            + _png_chunk(b"IDAT", zlib.compress(raw, 9)) + _png_chunk(b"IEND", b""))
+
+
+def logo_preview(data: bytes, scale: int = 4) -> bytes:
+    """PNG-превью логотипа, размер определяется по длине данных"""
+    for width, height in LOGO_SIZES.values():
+        if len(data) * 8 == width * height:
+            return preview_png(bytes(data), width, height, scale)
+    raise ValueError(f"Неизвестная длина логотипа: {len(data)} байт")
+#endregion
+
+
+#region Пакетная обработка
+def convert_folder(src_dir: str, dst_dir: str = None, kind: str = "logo2",
+                   method: str = "floyd_steinberg") -> dict:
+    """
+    Переводит все картинки папки в логотипы: рядом кладёт <имя>.bin и превью <имя>.preview.png
+    (исходные картинки не перезаписываются, превью прошлых запусков пропускаются).
+    Сглаживание выполняется одним проходом по всей пачке. Возвращает {файл: ошибка или None}
+    """
+    dst_dir = dst_dir or src_dir
+    os.makedirs(dst_dir, exist_ok=True)
+    width, height = LOGO_SIZES[kind]
+    names, grays, result = [], [], {}
+    for name in sorted(os.listdir(src_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS) or name.lower().endswith(PREVIEW_SUFFIX):
+            continue
+        try:
+            grays.append(load_gray(os.path.join(src_dir, name), width, height))
+            names.append(name)
+        except Exception as e:
+            logging.error(f"Не удалось открыть {name}: {str(e)}")
+            result[name] = str(e)
+    if not names:
+        return result
+    logos = pack(dither(np.stack(grays), method))
+    size = width * height // 8
+    for i, name in enumerate(names):
+        data = logos[i * size:(i + 1) * size]
+        base = os.path.join(dst_dir, os.path.splitext(name)[0])
+        with open(base + ".bin", "wb") as f:
+            f.write(data)
+        with open(base + PREVIEW_SUFFIX, "wb") as f:
+            f.write(preview_png(data, width, height))
+        result[name] = None
+    logging.info(f"Переведено логотипов: {len(names)} из {len(result)}")
+    return result
+#endregion
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    # python logo_image.py папка [куда] [logo2|logo_roste] [floyd_steinberg|ordered|threshold]
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+    convert_folder(args[0], *(args[1:2] or [None]), *args[2:4])
@@ -0,0 +1,104 @@
+# logo_store.py
+"""
+Запись логотипов с учётом того, что уже стоит на весах. Логотипы хранятся в
+базе по хешу содержимого (logo_store), для каждых весов запоминается хеш
+последнего записанного или прочитанного логотипа (scale_logos). Если на весах
+уже тот же логотип, запись пропускается — при повторной раскатке оформления на
+магазин это экономит 512 (LOGO 2) или 384 (Ростест) байта на каждые весы.
+
+LOGO 2 можно прочитать командой 0x97: каждое чтение подтверждает отметку,
+а verify (по умолчанию) перед пропуском сверяет неподтверждённую отметку с весами.
+Логотип Ростест по протоколу только записывается, ему верим по отметке.
+
+ScaleAdmin с базой (admin_db) сам ведёт отметки при любой записи и чтении
+логотипа, в том числе из окна PyQt; здесь отметки ставятся только за
+подключения без базы (брокер).
+"""
+import logging
+import time
+
+from admin_db import logo_hash
+
+LOGO_WRITERS = {
+    "logo2": "write_logo2",
+    "logo_roste": "write_logo_roste",
+}
+LOGO_READERS = {
+    "logo2": "read_logo2",
+}
+
+# Итог записи на одни весы
+LOGO_SKIPPED = "skipped"
+LOGO_WRITTEN = "written"
+LOGO_FAILED = "failed"
+LOGO_QUEUED = "queued"   # задание записи ещё ждёт своей очереди на весах
+
+
+def _keeps_marks(admin) -> bool:
+    """Подключение само записывает отметки scale_logos (ScaleAdmin с базой, в т.ч. через планировщик)"""
+    return getattr(admin, "db", None) is not None
+
+
+def read_scale_logo(admin, db, port: str, kind: str = "logo2", refresh: bool = False) -> bytes:
+    """Чтение логотипа с весов; прочитанное запоминается как подтверждённое. b'' — ошибка"""
+    if kind not in LOGO_READERS:
+        raise ValueError(f"Логотип {kind} с весов не читается")
+    data = getattr(admin, LOGO_READERS[kind])(refresh=refresh)
+    if data and not _keeps_marks(admin):
+        db.set_scale_logo(port, kind, data, verified=True)
+    return data
+
+
+def push_logo(admin, db, port: str, kind: str, data: bytes, force: bool = False, verify: bool = True) -> str:
+    """
+    Запись логотипа на весы port, если там другой. Возвращает LOGO_SKIPPED,
+    LOGO_WRITTEN или LOGO_FAILED. force — писать без сверки; verify=False — верить
+    неподтверждённой отметке без чтения LOGO 2
+    """
+    data = bytes(data)
+    digest = logo_hash(data)
+    known = db.get_scale_logo(port, kind)
+    if not force and known and known["hash"] == digest:
+        if known["verified"] or not verify or kind not in LOGO_READERS:
+            logging.info(f"Логотип {kind} уже на весах {port}, запись пропущена")
+            return LOGO_SKIPPED
+        if logo_hash(read_scale_logo(admin, db, port, kind, refresh=True)) == digest:
+            logging.info(f"Логотип {kind} на весах {port} подтверждён чтением, запись пропущена")
+            return LOGO_SKIPPED
+    keeps_marks = _keeps_marks(admin)
+    if not getattr(admin, LOGO_WRITERS[kind])(data):
+        if not keeps_marks:
+            db.forget_scale_logo(port, kind)  # после ошибки записи содержимое весов неизвестно
+        logging.error(f"Ошибка записи логотипа {kind} на весы {port}")
+        return LOGO_FAILED
+    if not keeps_marks:
+        db.set_scale_logo(port, kind, data)
+    logging.info(f"Логотип {kind} записан на весы {port}")
+    return LOGO_WRITTEN
+
+
+def push_logo_many(db, open_admin, ports, kind: str, data: bytes, jobs, force: bool = False,
+                   verify: bool = True, timeout: float = None) -> dict:
+    """
+    Раскатка логотипа на несколько весов: на каждые весы — задание общей очереди jobs.
+    open_admin(port) -> (admin, close), как у FanoutSync. Ждёт все задания не дольше
+    timeout секунд в сумме; возвращает {порт: итог}, LOGO_QUEUED — задание ещё не выполнено
+    """
+    def push(job):
+        try:
+            admin, close = open_admin(job.port)
+        except Exception as e:
+            logging.error(f"Логотип на {job.port} не записан: {str(e)}")
+            return LOGO_FAILED
+        try:
+            return push_logo(admin, db, job.port, kind, data, force, verify)
+        finally:
+            close()
+
+    submitted = [jobs.submit("logo", push, port=port) for port in dict.fromkeys(ports)]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    results = {}
+    for job in submitted:
+        job.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        results[job.port] = job.result or (LOGO_QUEUED if job.active else LOGO_FAILED)
+    return results
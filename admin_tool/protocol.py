@@ -0,0 +1,417 @@
+# protocol.py
+import logging
+
+import bcd
+
+
+# --- Константы команд и длин ---
+COMMANDS = {
+    "read_logo2": b'\x97',
+    "write_logo2": b'\x8C',
+    "write_logo_roste": b'\x93',
+    "read_user_settings": b'\x95',
+    "write_user_settings": b'\x8A',
+    "read_factory_settings": b'\x9B',
+    "get_status": b'\x89',
+    "get_plu": b'\x81',
+    "delete_plu": b'\x8D',
+    "create_plu": b'\x82',
+    "get_message": b'\x83',
+    "create_message": b'\x84',
+    "delete_message": b'\x8E',
+    "reset_plu_totals": b'\x92',
+    "get_total_sales": b'\x85',
+    "reset_total_sales": b'\x86',
+    "bind_plu_to_key" : b'\x8B',
+    "get_plu_by_key" : b'\x96'
+
+}
+
+LENGTHS = {
+    "logo2": 512,
+    "logo_roste": 384,
+    "user_settings": 9,
+    "factory_settings": 13,
+    "current_status": 15,
+    "plu": 100,
+    "message": 400,
+    "plu_write": 83,
+    "message_write": 402,
+    "total_sales": 40,
+    "plu_code" : 4,
+}
+
+ERROR_RESPONSE = b'\xEE'
+READY_BYTE = b'\x80'
+
+PLU_MAX = 4000  # номера PLU на весах: 1..4000
+PLU_NAME_LEN = 28       # символов в строке названия товара
+PLU_NAME_LEN_LOGO = 24  # ... если в строке есть логотип (остальные байты — сертификат)
+MESSAGE_NUMBER_MAX = 1000  # номер сообщения в товаре: 0..1000
+PIPELINE_WINDOW = 8  # команд конвейера подряд под одним захватом линии
+
+
+class LinkDown(ConnectionError):
+    """
+    Весы не отвечают: таймаут команды или разомкнутый предохранитель линии.
+    В отличие от отказа весов (b'\xEE') ничего не говорит о самой команде,
+    поэтому массовые операции прерываются, а не помечают товары ошибочными
+    """
+
+
+class ScaleProtocol:
+    """
+    Кодирование и разбор пакетов протокола, общие для синхронного (ScaleAdmin)
+    и асинхронного (AsyncScaleAdmin) клиентов. Транспорт реализуют наследники,
+    они же хранят приёмный буфер self._rx.
+    """
+    ready_callback = None
+
+    def _set_ready(self, state: bool):
+        if self.ready_callback:
+            self.ready_callback(state)
+
+    def _parse_response(self, expected_len: int):
+        """
+        Разбирает приёмный буфер. Возвращает данные ответа (b'' для подтверждения),
+        ERROR_RESPONSE при ошибке или None, если ответ ещё не получен целиком.
+        """
+        rx = self._rx
+        if expected_len:
+            if len(rx) < 2:
+                return None
+            # Ошибка — это b'\xEE' сразу с байтом готовности; данные тоже могут начинаться с 0xEE
+            if rx[0] == ERROR_RESPONSE[0] and rx[1] == READY_BYTE[0]:
+                del rx[:2]
+                logging.error("Ошибка выполнения команды (b'\\xEE')")
+                self._set_ready(True)
+                return ERROR_RESPONSE
+            if len(rx) <= expected_len:
+                return None
+            response = bytes(rx[:expected_len])
+            ready = rx[expected_len]
+            del rx[:expected_len + 1]
+            self._set_ready(ready == READY_BYTE[0])
+            return response
+
+        while rx:
+            byte = rx[0]
+            if byte == READY_BYTE[0]:
+                del rx[:1]
+                self._set_ready(True)
+                return b''
+            if byte == ERROR_RESPONSE[0]:
+                if len(rx) < 2:
+                    return None
+                ready = rx[1]
+                del rx[:2]
+                logging.error("Ошибка выполнения команды (b'\\xEE')")
+                self._set_ready(ready == READY_BYTE[0])
+                return ERROR_RESPONSE
+            logging.debug(f"Пропущен байт: {byte:02x}")
+            self._count_skipped(1)
+            del rx[:1]
+        return None
+
+    def _count_skipped(self, count: int):
+        """Учёт байтов, пропущенных вне ответа (телеметрия линии); по умолчанию не ведётся"""
+
+    def _check_response(self, response: bytes, expected_len: int, context: str = "") -> bool:
+        if not response or len(response) != expected_len:
+            logging.error(f"Некорректный ответ {context}: {len(response) if response else 0} байт")
+            return False
+        return True
+
+    # region PLU Operations
+    def _decode_plu(self, response: bytes) -> dict:
+        """Разбор 100-байтового ответа на чтение PLU"""
+        return {
+            'id': int.from_bytes(response[0:4], 'little'),
+            'code': self._bytes_to_str(response[4:10]),
+            'name1': self._decode_name(response[10:38]),
+            'name2': self._decode_name(response[38:66]),
+            'price': int.from_bytes(response[66:70], 'little'),
+            'expiry': self._parse_expiry(response[70:73]),
+            'tare': int.from_bytes(response[73:75], 'little'),
+            'group_code': self._bytes_to_str(response[75:81]),
+            'message_number': int.from_bytes(response[81:83], 'little'),
+            'last_reset': self.bcd_to_datetime(response[83:89]),
+            'total_sum': int.from_bytes(response[89:93], 'little'),
+            'total_weight': int.from_bytes(response[93:97], 'little'),
+            'sales_count': int.from_bytes(response[97:100], 'little'),
+        }
+
+    def _encode_plu(self, data: dict) -> bytes:
+        """Кодирование данных товара согласно протоколу"""
+        expire_type = data.get('expiry_type')
+        expiry = data.get('expiry_value')
+        if expire_type == 0:
+            day, month, year = map(int, expiry.split('.'))
+            expiry_bytes = bcd.encode_pairs((day, month, year))
+        elif expire_type == 1:
+            days = int(expiry)
+            expiry_bytes = bcd.encode_pairs((0, days // 100, days % 100))
+        else:
+            raise ValueError(f"expire_type должен быть 0 (дата) или 1 (дни) expiry_type={expire_type}, expiry_value={expiry}")
+
+        parts = [
+            # PLU Number (4 bytes)
+            data['id'].to_bytes(4, 'little'),
+            
+            # Item Code (6 bytes)
+            self._str_to_bytes(data['code']),
+            
+            # Название с логотипом
+            self._encode_name(data['name1'], data['logo_type'], data.get('cert_code', ''), 0),
+            self._encode_name(data['name2'], data['logo_type'], data.get('cert_code', ''), 1),
+            
+            # Цена (4 bytes)
+            int(data['price']).to_bytes(4, 'little'),  # data['price'] в копейках!
+            
+            # Срок годности (3 bytes)
+            expiry_bytes,
+            
+            # Тара (2 bytes)
+            data['tare'].to_bytes(2, 'little'),
+            
+            # Групповой код (6 bytes)
+            self._str_to_bytes(data['group_code']),
+            
+            # Номер сообщения (2 bytes)
+            self._encode_message_number(data['message_number']),
+        ]
+        
+        # Проверяем типы
+        for i, part in enumerate(parts):
+            if not isinstance(part, bytes):
+                raise TypeError(f"Part {i} is {type(part)}, expected bytes")
+        
+        # Собираем итоговые данные
+        plu_bytes = b''.join(parts)
+
+        if not self._check_response(plu_bytes, LENGTHS["plu_write"], "PLU Write"):
+            raise ValueError("Invalid PLU length")
+        
+        return plu_bytes
+
+    @staticmethod
+    def _encode_message_number(number: int) -> bytes:
+        if not 0 <= number <= MESSAGE_NUMBER_MAX:
+            raise ValueError(f"Номер сообщения {number} вне диапазона 0-{MESSAGE_NUMBER_MAX}")
+        return number.to_bytes(2, 'little')
+
+    def _plu_record(self, data: dict) -> bytes:
+        """Образ товара для записи: готовый из базы (wire_record) или закодированный заново"""
+        return data.get('wire_record') or self._encode_plu(data)
+
+    def _encode_name(self, text: str, logo_type: int, cert_code: str, line: int) -> bytes:
+        """Кодирует название с логотипом"""
+        # Обрезаем строку до 24 символов, если есть логотип
+        max_len = PLU_NAME_LEN_LOGO if logo_type else PLU_NAME_LEN
+        encoded = text.encode('cp1251', errors='replace')[:max_len]
+        
+        # Дополняем нулями до нужной длины
+        padded = encoded.ljust(max_len, b'\x00')
+        
+        # Добавляем логотип (если требуется)
+        if logo_type:
+            cert_bytes = self._encode_cert_code(cert_code, line, logo_type)
+            return padded + cert_bytes
+        return padded
+
+    def _str_to_bytes(self, s: str) -> bytes:
+        """Преобразует строку из 6 цифр в 6 байт (каждая цифра — отдельный байт)"""
+        return bcd.digits_to_bytes(s, 6)
+
+    def _bytes_to_str(self, b: bytes) -> str:
+        return bcd.bytes_to_digits(b, 6)
+
+    # def _bytes_to_str(self, b: bytes) -> str:
+    #     """Преобразует 6 байт (каждая цифра — отдельный байт) в строку"""
+    #     return b[:6].decode('ascii', errors='ignore')
+    #     #return ''.join(str(byte) for byte in b[:6])
+
+    def _encode_cert_code(self, cert_code: str, line: int, logo_type: int) -> bytes:
+        """Кодирует сертификационный код для логотипа"""
+        code = cert_code.ljust(4, '\x00')
+        return bytes([
+            0,  # Индикатор логотипа
+            logo_type,
+            ord(code[3 - line]) if len(code) > (3 - line) else 0,
+            ord(code[1 + line]) if len(code) > (1 + line) else 0
+        ])
+    
+    def _decode_name(self, name_bytes: bytes) -> str:
+        """Декодирует название товара с учетом логотипа"""
+        # Определяем длину названия
+        if name_bytes[24] == 0:  # Есть логотип
+            raw_name = name_bytes[:24]
+        else:
+            raw_name = name_bytes[:28]
+        
+        # Удаляем нулевые байты и декодируем
+        return raw_name.split(b'\x00')[0].decode('cp1251', errors='ignore')
+
+    def _parse_logo(self, line1: bytes, line2: bytes) -> dict:
+        """Извлекает данные логотипа"""
+        logo = {}
+        if line1[24] == 0 and line2[24] == 0:
+            logo = {
+                'type': line1[25],
+                'cert_code': bytes([line2[26], line1[26], line2[27], line1[27]]).decode('ascii')
+            }
+        return logo
+
+    def _parse_expiry(self, data: bytes):
+        """
+        Разбирает срок годности из 3 байт BCD:
+        - Если data[0] == 0, то это количество дней (data[1]: сотни, data[2]: десятки и единицы)
+        - Иначе это дата: день (data[0]), месяц (data[1]), год (data[2]), все в BCD
+        """
+        if len(data) != 3:
+            return None
+
+        first, second, third = bcd.decode_pairs(data)
+        if data[0] == 0:
+            # Количество дней (BCD)
+            return f"{second * 100 + third}"
+        # Дата (BCD)
+        return f"{first:02d}.{second:02d}.{third:02d}"
+
+    @staticmethod
+    def _to_bcd(val):
+        return bcd.to_bcd(val)
+
+    def bcd_to_datetime(self, bcd_data):
+        """Конвертирует 6-байтовый BCD-формат в datetime (годы 2000+)"""
+        return bcd.bcd_to_datetime(bcd_data)
+
+    def dump_plu(self, start: int = 1, end: int = PLU_MAX, skip_ranges=(), stop=None):
+        """
+        Потоковая выгрузка каталога с весов через self.get_plu_many. Отдаёт по одному
+        словарю на номер: {"id", "plu" (None — запись пуста), "done", "total"}.
+        skip_ranges — пары (с, по) заведомо пустых номеров, stop() — досрочная остановка
+        """
+        ids = [plu_id for plu_id in range(start, end + 1)
+               if not any(first <= plu_id <= last for first, last in skip_ranges)]
+        done = 0
+        for plu_id, plu in self.get_plu_many(ids):
+            done += 1
+            yield {"id": plu_id, "plu": plu or None, "done": done, "total": len(ids)}
+            if stop and stop():
+                return
+    # endregion
+
+    #region Общие продажи
+    def _decode_total_sales(self, response: bytes) -> dict:
+        return {
+            'mileage': int.from_bytes(response[0:4], 'little'),
+            'label_count': int.from_bytes(response[4:8], 'little'),
+            'total_sum': int.from_bytes(response[8:12], 'little'),
+            'sales_count': int.from_bytes(response[12:15], 'little'),
+            'total_weight': int.from_bytes(response[15:19], 'little'),
+            'plu_sum': int.from_bytes(response[19:23], 'little'),
+            'plu_sales_count': int.from_bytes(response[23:26], 'little'),
+            'plu_weight': int.from_bytes(response[26:30], 'little'),
+            'free_plu': int.from_bytes(response[36:38], 'little'),
+            'free_msg': int.from_bytes(response[38:40], 'little'),
+        }
+    # endregion
+
+    # region Message Operations
+    def _decode_message(self, id: int, response: bytes) -> dict:
+        return {
+            'id': id,
+            'content': response.rstrip(b'\x00').decode('cp1251', errors='ignore')
+        }
+
+    def _encode_message(self, data: dict) -> bytes:
+        """Кодирует сообщение в байтовый формат"""
+        # Преобразуем текст в байты с кодировкой cp1251
+        text_bytes = data['content'].encode('cp1251', errors='replace')
+        # Дополняем нулями до 400 байт
+        padded_text = text_bytes.ljust(400, b'\x00')
+        
+        # Собираем итоговые данные
+        msg_bytes = data['id'].to_bytes(2, 'little') + padded_text
+        
+        if not self._check_response(msg_bytes, LENGTHS["message_write"], "Message Write"):
+            raise ValueError("Invalid message length")
+        
+        return msg_bytes
+    # endregion
+
+    # --- BCD кодирование и декодирование ---
+    @staticmethod
+    def int_to_bcd_bytes(value: int, length: int) -> bytes:
+        """Преобразует целое число в BCD-байты заданной длины"""
+        return bcd.int_to_bcd(value, length)
+
+    @staticmethod
+    def bcd_bytes_to_int(data: bytes) -> int:
+        """Преобразует BCD-байты в целое число"""
+        return bcd.bcd_to_int(data)
+
+    #region Настройки пользователя
+    def _decode_user_settings(self, data: bytes) -> dict:
+        return {
+            "dept_no": self.bcd_bytes_to_int(data[0:3]),
+            "label_format": data[3],
+            "barcode_format": data[4],
+            "adjst": data[5],
+            "print_features": data[6],
+            "auto_print_weight": int.from_bytes(data[7:9], "little")
+        }
+
+    def _encode_user_settings(self, settings: dict) -> bytes:
+        dept_bcd = self.int_to_bcd_bytes(settings["dept_no"], 3)
+        label = settings["label_format"].to_bytes(1, "little")
+        barcode = settings["barcode_format"].to_bytes(1, "little")
+        adjst = settings["adjst"].to_bytes(1, "little")
+        features = settings["print_features"].to_bytes(1, "little")
+        auto_weight = settings["auto_print_weight"].to_bytes(2, "little")
+        return dept_bcd + label + barcode + adjst + features + auto_weight
+    #endregion
+
+    #region Заводские установки
+    def _decode_factory_settings(self, data: bytes) -> dict:
+        return {
+            "max_weight": int.from_bytes(data[0:2], "little"),
+            "dec_point_weight": data[2],
+            "dec_point_price": data[3],
+            "dec_point_sum": data[4],
+            "dual_range": data[5],
+            "weight_step_upper": data[6],
+            "weight_step_lower": data[7],
+            "price_weight": int.from_bytes(data[8:10], "little"),
+            "round_sum": data[10],
+            "tare_limit": int.from_bytes(data[11:13], "little"),
+        }
+    #endregion
+
+    #region Текущее состояние весов
+    def _decode_current_status(self, data: bytes) -> dict:
+        status = data[0]
+        abs_weight = int.from_bytes(data[1:3], "little")
+        if status & 0b10000000:
+            weight = -abs_weight
+        else:
+            weight = abs_weight
+
+        return {
+            "status_byte": status,
+            "weight": weight,
+            "price": int.from_bytes(data[3:7], "little"),
+            "sum": int.from_bytes(data[7:11], "little"),
+            "plu_number": int.from_bytes(data[11:15], "little"),
+            "bits": {
+                "overload": bool(status & 0b00000001),
+                "tare_mode": bool(status & 0b00000100),
+                "zero_weight": bool(status & 0b00001000),
+                "dual_range": bool(status & 0b00100000),
+                "stable_weight": bool(status & 0b01000000),
+                "minus_sign": bool(status & 0b10000000),
+            }
+        }
+    #endregion
+
@@ -0,0 +1,159 @@
+# scheduler.py
+"""
+Планировщик команд к весам. Все обращения к порту выполняет один рабочий поток,
+команды выбираются по классу приоритета:
+
+    INTERACTIVE — действия пользователя в интерфейсе;
+    POLLING     — периодический опрос состояния;
+    BULK        — массовая синхронизация каталога.
+
+Каждая команда — отдельный элемент очереди; массовые операции ставятся
+окнами по PIPELINE_WINDOW товаров (одна конвейерная передача ScaleAdmin),
+поэтому синхронизация уступает линию между окнами, и интерактивный запрос
+ждёт не дольше одного уже идущего окна. Внутри класса источники (потоки-отправители)
+обслуживаются по кругу, чтобы две синхронизации не блокировали друг друга.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import logging
+from itertools import islice
+from threading import Condition, Thread, get_ident
+from types import GeneratorType
+
+from protocol import PIPELINE_WINDOW, ScaleProtocol
+
+INTERACTIVE = 0
+POLLING = 1
+BULK = 2
+PRIORITIES = (INTERACTIVE, POLLING, BULK)
+
+# Сколько окон массовой операции держать в очереди заранее, чтобы линия не простаивала
+BULK_WINDOW = 2
+
+
+class CommandScheduler:
+    def __init__(self, admin):
+        self.admin = admin
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}  # источник -> deque команд
+        self._cv = Condition()
+        self._running = True
+        self._worker = Thread(target=self._run, name="scale-scheduler", daemon=True)
+        self._worker.start()
+
+    def submit(self, priority: int, method: str, *args, source=None, **kwargs) -> Future:
+        """Поставить вызов метода ScaleAdmin в очередь. Результат — через Future"""
+        future = Future()
+        source = source if source is not None else get_ident()
+        with self._cv:
+            if not self._running:
+                raise RuntimeError("Планировщик остановлен")
+            self._queues[priority].setdefault(source, deque()).append((future, method, args, kwargs))
+            self._cv.notify()
+        return future
+
+    def call(self, priority: int, method: str, *args, **kwargs):
+        """Синхронный вызов через очередь"""
+        return self.submit(priority, method, *args, **kwargs).result()
+
+    def proxy(self, priority: int) -> "SchedulerProxy":
+        return SchedulerProxy(self, priority)
+
+    def pending(self) -> dict:
+        """Количество ожидающих команд по классам приоритета"""
+        with self._cv:
+            return {priority: sum(len(q) for q in queues.values()) for priority, queues in self._queues.items()}
+
+    def stop(self):
+        with self._cv:
+            self._running = False
+            for queues in self._queues.values():
+                for queue in queues.values():
+                    for future, *_ in queue:
+                        future.cancel()
+                queues.clear()
+            self._cv.notify()
+
+    def _next(self):
+        """Следующая команда: старший непустой класс, внутри него — следующий по кругу источник"""
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            if queues:
+                source, queue = next(iter(queues.items()))
+                item = queue.popleft()
+                del queues[source]
+                if queue:
+                    queues[source] = queue  # в конец круга
+                return item
+        return None
+
+    def _run(self):
+        while True:
+            with self._cv:
+                item = self._next()
+                while item is None and self._running:
+                    self._cv.wait()
+                    item = self._next()
+                if item is None:
+                    return
+            future, method, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = getattr(self.admin, method)(*args, **kwargs)
+                if isinstance(result, GeneratorType):
+                    result = list(result)  # конвейерные *_many выполняются целиком в рабочем потоке
+                future.set_result(result)
+            except Exception as e:
+                logging.error(f"Ошибка выполнения {method}: {str(e)}")
+                future.set_exception(e)
+
+
+class SchedulerProxy:
+    """Объект с интерфейсом ScaleAdmin, отправляющий команды через планировщик с заданным приоритетом"""
+
+    def __init__(self, scheduler: CommandScheduler, priority: int):
+        self._scheduler = scheduler
+        self._priority = priority
+
+    def __getattr__(self, name):
+        attr = getattr(self._scheduler.admin, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        return lambda *args, **kwargs: self._scheduler.call(self._priority, name, *args, **kwargs)
+
+    def create_plu_many(self, plu_items):
+        """
+        Конвейерная запись товаров окнами по PIPELINE_WINDOW. Возвращает пары (plu, ok);
+        нет связи — LinkDown (товары прерванного окна считаются неподтверждёнными)
+        """
+        yield from self._many("create_plu_many", plu_items)
+
+    def get_plu_many(self, ids):
+        """Конвейерное чтение товаров окнами по PIPELINE_WINDOW. Возвращает пары (id, plu); нет связи — LinkDown"""
+        yield from self._many("get_plu_many", ids)
+
+    def _many(self, method: str, items):
+        """Одно окно — один элемент очереди; следующие BULK_WINDOW окон стоят в очереди заранее"""
+        items = iter(items)
+        window = deque()
+        try:
+            while True:
+                chunk = list(islice(items, PIPELINE_WINDOW))
+                if chunk:
+                    window.append((chunk, self._scheduler.submit(self._priority, method, chunk)))
+                if window and (len(window) >= BULK_WINDOW or not chunk):
+                    yield from window[0][1].result()
+                    window.popleft()
+                elif not chunk:
+                    return
+        finally:
+            self._cancel(window)
+
+    # Выгрузка строится поверх get_plu_many, поэтому каждое окно чтения идёт через очередь
+    dump_plu = ScaleProtocol.dump_plu
+
+    @staticmethod
+    def _cancel(window):
+        """Снять из очереди команды окна, которые уже не нужны (операция прервана)"""
+        for _, future in window:
+            future.cancel()
@@ -0,0 +1,108 @@
+# status_hub.py
+"""
+Общий опрос текущего состояния весов (команда 0x89). На каждые весы — один
+поток опроса, каждый образец рассылается всем подписчикам (вкладки браузера,
+окно PyQt). Нагрузка на линию не зависит от числа зрителей, а без подписчиков
+опрос не идёт совсем.
+
+Частота подстраивается под весы: пока вес меняется или не стабилен, опрос идёт
+каждые STATUS_FAST секунд, на стабильном весе интервал удваивается до STATUS_SLOW.
+"""
+import logging
+import time
+from threading import Condition, Lock, Thread
+
+STATUS_FAST = 0.2
+STATUS_SLOW = 2.0
+
+
+class StatusHub:
+    def __init__(self, read_status, fast: float = STATUS_FAST, slow: float = STATUS_SLOW):
+        """read_status() -> dict состояния (пустой dict — ошибка чтения)"""
+        self.read_status = read_status
+        self.fast = fast
+        self.slow = slow
+        self.interval = slow
+        self._subscribers = []
+        self._latest = None
+        self._seq = 0
+        self._cv = Condition()
+        self._read_lock = Lock()
+        self._running = True
+        self._worker = Thread(target=self._run, name="status-hub", daemon=True)
+        self._worker.start()
+
+    @property
+    def latest(self) -> dict:
+        """Последний образец: состояние весов плюс "seq" и "ts" (None — ещё не читали)"""
+        return self._latest
+
+    def subscribe(self, callback):
+        """callback(sample) вызывается из потока опроса на каждый образец; последний — сразу"""
+        with self._cv:
+            self._subscribers.append(callback)
+            if len(self._subscribers) == 1:
+                self._cv.notify()  # первый подписчик запускает опрос
+            latest = self._latest
+        if latest is not None:
+            callback(latest)
+
+    def unsubscribe(self, callback):
+        with self._cv:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def sample(self, max_age: float = None) -> dict:
+        """
+        Состояние не старше max_age секунд (по умолчанию — интервал медленного опроса).
+        Одновременные запросы разделяют одно чтение с весов
+        """
+        max_age = self.slow if max_age is None else max_age
+        with self._read_lock:
+            latest = self._latest
+            if latest is not None and time.monotonic() - latest["ts"] <= max_age:
+                return latest
+            return self._poll()
+
+    def stop(self):
+        with self._cv:
+            self._running = False
+            self._subscribers.clear()
+            self._cv.notify()
+
+    def _poll(self) -> dict:
+        status = self.read_status()
+        if not status:
+            self.interval = self.slow
+            return self._latest
+        previous = self._latest
+        changed = previous is None or status.get("weight") != previous.get("weight")
+        stable = status.get("bits", {}).get("stable_weight", True)
+        self.interval = self.fast if changed or not stable else min(self.interval * 2, self.slow)
+        with self._cv:
+            self._seq += 1
+            self._latest = dict(status, seq=self._seq, ts=time.monotonic())
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(self._latest)
+            except Exception as e:
+                logging.error(f"Ошибка доставки состояния подписчику: {str(e)}")
+        return self._latest
+
+    def _run(self):
+        while True:
+            with self._cv:
+                while self._running and not self._subscribers:
+                    self._cv.wait()
+                if not self._running:
+                    return
+            with self._read_lock:
+                try:
+                    self._poll()
+                except Exception as e:
+                    self.interval = self.slow
+                    logging.error(f"Ошибка опроса состояния: {str(e)}")
+            with self._cv:
+                if self._running:
+                    self._cv.wait(self.interval)
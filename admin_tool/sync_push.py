@@ -0,0 +1,77 @@
+# sync_push.py
+"""
+Передача задания синхронизации (sync_jobs) на весы — общий путь обычной
+синхронизации текущих весов и загрузки на несколько весов (FanoutSync).
+
+Ответ весов по каждому товару сразу фиксируется в базе вместе с образом в
+зеркале весов, поэтому задание, прерванное отменой или перезапуском,
+продолжается с места остановки и не отправляет повторно принятые товары.
+Отменённое пользователем задание закрывается и само уже не продолжается.
+Завершённое задание переносит отклонённые товары в очередь повторов и
+записывается в историю синхронизаций. Если весы перестали отвечать (LinkDown),
+задание прерывается: неотправленные товары остаются в плане до продолжения,
+а не попадают в очередь повторов как отклонённые.
+"""
+import logging
+
+from protocol import LENGTHS, LinkDown, ScaleProtocol
+
+PUSH_DONE = "done"
+PUSH_STOPPED = "stopped"
+PUSH_INTERRUPTED = "interrupted"  # нет связи с весами, задание продолжится позже
+
+_codec = ScaleProtocol()
+
+
+def encode_plu_record(plu: dict):
+    """83-байтовый образ товара в том виде, в каком он уходит на весы (None — не кодируется)"""
+    if plu.get('wire_record'):
+        return plu['wire_record']
+    try:
+        return _codec._encode_plu(plu)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def push_sync_job(db, admin, job, sync_job_id: int, catalog: dict = None, skipped=()) -> str:
+    """
+    Отправка ещё не подтверждённых товаров задания sync_job_id через admin.create_plu_many.
+    job — задание очереди: прогресс (товары и байты), отмена и job.data с ключами
+    errors, job_id и retry. catalog — товары {id: plu}, если уже прочитаны (иначе из базы),
+    skipped — отсеянные до передачи некорректные товары (для истории).
+    Возвращает PUSH_DONE, PUSH_STOPPED или PUSH_INTERRUPTED (причина — в job.data["error"])
+    """
+    sync_job = db.get_sync_job(sync_job_id)
+    pending = db.get_sync_job_pending(sync_job_id)
+    job.data["job_id"] = sync_job_id
+    job.progress(sync_job["total"] - len(pending), sync_job["total"])
+    if catalog is None:
+        catalog = {plu['id']: plu for plu in db.get_plu_many(pending)}
+    try:
+        for plu, ok in admin.create_plu_many(catalog[plu_id] for plu_id in pending if plu_id in catalog):
+            db.ack_sync_job_item(sync_job_id, plu['id'], ok, encode_plu_record(plu))
+            if not ok:
+                job.data["errors"].append(plu['id'])
+            job.progress(job.current + 1, bytes=job.bytes + LENGTHS["plu_write"])
+            if job.cancelled():
+                if not job.suspended:
+                    db.cancel_sync_job(sync_job_id)
+                logging.info(f"Синхронизация {sync_job_id} ({sync_job['port']}) "
+                             f"{'приостановлена' if job.suspended else 'отменена'}: {job.current} из {job.total}")
+                return PUSH_STOPPED
+    except LinkDown as e:
+        job.data["error"] = f"Нет связи с весами: {str(e)}"
+        logging.error(f"Синхронизация {sync_job_id} ({sync_job['port']}) прервана на {job.current} из "
+                      f"{job.total}: {str(e)}. Остальные товары будут отправлены при продолжении")
+        return PUSH_INTERRUPTED
+    failed = db.finish_sync_job(sync_job_id)
+    # Не принятые весами товары повторяются с нарастающей задержкой, а не всей синхронизацией
+    job.data["retry"] = db.settle_sync_retries(sync_job_id)
+    if failed:
+        logging.warning(f"PLU в очереди повторов: {len(job.data['retry']['retry'])}, "
+                        f"исчерпали попытки: {len(job.data['retry']['dead'])}")
+    # Ошибки до перезапуска есть только в задании, ошибки этого запуска — в job.data
+    db.add_sync_history("to_scales", sync_job["total"], sorted(set(failed) | set(job.data["errors"]) | set(skipped)))
+    logging.info(f"Синхронизация {sync_job_id} ({sync_job['port']}) завершена: "
+                 f"{sync_job['total']} товаров, ошибок {len(failed)}")
+    return PUSH_DONE
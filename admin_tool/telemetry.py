@@ -0,0 +1,170 @@
+# telemetry.py
+"""
+Телеметрия линии связи с весами. На каждый порт — окно из последних
+TELEMETRY_WINDOW минутных корзин: байты в обе стороны, число команд, ответы
+0xEE, таймауты, пропущенные мусорные байты, ожидание байта готовности и время
+ответа по каждому коду команды.
+
+Закрытая корзина отдаётся в sink(port, bucket) — AdminDatabase сохраняет её
+одной строкой link_metrics, так что история по весам переживает перезапуск.
+Sink вызывается из отдельного потока: события пишутся под замком линии, и
+запись в SQLite не должна задерживать обмен с весами.
+"""
+import logging
+from queue import Queue
+import time
+from threading import Lock, Thread
+
+TELEMETRY_BUCKET = 60   # секунд в одной корзине (и в одной строке истории)
+TELEMETRY_WINDOW = 15   # корзин в скользящем окне в памяти
+
+
+_sink_queue = Queue()  # (sink, port, bucket) закрытых корзин, ждущих сохранения
+_sink_thread = None
+_sink_thread_lock = Lock()
+
+
+def _sink_worker():
+    while True:
+        sink, port, bucket = _sink_queue.get()
+        try:
+            sink(port, bucket)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения телеметрии {port}: {str(e)}")
+        finally:
+            _sink_queue.task_done()
+
+
+def _submit_bucket(sink, port: str, bucket: dict):
+    """Передать корзину потоку сохранения (поток запускается при первой корзине)"""
+    global _sink_thread
+    with _sink_thread_lock:
+        if _sink_thread is None:
+            _sink_thread = Thread(target=_sink_worker, name="link-telemetry", daemon=True)
+            _sink_thread.start()
+    _sink_queue.put((sink, port, bucket))
+
+
+def new_bucket(start: int) -> dict:
+    return {
+        "start": start,
+        "bytes_out": 0,
+        "bytes_in": 0,
+        "commands": 0,
+        "errors": 0,
+        "timeouts": 0,
+        "skipped": 0,
+        "ready_waits": 0,
+        "ready_wait": 0.0,   # суммарное ожидание байта готовности, с
+        "latency": {},       # {код команды hex: [число, сумма с, максимум с]}
+    }
+
+
+def merge_buckets(buckets) -> dict:
+    """Сумма корзин в одну (для окна или для выборки из истории)"""
+    total = new_bucket(None)
+    for bucket in buckets:
+        for key in ("bytes_out", "bytes_in", "commands", "errors", "timeouts", "skipped",
+                    "ready_waits", "ready_wait"):
+            total[key] += bucket[key]
+        for opcode, (count, spent, worst) in bucket["latency"].items():
+            stats = total["latency"].setdefault(opcode, [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += spent
+            stats[2] = max(stats[2], worst)
+    return total
+
+
+def summarize(bucket: dict, seconds: float) -> dict:
+    """Показатели корзины за seconds секунд: скорости, доли ошибок, задержки в мс"""
+    commands = bucket["commands"]
+    seconds = max(seconds, 1e-9)
+    return {
+        "seconds": round(seconds),
+        "commands": commands,
+        "out_bps": round(bucket["bytes_out"] / seconds, 1),
+        "in_bps": round(bucket["bytes_in"] / seconds, 1),
+        "error_rate": round(bucket["errors"] / commands, 4) if commands else 0.0,
+        "timeout_rate": round(bucket["timeouts"] / commands, 4) if commands else 0.0,
+        "skipped_bytes": bucket["skipped"],
+        "ready_wait_ms": round(bucket["ready_wait"] / bucket["ready_waits"] * 1000, 1) if bucket["ready_waits"] else None,
+        "latency_ms": {
+            opcode: {"count": count, "avg": round(spent / count * 1000, 1), "max": round(worst * 1000, 1)}
+            for opcode, (count, spent, worst) in sorted(bucket["latency"].items()) if count
+        },
+    }
+
+
+class LinkTelemetry:
+    def __init__(self, port: str, sink=None, bucket: int = TELEMETRY_BUCKET, window: int = TELEMETRY_WINDOW):
+        """sink(port, bucket) вызывается для каждой закрытой корзины (None — только память)"""
+        self.port = port
+        self.sink = sink
+        self.bucket_seconds = bucket
+        self.window = window
+        self._lock = Lock()
+        self._closed = []
+        self._current = new_bucket(self._bucket_start(time.time()))
+
+    def _bucket_start(self, now: float) -> int:
+        return int(now // self.bucket_seconds * self.bucket_seconds)
+
+    def _bucket(self) -> dict:
+        """Текущая корзина; при смене минуты прежняя закрывается. Вызывать под замком"""
+        start = self._bucket_start(time.time())
+        if start != self._current["start"]:
+            self._close()
+            self._current = new_bucket(start)
+        return self._current
+
+    def _close(self):
+        bucket = self._current
+        self._closed = (self._closed + [bucket])[-self.window:]
+        if self.sink and bucket["commands"] + bucket["ready_waits"] + bucket["skipped"]:
+            _submit_bucket(self.sink, self.port, bucket)
+
+    #region Запись событий
+    def record_command(self, opcode: bytes, sent: int, received: int, latency: float, outcome: str):
+        """Одна транзакция: outcome — ok / error (0xEE) / timeout"""
+        with self._lock:
+            bucket = self._bucket()
+            bucket["commands"] += 1
+            bucket["bytes_out"] += sent
+            bucket["bytes_in"] += received
+            if outcome == "error":
+                bucket["errors"] += 1
+            elif outcome == "timeout":
+                bucket["timeouts"] += 1
+                return  # время ответа по таймауту не считаем
+            stats = bucket["latency"].setdefault(opcode.hex(), [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += latency
+            stats[2] = max(stats[2], latency)
+
+    def record_ready_wait(self, seconds: float):
+        with self._lock:
+            bucket = self._bucket()
+            bucket["ready_waits"] += 1
+            bucket["ready_wait"] += seconds
+
+    def record_skipped(self, count: int = 1):
+        """Байты вне ответа: мусор на линии или опоздавший ответ после таймаута"""
+        with self._lock:
+            self._bucket()["skipped"] += count
+    #endregion
+
+    def snapshot(self) -> dict:
+        """Показатели по скользящему окну (закрытые корзины плюс текущая)"""
+        with self._lock:
+            self._bucket()
+            buckets = self._closed + [self._current]
+            seconds = time.time() - buckets[0]["start"]
+            return dict(summarize(merge_buckets(buckets), seconds), port=self.port)
+
+    def flush(self):
+        """Сохранить текущую неполную корзину (при отключении) и дождаться записи"""
+        with self._lock:
+            self._close()
+            self._current = new_bucket(self._bucket_start(time.time()))
+        if self.sink:
+            _sink_queue.join()
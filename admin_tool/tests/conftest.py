@@ -0,0 +1,6 @@
+# conftest.py
+"""Модули админки импортируются по имени (from admin import ...), как при запуске из admin_tool"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,91 @@
+# test_admin_pipeline.py
+"""Конвейер команд ScaleAdmin на подставном порту: приёмный буфер, таймауты, запись товаров"""
+import pytest
+
+import admin
+from admin import ScaleAdmin
+from protocol import COMMANDS, ERROR_RESPONSE, READY_BYTE, LinkDown
+
+PLU = dict(code='123456', name1='Молоко', name2='', price=5000, expiry_type=1, expiry_value='10', tare=0,
+           group_code='000001', message_number=0, logo_type=0, cert_code='')
+
+
+class FakeSerial:
+    """Порт, отвечающий на каждый записанный пакет через answer(packet) -> bytes (b'' — молчит)"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.baudrate = 9600
+        self.is_open = True
+        self.port = "FAKE"
+        self.written = []
+        self._in = bytearray()
+
+    def write(self, packet):
+        self.written.append(bytes(packet))
+        self._in += self.answer(bytes(packet))
+        return len(packet)
+
+    @property
+    def in_waiting(self):
+        return len(self._in)
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self._in))
+        buffer[:count] = self._in[:count]
+        del self._in[:count]
+        return count
+
+    def read(self, size=1):
+        data = bytes(self._in[:size])
+        del self._in[:size]
+        return data
+
+
+@pytest.fixture
+def make_admin(monkeypatch):
+    monkeypatch.setattr(admin, "FIRST_LATENCY", 0.05)
+
+    def make(answer):
+        scale = ScaleAdmin(port=None)
+        scale.ser = FakeSerial(answer)
+        return scale
+    return make
+
+
+def test_bytes_after_response_stay_in_receive_buffer(make_admin):
+    # Весы прислали подтверждение и сразу начало следующего ответа
+    scale = make_admin(lambda packet: READY_BYTE + b'\x12\x34')
+    assert scale._transact_many([(COMMANDS["delete_plu"] + b'\x01\x00\x00\x00', 0)]) == [b'']
+    assert scale._rx == bytearray(b'\x12\x34')
+
+
+def test_pipeline_window_uses_leftover_bytes(make_admin):
+    # Оба подтверждения пришли на первый пакет: второй ответ разбирается из остатка буфера
+    answers = iter([READY_BYTE * 2, b''])
+    scale = make_admin(lambda packet: next(answers))
+    packet = COMMANDS["delete_plu"] + b'\x01\x00\x00\x00'
+    assert scale._transact_many([(packet, 0), (packet, 0)]) == [b'', b'']
+    assert len(scale.ser.written) == 2
+
+
+def test_timeout_cuts_window_short(make_admin):
+    answers = [READY_BYTE, READY_BYTE, b'', READY_BYTE]
+    scale = make_admin(lambda packet: answers.pop(0) if answers else b'')
+    packet = COMMANDS["delete_plu"] + b'\x01\x00\x00\x00'
+    responses = scale._transact_many([(packet, 0)] * 4)
+    assert responses == [b'', b'', None]
+    assert len(scale.ser.written) == 3  # четвёртый пакет после таймаута не отправлялся
+    # Следующее окно: первая команда подтверждена, на вторую весы молчат
+    with pytest.raises(LinkDown):
+        list(scale.send_pipelined([(COMMANDS["delete_plu"], b'\x01\x00\x00\x00', 0)] * 2))
+
+
+def test_create_plu_many_reports_encoding_errors_in_order(make_admin):
+    scale = make_admin(lambda packet: ERROR_RESPONSE + READY_BYTE if packet[1] == 4 else READY_BYTE)
+    items = [dict(PLU, id=1), dict(PLU, id=2, expiry_value=None), dict(PLU, id=3), dict(PLU, id=4),
+             dict(PLU, id=5, expiry_type=7)]
+    results = list(scale.create_plu_many(items))
+    assert [(plu['id'], ok) for plu, ok in results] == [(1, True), (2, False), (3, True), (4, False), (5, False)]
+    # Некорректные товары на весы не уходят, остальные — одним конвейером
+    assert [packet[1] for packet in scale.ser.written] == [1, 3, 4]
@@ -0,0 +1,29 @@
+# test_app_state.py
+"""Списки оператора в app_state: строка товара из базы проходит через update_state"""
+import pytest
+
+from admin_db import AdminDatabase, plu_user_fields
+
+PLU = dict(id=238, code='123456', name1='Молоко', name2='', price=5000, expiry_type=1, expiry_value='10',
+           tare=0, group_code='000001', message_number=0, logo_type=0, cert_code='', last_reset=None,
+           total_sum=0, total_weight=0, sales_count=0, updated_at='2026-10-19 10:00:00')
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # путь базы задан относительно текущего каталога
+    return AdminDatabase()
+
+
+def test_plu_row_round_trips_through_update_state(db):
+    assert db.upsert_plu(PLU)
+    row = db.get_plu(PLU['id'])
+    assert isinstance(row['wire_record'], bytes)
+
+    item = plu_user_fields(row)
+    items = db.update_state("operator", "plu_list", lambda items: items + [item], [])
+
+    assert items == [item]
+    assert db.get_state("operator", "plu_list") == [item]
+    assert "wire_record" not in item and "wire_hash" not in item
+    assert item['name1'] == 'Молоко'
@@ -371,23 +371,19 @@ class CommandHandler:
             return b'\xEE'
 
     def _handle_write_logo2(self, data: bytes) -> bytes:
-        """Обработка записи логотипа (512 байт данных + 4 байта сертификата)"""
+        """Обработка записи логотипа (512 байт данных + необязательные 4 байта сертификата)"""
         try:
             logo_id = 2
             logo_data = data[:512]
-            cert_code = data[512:516].decode('ascii')
+            # Админка передаёт только растр (LENGTHS['logo2']), код сертификата — по умолчанию
+            cert_code = data[512:516].decode('ascii') if len(data) > 512 else '0000'
             
             # Валидация данных
             if len(logo_data) != 512 or len(cert_code) != 4:
                 return b'\xEE'
                 
-            # Сохранение в БД
-            with self.db._get_connection() as conn:
-                conn.execute('''INSERT OR REPLACE INTO logos 
-                            (id, data, cert_code) VALUES (?, ?, ?)''',
-                            (logo_id, logo_data, cert_code))
-                
-            return b''
+            # Сохранение в БД (тот же растр не перезаписывается)
+            return b'' if self.db.upsert_logo(logo_id, logo_data, cert_code) else b'\xEE'
         except Exception as e:
             logging.error(f"Logo write error: {str(e)}")
             return b'\xEE'
@@ -466,10 +462,7 @@ class CommandHandler:
         try:
             if len(data) != 384:
                 return b'\xEE'
-            with self.db._get_connection() as c:
-                c.execute('''INSERT OR REPLACE INTO logos (id, data, cert_code) VALUES (?, ?, ?)''',
-                        (1, data, '0000'))
-            return b''
+            return b'' if self.db.upsert_logo(1, data, '0000') else b'\xEE'
         except Exception as e:
             logging.error(f"Write logo_roste error: {str(e)}")
             return b'\xEE'
@@ -3,6 +3,9 @@ import os
 import sqlite3
 from contextlib import contextmanager
 import logging
+from datetime import datetime
+
+from ..admin_tool.bcd import datetime_to_bcd
 
 class ScaleDatabase:
     def __init__(self):
@@ -226,12 +229,14 @@ class ScaleDatabase:
             return row['data'] if row else None
 
     def upsert_logo(self, logo_id: int, data: bytes, cert_code: str) -> bool:
+        """Запись логотипа; такой же растр повторно не перезаписывается"""
         try:
             with self._get_connection() as c:
-                c.execute('''INSERT OR REPLACE INTO logos 
-                          VALUES (?, ?, ?)''', 
+                c.execute('''INSERT INTO logos (id, data, cert_code) VALUES (?, ?, ?)
+                          ON CONFLICT(id) DO UPDATE SET data = excluded.data, cert_code = excluded.cert_code
+                          WHERE data IS NOT excluded.data OR cert_code IS NOT excluded.cert_code''',
                           (logo_id, data, cert_code))
-                return c.rowcount > 0
+                return True
         except sqlite3.IntegrityError:
             return False
     # endregion
@@ -326,17 +331,8 @@ class ScaleDatabase:
             return False
 
     def reset_total_sales(self):
-        from datetime import datetime
-        now = datetime.now()
         # BCD-пакет: сек, мин, час, день, мес, год
-        bcd = bytes([
-            ((now.second // 10) << 4) | (now.second % 10),
-            ((now.minute // 10) << 4) | (now.minute % 10),
-            ((now.hour // 10) << 4) | (now.hour % 10),
-            ((now.day // 10) << 4) | (now.day % 10),
-            ((now.month // 10) << 4) | (now.month % 10),
-            ((now.year % 100 // 10) << 4) | (now.year % 10)
-        ])
+        bcd = datetime_to_bcd(datetime.now())
         values = {
             'mileage': 0,
             'label_count': 0,
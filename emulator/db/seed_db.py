@@ -3,19 +3,13 @@ import sqlite3
 import random
 from datetime import datetime, timedelta
 import logging
+import sys
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+# Кодек BCD общий с админкой (admin_tool/bcd.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'admin_tool'))
+from bcd import datetime_to_bcd
 
-def datetime_to_bcd(dt: datetime) -> bytes:
-    """Конвертирует datetime в 6-байтовый BCD-формат"""
-    return bytes([
-        ((dt.second // 10) << 4) | (dt.second % 10),
-        ((dt.minute // 10) << 4) | (dt.minute % 10),
-        ((dt.hour // 10) << 4) | (dt.hour % 10),
-        ((dt.day // 10) << 4) | (dt.day % 10),
-        ((dt.month // 10) << 4) | (dt.month % 10),
-        ((dt.year % 100 // 10) << 4) | (dt.year % 10)
-    ])
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 def generate_test_data():
     """Генерирует тестовые данные для PLU и сообщений"""